@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ClinicBillingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic_billing'
+
+    def ready(self):
+        from . import signals  # noqa: F401
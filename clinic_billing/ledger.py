@@ -0,0 +1,108 @@
+# clinic_billing/ledger.py
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+
+from clinic_patients.models import Patient
+from .models import PatientAccount, Transaction
+from .statements import invalidate_patient_statement
+
+# Patients reconciled per grouped aggregate (and per transaction when fixing)
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def shard_ranges(shards, start_id=None, end_id=None):
+    """
+    Split the patient id range [start_id, end_id] into up to `shards`
+    contiguous (first, last) ranges for parallel reconciliation.
+    """
+    patients = Patient.objects.all()
+    if start_id is not None:
+        patients = patients.filter(pk__gte=start_id)
+    if end_id is not None:
+        patients = patients.filter(pk__lte=end_id)
+    bounds = patients.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    first, last = bounds['first'], bounds['last']
+
+    size = -(-(last - first + 1) // max(shards, 1))
+    return [(low, min(low + size - 1, last)) for low in range(first, last + 1, size)]
+
+
+def reconcile_balances(start_id=None, end_id=None, chunk_size=DEFAULT_CHUNK_SIZE, fix=False):
+    """
+    Recompute patient balances from their transactions, chunk_size patients
+    at a time (in id order, optionally limited to [start_id, end_id]).
+
+    Each chunk runs one grouped SUM over Transaction and one read of the
+    stored balances, so memory stays flat however many patients there are.
+    Yields a report per chunk with its discrepancies as
+    (patient_id, stored, expected). With fix=True the chunk's accounts are
+    locked, recomputed and corrected with bulk_update (missing accounts
+    are created) in one transaction; payments made meanwhile add to the
+    corrected balance once the lock is released.
+    """
+    patients = Patient.objects.order_by('pk')
+    if end_id is not None:
+        patients = patients.filter(pk__lte=end_id)
+
+    last_id = start_id - 1 if start_id is not None else None
+    while True:
+        chunk = patients.filter(pk__gt=last_id) if last_id is not None else patients
+        patient_ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not patient_ids:
+            return
+        last_id = patient_ids[-1]
+
+        if fix:
+            with transaction.atomic():
+                report = reconcile_chunk(patient_ids[0], patient_ids[-1], fix=True)
+        else:
+            report = reconcile_chunk(patient_ids[0], patient_ids[-1])
+        report['patients'] = len(patient_ids)
+        yield report
+
+
+def reconcile_chunk(first_id, last_id, fix=False):
+    accounts = PatientAccount.objects.filter(patient_id__gte=first_id, patient_id__lte=last_id)
+    if fix:
+        accounts = accounts.select_for_update()
+    stored = {account.patient_id: account for account in accounts.only('pk', 'patient_id', 'current_balance')}
+
+    expected = dict(
+        Transaction.objects.filter(patient_id__gte=first_id, patient_id__lte=last_id)
+        .order_by().values('patient_id').annotate(total=Sum('amount')).values_list('patient_id', 'total')
+    )
+
+    discrepancies = []
+    for patient_id in sorted(set(stored) | set(expected)):
+        account = stored.get(patient_id)
+        balance = account.current_balance if account else Decimal('0.00')
+        total = expected.get(patient_id) or Decimal('0.00')
+        if balance != total:
+            discrepancies.append((patient_id, balance if account else None, total))
+
+    report = {
+        'first_patient': first_id,
+        'last_patient': last_id,
+        'accounts': len(stored),
+        'discrepancies': discrepancies,
+        'fixed': 0,
+    }
+    if fix and discrepancies:
+        changed = []
+        created = []
+        for patient_id, _, total in discrepancies:
+            account = stored.get(patient_id)
+            if account is None:
+                created.append(PatientAccount(patient_id=patient_id, current_balance=total))
+            else:
+                account.current_balance = total
+                changed.append(account)
+            invalidate_patient_statement(patient_id)
+        PatientAccount.objects.bulk_update(changed, ['current_balance'], batch_size=500)
+        PatientAccount.objects.bulk_create(created, batch_size=500)
+        report['fixed'] = len(discrepancies)
+    return report
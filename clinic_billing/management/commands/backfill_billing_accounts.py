@@ -0,0 +1,61 @@
+# clinic_billing/management/commands/backfill_billing_accounts.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from clinic_billing.models import TreatmentCharge, Transaction, PaymentAllocation
+from clinic_treatments.models import Treatment
+
+class Command(BaseCommand):
+    help = 'Fill the account of treatment charges and transactions from their treatments and allocations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        treatment_account = Treatment.objects.filter(pk=OuterRef('treatment_id')).values('account_id')[:1]
+        charges = self.backfill(
+            TreatmentCharge,
+            lambda queryset: queryset.update(account_id=Subquery(treatment_account)),
+            options['batch_size']
+        )
+
+        # Charges carry their treatment's account; payments the account of the charges they paid
+        charge_account = TreatmentCharge.objects.filter(pk=OuterRef('treatment_charge_id')).values('account_id')[:1]
+        allocated_account = PaymentAllocation.objects.filter(
+            transaction=OuterRef('pk')
+        ).order_by('pk').values('treatment_charge__account_id')[:1]
+        transactions = self.backfill(
+            Transaction,
+            lambda queryset: (
+                queryset.filter(treatment_charge__isnull=False).update(account_id=Subquery(charge_account)) +
+                queryset.filter(treatment_charge__isnull=True).update(account_id=Subquery(allocated_account))
+            ),
+            options['batch_size']
+        )
+
+        unassigned = Transaction.objects.filter(account__isnull=True).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {charges} treatment charges and {transactions} transactions updated"
+        ))
+        if unassigned:
+            self.stdout.write(self.style.WARNING(
+                f"{unassigned} transactions have no charge or allocation to take the account from; "
+                "they are hidden from account-scoped billing until assigned"
+            ))
+
+    def backfill(self, model, update, batch_size):
+        updated = 0
+        last_id = 0
+        while True:
+            # Walk the primary key in batches to keep each transaction short
+            ids = list(model.objects.filter(
+                pk__gt=last_id
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += update(model.objects.filter(pk__in=ids))
+            last_id = ids[-1]
+        return updated
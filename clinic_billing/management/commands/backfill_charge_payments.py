@@ -0,0 +1,28 @@
+# clinic_billing/management/commands/backfill_charge_payments.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from clinic_billing.models import TreatmentCharge
+
+class Command(BaseCommand):
+    help = 'Recompute the paid amount, outstanding amount and status of treatment charges from their allocations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        updated = 0
+        last_id = 0
+        while True:
+            # Walk the primary key in batches to keep each transaction short
+            ids = list(TreatmentCharge.objects.filter(
+                pk__gt=last_id
+            ).order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += TreatmentCharge.refresh_payments(TreatmentCharge.objects.filter(pk__in=ids))
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated} treatment charges updated"))
@@ -0,0 +1,85 @@
+# clinic_billing/management/commands/reconcile_balances.py
+
+import csv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from clinic_billing.ledger import DEFAULT_CHUNK_SIZE, reconcile_balances, shard_ranges
+
+class Command(BaseCommand):
+    help = 'Recompute patient balances from their transactions and report (or fix) discrepancies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Correct the stored balances')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--start-id', type=int, help='First patient id to reconcile')
+        parser.add_argument('--end-id', type=int, help='Last patient id to reconcile')
+        parser.add_argument('--workers', type=int, default=1, help='Reconcile this many patient id shards in parallel')
+        parser.add_argument('--report', help='Write discrepancies to this CSV file')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+
+        shards = shard_ranges(options['workers'], options['start_id'], options['end_id'])
+        if not shards:
+            self.stdout.write('No patients to reconcile')
+            return
+
+        report_file = open(options['report'], 'w', newline='') if options['report'] else None
+        self.report_writer = csv.writer(report_file) if report_file else None
+        if self.report_writer:
+            self.report_writer.writerow(['patient_id', 'stored_balance', 'expected_balance', 'difference'])
+        self.output_lock = threading.Lock()
+        self.totals = {'patients': 0, 'accounts': 0, 'discrepancies': 0, 'fixed': 0}
+
+        started = time.perf_counter()
+        try:
+            if len(shards) == 1:
+                self.run_shard(shards[0], options)
+            else:
+                with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                    list(pool.map(lambda shard: self.run_shard(shard, options, close_connections=True), shards))
+        finally:
+            if report_file:
+                report_file.close()
+
+        totals = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.perf_counter() - started:.1f}s: {totals['patients']} patients, "
+            f"{totals['accounts']} accounts, {totals['discrepancies']} discrepancies, {totals['fixed']} fixed"
+        ))
+
+    def run_shard(self, shard, options, close_connections=False):
+        first_id, last_id = shard
+        try:
+            for report in reconcile_balances(
+                start_id=first_id, end_id=last_id, chunk_size=options['chunk_size'], fix=options['fix']
+            ):
+                self.record(report)
+        finally:
+            if close_connections:
+                # Worker threads open their own connections
+                connections.close_all()
+
+    def record(self, report):
+        with self.output_lock:
+            self.totals['patients'] += report['patients']
+            self.totals['accounts'] += report['accounts']
+            self.totals['discrepancies'] += len(report['discrepancies'])
+            self.totals['fixed'] += report['fixed']
+
+            for patient_id, stored, expected in report['discrepancies']:
+                difference = expected - (stored or 0)
+                if self.report_writer:
+                    self.report_writer.writerow([patient_id, '' if stored is None else stored, expected, difference])
+                else:
+                    self.stdout.write(f"Patient {patient_id}: stored {stored}, expected {expected}")
+
+            self.stdout.write(
+                f"Patients {report['first_patient']}-{report['last_patient']}: "
+                f"{len(report['discrepancies'])} discrepancies, {report['fixed']} fixed"
+            )
@@ -1,4 +1,7 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
 from django.utils import timezone
 from decimal import Decimal
 
@@ -12,29 +15,127 @@ class PatientAccount(models.Model):
     def __str__(self):
         balance_str = f"${self.current_balance}" if self.current_balance >= 0 else f"-${abs(self.current_balance)}"
         return f"Account for {self.patient}: {balance_str}"
+    
+    @classmethod
+    def add_to_balance(cls, patient_id, amount):
+        """
+        Add amount to a patient's balance in the database (UPDATE ... SET
+        current_balance = current_balance + amount), creating the account
+        on first use. Concurrent callers never overwrite each other.
+        """
+        if cls.objects.filter(patient_id=patient_id).update(current_balance=F('current_balance') + amount):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(patient_id=patient_id, current_balance=amount)
+        except IntegrityError:
+            # Another writer created the account first
+            cls.objects.filter(patient_id=patient_id).update(current_balance=F('current_balance') + amount)
 
 
 class TreatmentCharge(models.Model):
     """Financial charges associated with treatments"""
+    PAYMENT_STATUSES = [
+        ('UNPAID', 'Unpaid'),
+        ('PARTIAL', 'Partially Paid'),
+        ('PAID', 'Paid'),
+    ]
+    # Charges with money still owed
+    RECEIVABLE_STATUSES = ('UNPAID', 'PARTIAL')
+    # Maintained from PaymentAllocation writes only (see add_paid_amount)
+    PAYMENT_FIELDS = ('paid_amount', 'outstanding_amount', 'status')
+    
+    # Denormalized from treatment.account for tenant-scoped billing queries
+    account = models.ForeignKey(
+        'platform_accounts.Account', on_delete=models.CASCADE, editable=False, related_name='treatment_charges'
+    )
     treatment = models.OneToOneField('clinic_treatments.Treatment', on_delete=models.CASCADE, related_name='charge')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.CharField(max_length=255)
     date_created = models.DateTimeField(default=timezone.now)
     
+    # Sum of the charge's payment allocations and what is left to pay
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False)
+    outstanding_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False)
+    status = models.CharField(max_length=10, choices=PAYMENT_STATUSES, default='UNPAID', editable=False)
+    
+    class Meta:
+        indexes = [
+            # Receivables of an account: status__in=RECEIVABLE_STATUSES
+            models.Index(fields=['account', 'status', 'date_created'], name='charge_account_status_idx'),
+        ]
+    
+    @staticmethod
+    def payment_status(paid, amount):
+        """SQL expression for the status of a charge of `amount` with `paid` allocated."""
+        return Case(
+            When(GreaterThanOrEqual(paid, amount), then=Value('PAID')),
+            When(GreaterThan(paid, Value(Decimal('0.00'))), then=Value('PARTIAL')),
+            default=Value('UNPAID'),
+        )
+    
+    @classmethod
+    def add_paid_amount(cls, charge_id, amount):
+        """
+        Add amount (negative to remove) to a charge's paid amount in the
+        database, updating outstanding_amount and status in the same UPDATE.
+        """
+        paid = F('paid_amount') + amount
+        cls.objects.filter(pk=charge_id).update(
+            paid_amount=paid,
+            outstanding_amount=F('amount') - paid,
+            status=cls.payment_status(paid, F('amount'))
+        )
+    
+    @classmethod
+    def refresh_payments(cls, queryset=None):
+        """Recompute the payment columns of charges (all, or those in queryset) from their allocations in one UPDATE."""
+        allocated = PaymentAllocation.objects.filter(
+            treatment_charge=OuterRef('pk')
+        ).order_by().values('treatment_charge').annotate(total=Sum('amount')).values('total')
+        paid = Coalesce(
+            Subquery(allocated),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            paid_amount=paid,
+            outstanding_amount=F('amount') - paid,
+            status=cls.payment_status(paid, F('amount'))
+        )
+    
     def save(self, *args, **kwargs):
         # When a charge is created, automatically create a transaction
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        
+        # The denormalized account always matches the treatment's account
+        self.account_id = self.treatment.account_id
         if is_new:
-            Transaction.objects.create(
-                patient=self.treatment.patient,
-                amount=-self.amount,  # Negative because it's a charge
-                transaction_type='CHARGE',
-                treatment_charge=self,
-                date=timezone.now(),
-                description=f"Charge for {self.treatment.name}"
-            )
+            self.outstanding_amount = self.amount - self.paid_amount
+        elif kwargs.get('update_fields') is None:
+            # Never write back payment columns loaded before a concurrent allocation
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.PAYMENT_FIELDS
+            ]
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            if is_new:
+                Transaction.objects.create(
+                    account_id=self.account_id,
+                    patient=self.treatment.patient,
+                    amount=-self.amount,  # Negative because it's a charge
+                    transaction_type='CHARGE',
+                    treatment_charge=self,
+                    date=timezone.now(),
+                    description=f"Charge for {self.treatment.catalog_item.name}"
+                )
+            else:
+                # The amount may have changed: recompute outstanding_amount and status
+                self.add_paid_amount(self.pk, Decimal('0.00'))
+                self.refresh_from_db(fields=self.PAYMENT_FIELDS)
     
     def __str__(self):
         return f"Charge of ${self.amount} for {self.treatment}"
@@ -58,6 +159,10 @@ class Transaction(models.Model):
         ('OTHER', 'Other'),
     ]
     
+    # Clinic the movement belongs to (charges: the treatment's account; payments: where they were taken)
+    account = models.ForeignKey(
+        'platform_accounts.Account', on_delete=models.CASCADE, null=True, editable=False, related_name='transactions'
+    )
     patient = models.ForeignKey('clinic_patients.Patient', on_delete=models.CASCADE, related_name='transactions')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     # Positive amount for money coming in (payments), negative for money going out (charges, refunds)
@@ -71,16 +176,22 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     notes = models.TextField(blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'date'], name='transaction_account_date_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         # Update patient account balance when transaction is saved
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        
-        # Only update balance for new transactions to avoid double-counting on updates
-        if is_new:
-            account, created = PatientAccount.objects.get_or_create(patient=self.patient)
-            account.current_balance += self.amount
-            account.save()
+        if self.account_id is None and self.treatment_charge_id is not None:
+            self.account_id = self.treatment_charge.account_id
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Only update balance for new transactions to avoid double-counting on updates
+            if is_new:
+                PatientAccount.add_to_balance(self.patient_id, self.amount)
     
     def __str__(self):
         return f"{self.get_transaction_type_display()} - ${abs(self.amount)}"
@@ -92,11 +203,25 @@ class PaymentAllocation(models.Model):
     treatment_charge = models.ForeignKey(TreatmentCharge, on_delete=models.CASCADE, related_name='payment_allocations')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     
+    def save(self, *args, **kwargs):
+        # Keep the charge's paid amount in step, in the same transaction
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = PaymentAllocation.objects.filter(pk=self.pk).values_list(
+                    'treatment_charge_id', 'amount'
+                ).first()
+            super().save(*args, **kwargs)
+            
+            if previous:
+                TreatmentCharge.add_paid_amount(previous[0], -previous[1])
+            TreatmentCharge.add_paid_amount(self.treatment_charge_id, self.amount)
+    
     def __str__(self):
         return f"${self.amount} from {self.transaction} to {self.treatment_charge}"
 
 
-def create_payment(patient, amount, payment_method, allocations=None, description=None, notes=None):
+def create_payment(patient, amount, payment_method, allocations=None, description=None, notes=None, account=None):
     """
     Helper function to create a payment and allocate it to treatment charges
     
@@ -107,6 +232,7 @@ def create_payment(patient, amount, payment_method, allocations=None, descriptio
         allocations: Dict mapping TreatmentCharge IDs to allocation amounts
         description: Optional payment description
         notes: Optional payment notes
+        account: The Account taking the payment; allocations must be to its charges
     
     Returns:
         The created Transaction instance
@@ -117,38 +243,48 @@ def create_payment(patient, amount, payment_method, allocations=None, descriptio
     if description is None:
         description = f"Payment of ${amount}"
     
-    # Create the payment transaction
-    transaction = Transaction.objects.create(
-        patient=patient,
-        amount=amount,  # Positive for incoming payment
-        transaction_type='PAYMENT',
-        payment_method=payment_method,
-        description=description,
-        notes=notes or ""
-    )
+    # Validate every allocation before writing anything
+    allocations = {
+        int(charge_id): Decimal(str(allocation_amount))
+        for charge_id, allocation_amount in (allocations or {}).items()
+    }
+    if any(allocation_amount <= 0 for allocation_amount in allocations.values()):
+        raise ValueError("Allocation amount must be positive")
+    if sum(allocations.values(), Decimal('0.00')) > amount:
+        raise ValueError("Total allocations exceed payment amount")
     
-    # If allocations are specified, create PaymentAllocation records
-    if allocations:
-        total_allocated = Decimal('0.00')
+    with transaction.atomic():
+        treatment_charges = TreatmentCharge.objects.filter(treatment__patient=patient)
+        if account is not None:
+            treatment_charges = treatment_charges.filter(account=account)
+        # Locked so concurrent payments cannot both take a charge's outstanding amount
+        treatment_charges = treatment_charges.select_for_update(of=('self',)).in_bulk(list(allocations))
+        missing = sorted(set(allocations) - set(treatment_charges))
+        if missing:
+            raise ValueError(f"Treatment charges not found for this patient: {', '.join(map(str, missing))}")
+        overpaid = sorted(
+            charge_id for charge_id, allocation_amount in allocations.items()
+            if allocation_amount > treatment_charges[charge_id].outstanding_amount
+        )
+        if overpaid:
+            raise ValueError(f"Allocations exceed the outstanding amount of charges: {', '.join(map(str, overpaid))}")
+        
+        # Create the payment transaction
+        payment = Transaction.objects.create(
+            account=account,
+            patient=patient,
+            amount=amount,  # Positive for incoming payment
+            transaction_type='PAYMENT',
+            payment_method=payment_method,
+            description=description,
+            notes=notes or ""
+        )
         
         for charge_id, allocation_amount in allocations.items():
-            treatment_charge = TreatmentCharge.objects.get(id=charge_id)
-            allocation_amount = Decimal(str(allocation_amount))
-            
-            if allocation_amount <= 0:
-                raise ValueError("Allocation amount must be positive")
-            
-            total_allocated += allocation_amount
-            
             PaymentAllocation.objects.create(
-                transaction=transaction,
-                treatment_charge=treatment_charge,
+                transaction=payment,
+                treatment_charge=treatment_charges[charge_id],
                 amount=allocation_amount
             )
-        
-        # Verify that allocations don't exceed payment amount
-        if total_allocated > amount:
-            transaction.delete()  # Rollback the transaction
-            raise ValueError("Total allocations exceed payment amount")
     
-    return transaction
\ No newline at end of file
+    return payment
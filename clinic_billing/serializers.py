@@ -1,6 +1,7 @@
 # clinic_billing/serializers.py
 from rest_framework import serializers
 from .models import PatientAccount, TreatmentCharge, Transaction, PaymentAllocation
+from clinic_patients.models import PatientAccount as ClinicMembership
 from clinic_patients.serializers import PatientSerializer
 from clinic_treatments.serializers import TreatmentSerializer
 
@@ -24,6 +25,23 @@ class PaymentAllocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentAllocation
         fields = ('id', 'transaction', 'treatment_charge', 'amount')
+    
+    def validate(self, attrs):
+        # Partial updates validate against the stored values of unsent fields
+        charge = attrs.get('treatment_charge', getattr(self.instance, 'treatment_charge', None))
+        amount = attrs.get('amount', getattr(self.instance, 'amount', None))
+        if amount <= 0:
+            raise serializers.ValidationError({'amount': 'Allocation amount must be positive.'})
+        
+        outstanding = charge.outstanding_amount
+        if self.instance is not None and self.instance.treatment_charge_id == charge.pk:
+            # The allocation being replaced no longer counts as paid
+            outstanding += self.instance.amount
+        if amount > outstanding:
+            raise serializers.ValidationError({
+                'amount': f'Allocation exceeds the charge\'s outstanding amount ({outstanding}).'
+            })
+        return attrs
 
 class TransactionSerializer(serializers.ModelSerializer):
     patient_details = PatientSerializer(source='patient', read_only=True)
@@ -44,14 +62,22 @@ class CreatePaymentSerializer(serializers.Serializer):
     description = serializers.CharField(max_length=255, required=False)
     notes = serializers.CharField(required=False)
     
+    def validate_patient(self, value):
+        # Payments are taken by the clinic in context from its own patients
+        account = self.context.get('account')
+        if account is not None and not ClinicMembership.objects.filter(account=account, patient_id=value.patient_id).exists():
+            raise serializers.ValidationError('Patient is not registered in this clinic.')
+        return value
+    
     def create(self, validated_data):
         from .models import create_payment
         
-        patient = validated_data.pop('patient')
+        patient_account = validated_data.pop('patient')
         allocations = validated_data.pop('allocations', None)
         
         return create_payment(
-            patient=patient,
+            account=self.context.get('account'),
+            patient=patient_account.patient,
             allocations=allocations,
             **validated_data
         )
\ No newline at end of file
@@ -0,0 +1,43 @@
+# clinic_billing/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from clinic_patients.models import Patient
+from clinic_treatments.models import Treatment
+from .models import PatientAccount, TreatmentCharge, Transaction, PaymentAllocation
+from .statements import invalidate_patient_statement
+
+
+@receiver(post_save, sender=PatientAccount)
+@receiver(post_delete, sender=PatientAccount)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Treatment)
+def invalidate_statement_for_patient(sender, instance, **kwargs):
+    invalidate_patient_statement(instance.patient_id)
+
+
+@receiver(post_save, sender=Patient)
+def invalidate_statement_for_patient_record(sender, instance, **kwargs):
+    invalidate_patient_statement(instance.pk)
+
+
+@receiver(post_save, sender=TreatmentCharge)
+@receiver(post_delete, sender=TreatmentCharge)
+def invalidate_statement_for_charge(sender, instance, **kwargs):
+    patient_id = Treatment.objects.filter(pk=instance.treatment_id).values_list('patient_id', flat=True).first()
+    invalidate_patient_statement(patient_id)
+
+
+@receiver(post_delete, sender=PaymentAllocation)
+def remove_paid_amount(sender, instance, **kwargs):
+    # Runs inside the delete's transaction, including cascades from the payment
+    TreatmentCharge.add_paid_amount(instance.treatment_charge_id, -instance.amount)
+
+
+@receiver(post_save, sender=PaymentAllocation)
+@receiver(post_delete, sender=PaymentAllocation)
+def invalidate_statement_for_allocation(sender, instance, **kwargs):
+    # Allocations deleted with their payment are covered by the Transaction signal
+    patient_id = Transaction.objects.filter(pk=instance.transaction_id).values_list('patient_id', flat=True).first()
+    invalidate_patient_statement(patient_id)
@@ -0,0 +1,168 @@
+# clinic_billing/statements.py
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum
+
+from clinic_patients.models import PatientAccount as ClinicMembership
+from clinic_treatments.models import TreatmentNote
+from .models import TreatmentCharge, Transaction
+from .serializers import TransactionSerializer
+
+STATEMENT_VERSION_KEY = 'billing:statement:version:{patient_id}'
+STATEMENT_KEY = 'billing:statement:{patient_id}:{account_id}:{version}'
+
+# Transactions listed on a statement
+RECENT_TRANSACTION_LIMIT = 10
+
+
+def get_treatment_relations(prefix, account):
+    """
+    (select_related, prefetch_related) lookups for a TreatmentSerializer
+    nested at prefix. Patient clinic memberships are limited to the account.
+    """
+    memberships = ClinicMembership.objects.filter(account=account).select_related('current_medical_history')
+    select = [
+        prefix + 'patient',
+        prefix + 'catalog_item__account',
+        prefix + 'catalog_item__specialty__account',
+        prefix + 'specialty__account',
+        prefix + 'doctor',
+        prefix + 'created_by',
+        prefix + 'location__account',
+    ]
+    prefetch = [
+        prefix + 'details',
+        Prefetch(prefix + 'additional_notes', queryset=TreatmentNote.objects.select_related(
+            'created_by', 'assigned_doctor'
+        )),
+        prefix + 'schedule_history',
+        prefix + 'location__rooms',
+        prefix + 'patient__phones',
+        prefix + 'patient__emergency_contacts',
+        Prefetch(prefix + 'patient__clinic_memberships', queryset=memberships),
+    ]
+    return select, prefetch
+
+
+def get_charge_loading(queryset, account):
+    """Relations rendered by TreatmentChargeSerializer, in a fixed number of queries."""
+    select, prefetch = get_treatment_relations('treatment__', account)
+    return queryset.select_related('treatment', *select).prefetch_related(*prefetch)
+
+
+def get_transaction_loading(queryset, account):
+    """Relations rendered by TransactionSerializer, in a fixed number of queries."""
+    select, prefetch = get_treatment_relations('treatment_charge__treatment__', account)
+    return queryset.select_related(
+        'patient', 'treatment_charge', 'treatment_charge__treatment', *select
+    ).prefetch_related(
+        'allocations',
+        'patient__phones',
+        'patient__emergency_contacts',
+        Prefetch('patient__clinic_memberships', queryset=ClinicMembership.objects.filter(
+            account=account
+        ).select_related('current_medical_history')),
+        *prefetch
+    )
+
+
+def build_patient_statement(patient_id, account):
+    """
+    Balance, totals, recent transactions and unpaid charges of a patient
+    in one account, in a fixed number of queries. The balance is the sum
+    of the account's transactions, so other clinics' billing never shows.
+    """
+    transactions = Transaction.objects.filter(account=account, patient_id=patient_id)
+    totals = transactions.aggregate(
+        balance=Sum('amount'),
+        payments=Sum('amount', filter=Q(transaction_type='PAYMENT'))
+    )
+
+    charges = TreatmentCharge.objects.filter(account=account, treatment__patient_id=patient_id)
+    charges_total = charges.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
+    recent_transactions = get_transaction_loading(transactions, account).order_by('-date')[:RECENT_TRANSACTION_LIMIT]
+
+    unpaid = charges.filter(
+        status__in=TreatmentCharge.RECEIVABLE_STATUSES
+    ).select_related('treatment__catalog_item').order_by('date_created', 'pk')
+
+    return {
+        'patient_id': patient_id,
+        'current_balance': float(totals['balance'] or Decimal('0.00')),
+        'charges_total': float(charges_total),
+        'payments_total': float(totals['payments'] or Decimal('0.00')),
+        'recent_transactions': TransactionSerializer(recent_transactions, many=True).data,
+        'unpaid_charges': [
+            {
+                'id': charge.id,
+                'treatment': charge.treatment_id,
+                'treatment_name': charge.treatment.catalog_item.name,
+                'date': charge.date_created,
+                'amount': float(charge.amount),
+                'paid_amount': float(charge.paid_amount),
+                'balance': float(charge.outstanding_amount)
+            }
+            for charge in unpaid
+        ],
+    }
+
+
+def get_statement_version(patient_id):
+    """
+    Get the patient's statement version counter.
+    A missing counter is seeded with a time-based value so that an evicted
+    counter never falls back to a version used by a stale entry.
+    """
+    key = STATEMENT_VERSION_KEY.format(patient_id=patient_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_statement_version(patient_id):
+    key = STATEMENT_VERSION_KEY.format(patient_id=patient_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter was never set or got evicted
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def get_patient_statement(patient_id, account):
+    """
+    build_patient_statement through the shared cache.
+    Entries are keyed by (patient, account) and the patient's statement
+    version, which billing writes bump (see signals), so a statement built
+    from pre-commit data is never reachable afterwards; nested patient and
+    treatment details may lag by up to BILLING_STATEMENT_CACHE_TIMEOUT.
+    """
+    timeout = getattr(settings, 'BILLING_STATEMENT_CACHE_TIMEOUT', 60)
+    if not timeout:
+        return build_patient_statement(patient_id, account)
+
+    key = STATEMENT_KEY.format(
+        patient_id=patient_id, account_id=account.pk, version=get_statement_version(patient_id)
+    )
+    statement = cache.get(key)
+    if statement is None:
+        statement = build_patient_statement(patient_id, account)
+        cache.set(key, statement, timeout=timeout)
+    return statement
+
+
+def invalidate_patient_statement(patient_id):
+    """
+    Invalidate the patient's cached statements in every account.
+    The version is bumped after the current transaction commits so that
+    readers never cache pre-commit data under the new version.
+    """
+    if patient_id is None:
+        return
+    transaction.on_commit(lambda: _bump_statement_version(patient_id))
@@ -1,3 +1,441 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from platform_users.models import User
+from rest_framework.test import APIClient
+from platform_accounts.models import Account, AccountOwner, AccountUser
+from platform_accounts.roles import AccountRoles
+from clinic_catalog.models import Specialty, CatalogItem
+from clinic_locations.models import Branch
+from clinic_patients.models import Patient, PatientAccount as ClinicMembership
+from clinic_treatments.models import Treatment
+from .ledger import reconcile_balances
+from .models import PatientAccount, TreatmentCharge, Transaction, PaymentAllocation, create_payment
+from .statements import get_patient_statement
+
+
+def create_patient():
+    return Patient.objects.create(
+        id_number='300000001', first_name='Ana', last_name1='Mora',
+        birth_date='1990-01-01', gender='F', marital_status='S',
+        province='San José', canton='Central', district='Carmen', address='Address'
+    )
+
+
+def create_clinic(number=1):
+    """An account with an owner who is also its doctor, plus a catalog item and a branch."""
+    user = User.objects.create_user(
+        email=f'doctor{number}@example.com', id_number=f'10000000{number}', id_type='01', password='x'
+    )
+    account = Account.objects.create(
+        account_name=f'Clinic {number}', account_email=f'clinic{number}@example.com',
+        account_phone='22220000', account_address='Address'
+    )
+    AccountOwner.objects.create(user=user, account=account)
+    AccountUser.objects.create(user=user, account=account, role=AccountRoles.ADMINISTRATOR)
+    specialty = Specialty.objects.create(account=account, name='General', code='GEN')
+    catalog_item = CatalogItem.objects.create(
+        account=account, specialty=specialty, code='GEN-01', name='Cleaning', price=100
+    )
+    branch = Branch.objects.create(
+        account=account, name='Main', email=f'main{number}@example.com', phone='22220002',
+        province='San José', canton='Central', district='Carmen', address='Address'
+    )
+    return {'account': account, 'user': user, 'specialty': specialty, 'catalog_item': catalog_item, 'branch': branch}
+
+
+def create_charge(patient, amount, clinic=None):
+    clinic = clinic or create_clinic()
+    treatment = Treatment.objects.create(
+        account=clinic['account'], catalog_item=clinic['catalog_item'], specialty=clinic['specialty'],
+        patient=patient, doctor=clinic['user'], location=clinic['branch'], created_by=clinic['user']
+    )
+    return TreatmentCharge.objects.create(treatment=treatment, amount=amount, description='Cleaning')
+
+
+class PaymentConcurrencyTests(TransactionTestCase):
+    """Balances must stay exact when payments for one patient run in parallel."""
+
+    WORKERS = 8
+    PAYMENTS = 40
+
+    def setUp(self):
+        self.patient = create_patient()
+
+    def run_in_threads(self, calls):
+        def run(call):
+            try:
+                return call()
+            finally:
+                # Each worker thread opens its own connection
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return list(pool.map(run, calls))
+
+    def test_parallel_payments_keep_exact_balance(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory SQLite locks tables instead of waiting for concurrent writers')
+        amounts = [Decimal('10.00') + Decimal(n) / 100 for n in range(self.PAYMENTS)]
+        self.run_in_threads([
+            lambda amount=amount: create_payment(self.patient, amount, 'CASH')
+            for amount in amounts
+        ])
+
+        self.assertEqual(Transaction.objects.filter(patient=self.patient).count(), self.PAYMENTS)
+        self.assertEqual(PatientAccount.objects.get(patient=self.patient).current_balance, sum(amounts))
+
+    def test_sequential_payments_and_charge_balance(self):
+        charge = create_charge(self.patient, Decimal('100.00'))
+        create_payment(self.patient, Decimal('60.00'), 'CASH', allocations={str(charge.pk): '60.00'})
+        create_payment(self.patient, Decimal('15.50'), 'CARD')
+
+        account = PatientAccount.objects.get(patient=self.patient)
+        self.assertEqual(account.current_balance, Decimal('-24.50'))
+        self.assertEqual(PaymentAllocation.objects.get().amount, Decimal('60.00'))
+
+    def test_add_to_balance_updates_in_the_database(self):
+        PatientAccount.add_to_balance(self.patient.pk, Decimal('10.00'))
+
+        # One UPDATE adding to the stored column; the balance is never read back
+        with CaptureQueriesContext(connection) as queries:
+            PatientAccount.add_to_balance(self.patient.pk, Decimal('5.25'))
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertIn('"clinic_billing_patientaccount"."current_balance" +', sql)
+        self.assertEqual(PatientAccount.objects.get(patient=self.patient).current_balance, Decimal('15.25'))
+
+    def test_add_to_balance_survives_a_create_race(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory SQLite locks tables instead of waiting for concurrent writers')
+        self.assertFalse(PatientAccount.objects.filter(patient=self.patient).exists())
+        create = PatientAccount.objects.create
+
+        def racing_create(**fields):
+            # Another writer commits the account between the UPDATE and this INSERT
+            self.run_in_threads([lambda: create(patient=self.patient, current_balance=Decimal('7.00'))])
+            return create(**fields)
+
+        with mock.patch.object(PatientAccount.objects, 'create', side_effect=racing_create) as create_call:
+            PatientAccount.add_to_balance(self.patient.pk, Decimal('5.00'))
+        create_call.assert_called_once()
+        self.assertEqual(PatientAccount.objects.get(patient=self.patient).current_balance, Decimal('12.00'))
+
+    def test_invalid_allocations_write_nothing(self):
+        charge = create_charge(self.patient, Decimal('100.00'))
+        invalid = [
+            {str(charge.pk): '80.00', '999999': '10.00'},
+            {str(charge.pk): '60.00'},
+            {str(charge.pk): '-5.00'},
+        ]
+        for allocations in invalid:
+            with self.subTest(allocations=allocations):
+                with self.assertRaises(ValueError):
+                    create_payment(self.patient, Decimal('50.00'), 'CASH', allocations=allocations)
+
+        self.assertFalse(Transaction.objects.filter(transaction_type='PAYMENT').exists())
+        self.assertFalse(PaymentAllocation.objects.exists())
+        self.assertEqual(PatientAccount.objects.get(patient=self.patient).current_balance, Decimal('-100.00'))
+
+
+class ChargePaymentStatusTests(TestCase):
+    """paid_amount, outstanding_amount and status follow the charge's allocations."""
+
+    def setUp(self):
+        self.patient = create_patient()
+        self.charge = create_charge(self.patient, Decimal('100.00'))
+
+    def assertCharge(self, paid, outstanding, status):
+        self.charge.refresh_from_db()
+        self.assertEqual(
+            (self.charge.paid_amount, self.charge.outstanding_amount, self.charge.status),
+            (Decimal(paid), Decimal(outstanding), status)
+        )
+
+    def test_new_charge_is_unpaid(self):
+        self.assertCharge('0.00', '100.00', 'UNPAID')
+
+    def test_allocations_update_status(self):
+        first = create_payment(self.patient, Decimal('40.00'), 'CASH', allocations={self.charge.pk: '40.00'})
+        self.assertCharge('40.00', '60.00', 'PARTIAL')
+
+        create_payment(self.patient, Decimal('60.00'), 'CASH', allocations={self.charge.pk: '60.00'})
+        self.assertCharge('100.00', '0.00', 'PAID')
+
+        # Deleting a payment cascades to its allocations
+        first.delete()
+        self.assertCharge('60.00', '40.00', 'PARTIAL')
+
+    def test_amount_change_recomputes_outstanding(self):
+        create_payment(self.patient, Decimal('40.00'), 'CASH', allocations={self.charge.pk: '40.00'})
+        charge = TreatmentCharge.objects.get(pk=self.charge.pk)
+        charge.paid_amount = Decimal('0.00')  # stale in-memory value is not written back
+        charge.amount = Decimal('40.00')
+        charge.save()
+        self.assertCharge('40.00', '0.00', 'PAID')
+
+    def test_allocations_cannot_exceed_outstanding(self):
+        create_payment(self.patient, Decimal('70.00'), 'CASH', allocations={self.charge.pk: '70.00'})
+        with self.assertRaises(ValueError):
+            create_payment(self.patient, Decimal('40.00'), 'CASH', allocations={self.charge.pk: '30.01'})
+        self.assertEqual(Transaction.objects.filter(transaction_type='PAYMENT').count(), 1)
+        self.assertCharge('70.00', '30.00', 'PARTIAL')
+
+    def test_refresh_payments_matches_maintained_columns(self):
+        create_payment(self.patient, Decimal('25.00'), 'CASH', allocations={self.charge.pk: '25.00'})
+        TreatmentCharge.objects.update(paid_amount=0, outstanding_amount=0, status='UNPAID')
+        TreatmentCharge.refresh_payments()
+        self.assertCharge('25.00', '75.00', 'PARTIAL')
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class BillingAccountScopeTests(TestCase):
+    """Billing endpoints only read and write rows of the active account."""
+
+    def setUp(self):
+        self.patient = create_patient()
+        self.clinics = [create_clinic(1), create_clinic(2)]
+        for clinic in self.clinics:
+            ClinicMembership.objects.create(patient=self.patient, account=clinic['account'])
+        self.charges = [create_charge(self.patient, Decimal('100.00'), clinic) for clinic in self.clinics]
+        create_payment(
+            self.patient, Decimal('30.00'), 'CASH',
+            allocations={self.charges[1].pk: '30.00'}, account=self.clinics[1]['account']
+        )
+
+    def get(self, path, params=None, clinic=0):
+        client = APIClient()
+        client.force_authenticate(user=self.clinics[clinic]['user'])
+        return client.get(
+            path, params or {}, HTTP_X_ACCOUNT_CONTEXT=str(self.clinics[clinic]['account'].account_id)
+        )
+
+    def test_rows_are_scoped_to_the_account(self):
+        transactions = self.get('/api/clinic/billing/transactions/').data['results']
+        self.assertEqual([row['amount'] for row in transactions], ['-100.00'])
+
+        charges = self.get('/api/clinic/billing/charges/', clinic=1).data['results']
+        self.assertEqual([row['id'] for row in charges], [self.charges[1].pk])
+        self.assertEqual(self.get('/api/clinic/billing/allocations/').data['results'], [])
+        allocations = self.get('/api/clinic/billing/allocations/', clinic=1).data['results']
+        self.assertEqual([row['treatment_charge'] for row in allocations], [self.charges[1].pk])
+
+    def patch(self, path, data, clinic=0):
+        client = APIClient()
+        client.force_authenticate(user=self.clinics[clinic]['user'])
+        return client.patch(
+            path, data, format='json', HTTP_X_ACCOUNT_CONTEXT=str(self.clinics[clinic]['account'].account_id)
+        )
+
+    def test_partial_updates_keep_unsent_fields(self):
+        payment = Transaction.objects.get(transaction_type='PAYMENT')
+        allocation = PaymentAllocation.objects.get()
+        billing_account = PatientAccount.objects.get(patient=self.patient)
+        updates = [
+            (f'/api/clinic/billing/transactions/{payment.pk}/', {'description': 'Cash payment'}),
+            (f'/api/clinic/billing/charges/{self.charges[1].pk}/', {'description': 'Deep cleaning'}),
+            (f'/api/clinic/billing/accounts/{billing_account.pk}/', {}),
+            (f'/api/clinic/billing/allocations/{allocation.pk}/', {'amount': '20.00'}),
+        ]
+        for path, data in updates:
+            with self.subTest(path=path):
+                self.assertEqual(self.patch(path, data, clinic=1).status_code, 200)
+
+        self.charges[1].refresh_from_db()
+        self.assertEqual(self.charges[1].description, 'Deep cleaning')
+        self.assertEqual(self.charges[1].paid_amount, Decimal('20.00'))
+
+    def test_partial_updates_cannot_point_at_another_clinic(self):
+        payment = Transaction.objects.get(transaction_type='PAYMENT')
+        response = self.patch(
+            f'/api/clinic/billing/transactions/{payment.pk}/', {'treatment_charge': self.charges[0].pk}, clinic=1
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('treatment_charge', response.data)
+
+        allocation = PaymentAllocation.objects.get()
+        response = self.patch(
+            f'/api/clinic/billing/allocations/{allocation.pk}/', {'treatment_charge': self.charges[0].pk}, clinic=1
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_allocation_writes_cannot_exceed_outstanding(self):
+        allocation = PaymentAllocation.objects.get()
+        payment = allocation.transaction
+        # The charge owes 70.00 beside this allocation's 30.00
+        self.assertEqual(self.patch(
+            f'/api/clinic/billing/allocations/{allocation.pk}/', {'amount': '100.00'}, clinic=1
+        ).status_code, 200)
+        response = self.patch(f'/api/clinic/billing/allocations/{allocation.pk}/', {'amount': '100.01'}, clinic=1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', response.data)
+
+        client = APIClient()
+        client.force_authenticate(user=self.clinics[1]['user'])
+        response = client.post('/api/clinic/billing/allocations/', {
+            'transaction': payment.pk, 'treatment_charge': self.charges[1].pk, 'amount': '0.01'
+        }, format='json', HTTP_X_ACCOUNT_CONTEXT=str(self.clinics[1]['account'].account_id))
+        self.assertEqual(response.status_code, 400)
+
+        self.charges[1].refresh_from_db()
+        self.assertEqual((self.charges[1].paid_amount, self.charges[1].status), (Decimal('100.00'), 'PAID'))
+
+    def test_statement_uses_the_account_ledger(self):
+        response = self.get('/api/clinic/billing/transactions/patient_statement/', {'patient_id': self.patient.pk}, clinic=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_balance'], -70.0)
+        self.assertEqual(response.data['payments_total'], 30.0)
+        self.assertEqual([charge['id'] for charge in response.data['unpaid_charges']], [self.charges[1].pk])
+
+    def test_other_accounts_charges_cannot_be_allocated(self):
+        with self.assertRaises(ValueError):
+            create_payment(
+                self.patient, Decimal('10.00'), 'CASH',
+                allocations={self.charges[1].pk: '10.00'}, account=self.clinics[0]['account']
+            )
+
+
+class ReconcileBalancesTests(TransactionTestCase):
+    """Balances are recomputed from the transaction ledger, in chunks and shards alike."""
+
+    def setUp(self):
+        self.expected = {}
+        for n in range(10):
+            patient = Patient.objects.create(
+                id_number=f'30000010{n}', first_name='Ana', last_name1='Mora',
+                birth_date='1990-01-01', gender='F', marital_status='S',
+                province='San José', canton='Central', district='Carmen', address='Address'
+            )
+            for amount in (Decimal('-100.00'), Decimal(n) * 10):
+                Transaction.objects.create(
+                    patient=patient, amount=amount, transaction_type='ADJUSTMENT', description='Adjustment'
+                )
+            self.expected[patient.pk] = Decimal(n) * 10 - 100
+        self.patient_ids = sorted(self.expected)
+
+        # Drift on two accounts and one account missing altogether
+        self.drifted = self.patient_ids[2], self.patient_ids[7]
+        PatientAccount.objects.filter(patient_id__in=self.drifted).update(current_balance=Decimal('5.00'))
+        self.missing = self.patient_ids[4]
+        PatientAccount.objects.filter(patient_id=self.missing).delete()
+
+    def balances(self):
+        return dict(PatientAccount.objects.values_list('patient_id', 'current_balance'))
+
+    def reconcile(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.csv')
+            call_command('reconcile_balances', '--chunk-size', '3', '--report', path, *args, stdout=io.StringIO())
+            with open(path, newline='') as report:
+                # Shards finish in any order; skip the header row
+                return sorted(tuple(row) for row in list(csv.reader(report))[1:])
+
+    def test_dry_run_reports_and_fix_corrects(self):
+        before = self.balances()
+        rows = self.reconcile()
+        self.assertEqual([int(row[0]) for row in rows], sorted([*self.drifted, self.missing]))
+        self.assertEqual(self.balances(), before)
+
+        self.assertEqual(self.reconcile('--fix'), rows)
+        self.assertEqual(self.balances(), self.expected)
+        self.assertEqual(self.reconcile(), [])
+
+    def test_missing_account_is_created(self):
+        report = [*reconcile_balances(fix=True)]
+        self.assertEqual(sum(chunk['fixed'] for chunk in report), 3)
+        self.assertEqual(PatientAccount.objects.get(patient_id=self.missing).current_balance, self.expected[self.missing])
+
+    def test_correct_balances_are_left_untouched(self):
+        list(reconcile_balances(fix=True))
+        with CaptureQueriesContext(connection) as queries:
+            report = list(reconcile_balances(chunk_size=4, fix=True))
+        self.assertEqual(sum(len(chunk['discrepancies']) for chunk in report), 0)
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))])
+
+    def test_sharded_run_matches_single_run(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory SQLite locks tables instead of waiting for concurrent writers')
+        self.assertEqual(self.reconcile('--workers', '3'), self.reconcile())
+
+    def test_sharded_fix(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest('SQLite fails concurrent transactions that read before writing instead of waiting')
+        self.reconcile('--workers', '3', '--fix')
+        self.assertEqual(self.balances(), self.expected)
+
+
+@override_settings(BILLING_STATEMENT_CACHE_TIMEOUT=300)
+class PatientStatementCacheTests(TestCase):
+    """Cached statements are shared per (patient, account) and dropped by billing writes."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.patient = create_patient()
+        self.clinics = [create_clinic(1), create_clinic(2)]
+        self.charges = [create_charge(self.patient, Decimal('100.00'), clinic) for clinic in self.clinics]
+
+    def statement(self, clinic=0):
+        return get_patient_statement(self.patient.pk, self.clinics[clinic]['account'])
+
+    def change(self, update):
+        # Statement versions are bumped once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return update()
+
+    def test_statements_are_cached_per_account(self):
+        first = self.statement()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.statement(), first)
+
+        other = self.statement(1)
+        self.assertEqual([charge['id'] for charge in other['unpaid_charges']], [self.charges[1].pk])
+        self.assertEqual([charge['id'] for charge in self.statement()['unpaid_charges']], [self.charges[0].pk])
+
+    def test_transaction_writes_invalidate(self):
+        self.assertEqual(self.statement()['payments_total'], 0)
+        self.statement(1)
+
+        self.change(lambda: create_payment(
+            self.patient, Decimal('30.00'), 'CASH', account=self.clinics[0]['account']
+        ))
+        self.assertEqual(self.statement()['payments_total'], 30)
+        # Every account's statement is invalidated, not just the writer's
+        with CaptureQueriesContext(connection) as queries:
+            self.statement(1)
+        self.assertTrue(queries)
+
+    def test_allocation_writes_invalidate(self):
+        account = self.clinics[0]['account']
+        payment = self.change(lambda: create_payment(self.patient, Decimal('50.00'), 'CASH', account=account))
+        self.assertEqual(self.statement()['unpaid_charges'][0]['paid_amount'], 0)
+
+        allocation = self.change(lambda: PaymentAllocation.objects.create(
+            transaction=payment, treatment_charge=self.charges[0], amount=Decimal('20.00')
+        ))
+        self.assertEqual(self.statement()['unpaid_charges'][0]['paid_amount'], 20)
+
+        self.change(allocation.delete)
+        self.assertEqual(self.statement()['unpaid_charges'][0]['paid_amount'], 0)
+
+    def test_uncommitted_writes_do_not_invalidate(self):
+        self.statement()
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_payment(self.patient, Decimal('30.00'), 'CASH', account=self.clinics[0]['account'])
+            # Until the write commits the cached statement is still served
+            self.assertEqual(self.statement()['payments_total'], 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.statement()['payments_total'], 30)
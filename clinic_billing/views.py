@@ -1,46 +1,148 @@
 # clinic_billing/views.py
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum
-from decimal import Decimal
-from .models import PatientAccount, TreatmentCharge, Transaction, PaymentAllocation, create_payment
+from clinic_patients.models import PatientAccount as ClinicMembership
+from core.permissions import AccountPermissionMixin
+from .models import PatientAccount, TreatmentCharge, Transaction, PaymentAllocation
+from .statements import get_charge_loading, get_patient_statement, get_transaction_loading
 from .serializers import (
     PatientAccountSerializer, TreatmentChargeSerializer, 
     TransactionSerializer, PaymentAllocationSerializer,
     CreatePaymentSerializer
 )
 
-class PatientAccountViewSet(viewsets.ModelViewSet):
+class BillingViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
+    """
+    Billing rows of the active account only (X-Account-Context).
+    Lists need view_billing_list, retrieve needs view_billing_detail and
+    writes need manage_billing; the account and the user's permissions
+    are resolved once per request (see core.account_context).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # Lookup from the model to the account owning the row
+    account_field = 'account'
+    
+    def get_account_queryset(self, account):
+        """The model's rows belonging to account."""
+        return self.queryset.filter(**{self.account_field: account})
+    
+    def get_queryset(self):
+        account = self.get_account_context()
+        if not account:
+            return self.queryset.none()
+        
+        permission = 'view_billing_detail' if self.action == 'retrieve' else 'view_billing_list'
+        if not self.check_permission(permission, account):
+            return self.queryset.none()
+        
+        return self.get_account_queryset(account)
+    
+    def create(self, request, *args, **kwargs):
+        permission_error = self.require_permission('manage_billing', self.get_account_context())
+        if permission_error:
+            return permission_error
+        return super().create(request, *args, **kwargs)
+    
+    def update(self, request, *args, **kwargs):
+        permission_error = self.require_permission('manage_billing', self.get_account_context())
+        if permission_error:
+            return permission_error
+        return super().update(request, *args, **kwargs)
+    
+    def destroy(self, request, *args, **kwargs):
+        permission_error = self.require_permission('manage_billing', self.get_account_context())
+        if permission_error:
+            return permission_error
+        return super().destroy(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        self.check_account_rows(serializer, self.get_account_context())
+        serializer.save()
+    
+    def perform_update(self, serializer):
+        self.check_account_rows(serializer, self.get_account_context())
+        serializer.save()
+    
+    def check_account_rows(self, serializer, account):
+        """Raise ValidationError when the write would point at another clinic's rows."""
+    
+    def get_written_value(self, serializer, field):
+        """The field's value after the write: the submitted one, else the instance's (partial updates)."""
+        if field in serializer.validated_data:
+            return serializer.validated_data[field]
+        return getattr(serializer.instance, field, None)
+    
+    def is_account_patient(self, patient, account):
+        return ClinicMembership.objects.filter(account=account, patient=patient).exists()
+
+class PatientAccountViewSet(BillingViewSet):
     queryset = PatientAccount.objects.all()
     serializer_class = PatientAccountSerializer
-    permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['patient']
     search_fields = ['patient__first_name', 'patient__last_name1', 'patient__id_number']
+    
+    def get_account_queryset(self, account):
+        # Balances of the clinic's patients
+        return PatientAccount.objects.filter(Exists(ClinicMembership.objects.filter(
+            account=account,
+            patient=OuterRef('patient')
+        ))).select_related('patient')
+    
+    def check_account_rows(self, serializer, account):
+        if not self.is_account_patient(self.get_written_value(serializer, 'patient'), account):
+            raise ValidationError({'patient': 'Patient is not registered in this clinic.'})
 
-class TreatmentChargeViewSet(viewsets.ModelViewSet):
+class TreatmentChargeViewSet(BillingViewSet):
     queryset = TreatmentCharge.objects.all()
     serializer_class = TreatmentChargeSerializer
-    permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['treatment', 'treatment__patient']
+    filterset_fields = ['treatment', 'treatment__patient', 'status']
     search_fields = ['description', 'treatment__patient__first_name', 'treatment__patient__last_name1']
-    ordering_fields = ['date_created', 'amount']
+    ordering_fields = ['date_created', 'amount', 'outstanding_amount']
+    
+    def get_account_queryset(self, account):
+        return get_charge_loading(super().get_account_queryset(account), account)
+    
+    def check_account_rows(self, serializer, account):
+        if self.get_written_value(serializer, 'treatment').account_id != account.pk:
+            raise ValidationError({'treatment': 'Treatment belongs to another clinic.'})
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(BillingViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
-    permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['patient', 'transaction_type', 'payment_method', 'date']
     search_fields = ['description', 'notes', 'patient__first_name', 'patient__last_name1']
     ordering_fields = ['date', 'amount']
     
+    def get_account_queryset(self, account):
+        return get_transaction_loading(super().get_account_queryset(account), account)
+    
+    def check_account_rows(self, serializer, account):
+        if not self.is_account_patient(self.get_written_value(serializer, 'patient'), account):
+            raise ValidationError({'patient': 'Patient is not registered in this clinic.'})
+        charge = self.get_written_value(serializer, 'treatment_charge')
+        if charge is not None and charge.account_id != account.pk:
+            raise ValidationError({'treatment_charge': 'Charge belongs to another clinic.'})
+    
+    def perform_create(self, serializer):
+        account = self.get_account_context()
+        self.check_account_rows(serializer, account)
+        serializer.save(account=account)
+    
     @action(detail=False, methods=['post'])
     def create_payment(self, request):
-        serializer = CreatePaymentSerializer(data=request.data)
+        account = self.get_account_context()
+        permission_error = self.require_permission('manage_billing', account)
+        if permission_error:
+            return permission_error
+        
+        serializer = CreatePaymentSerializer(data=request.data, context={'account': account})
         if serializer.is_valid():
             try:
                 transaction = serializer.save()
@@ -52,63 +154,33 @@ class TransactionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def patient_statement(self, request):
+        account = self.get_account_context()
+        permission_error = self.require_permission('view_billing_detail', account)
+        if permission_error:
+            return permission_error
+        
         patient_id = request.query_params.get('patient_id', None)
         if not patient_id:
             return Response({'error': 'patient_id is required'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        # Get account balance
         try:
-            account = PatientAccount.objects.get(patient_id=patient_id)
-            balance = account.current_balance
-        except PatientAccount.DoesNotExist:
-            balance = Decimal('0.00')
-        
-        # Get all charges
-        charges = TreatmentCharge.objects.filter(treatment__patient_id=patient_id)
-        charges_total = charges.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        # Get all payments
-        payments = Transaction.objects.filter(
-            patient_id=patient_id, 
-            transaction_type='PAYMENT'
-        )
-        payments_total = payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+            patient_id = int(patient_id)
+        except ValueError:
+            return Response({'error': 'patient_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not self.is_account_patient(patient_id, account):
+            return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Get recent transactions
-        recent_transactions = Transaction.objects.filter(
-            patient_id=patient_id
-        ).order_by('-date')[:10]
-        
-        # Unpaid charges
-        unpaid_charges = []
-        for charge in charges:
-            paid_amount = PaymentAllocation.objects.filter(
-                treatment_charge=charge
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-            
-            if paid_amount < charge.amount:
-                unpaid_charges.append({
-                    'id': charge.id,
-                    'treatment': charge.treatment.id,
-                    'treatment_name': charge.treatment.catalog_item.name,
-                    'date': charge.date_created,
-                    'amount': float(charge.amount),
-                    'paid_amount': float(paid_amount),
-                    'balance': float(charge.amount - paid_amount)
-                })
-        
-        return Response({
-            'patient_id': patient_id,
-            'current_balance': float(balance),
-            'charges_total': float(charges_total),
-            'payments_total': float(payments_total),
-            'recent_transactions': TransactionSerializer(recent_transactions, many=True).data,
-            'unpaid_charges': unpaid_charges
-        })
+        # Cached per patient and account; a fixed number of queries when rebuilt
+        return Response(get_patient_statement(patient_id, account))
 
-class PaymentAllocationViewSet(viewsets.ModelViewSet):
+class PaymentAllocationViewSet(BillingViewSet):
     queryset = PaymentAllocation.objects.all()
     serializer_class = PaymentAllocationSerializer
-    permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['transaction', 'treatment_charge']
\ No newline at end of file
+    filterset_fields = ['transaction', 'treatment_charge']
+    account_field = 'transaction__account'
+    
+    def check_account_rows(self, serializer, account):
+        if self.get_written_value(serializer, 'transaction').account_id != account.pk:
+            raise ValidationError({'transaction': 'Payment belongs to another clinic.'})
+        if self.get_written_value(serializer, 'treatment_charge').account_id != account.pk:
+            raise ValidationError({'treatment_charge': 'Charge belongs to another clinic.'})
@@ -5,6 +5,9 @@ from platform_accounts.models import Account, AccountUser
 from core.permissions import AccountPermissionMixin
 from .models import Specialty, CatalogItem
 from .serializers import SpecialtySerializer, CatalogItemSerializer
+from core.tracing import get_tracer
+
+tracer = get_tracer(__name__)
 
 class SpecialtyViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
     queryset = Specialty.objects.all()
@@ -19,19 +22,11 @@ class SpecialtyViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
         # Get account context
         account = self.get_account_context()
         
-        # DEBUG: Print account context
-        account_header = self.request.headers.get('X-Account-Context')
-        print(f"DEBUG: X-Account-Context header = {account_header}")
-        print(f"DEBUG: Resolved account = {account}")
-        if account:
-            print(f"DEBUG: Account name = {account.account_name}")
-        
         if not account:
             # No account context - show specialties from all user's accounts
             if self.request.user.is_superuser:
                 return Specialty.objects.all()
             else:
-                print("DEBUG: No account context - showing all specialties user has access to")
                 user_accounts = AccountUser.objects.filter(
                     user=self.request.user,
                     is_active_in_account=True
@@ -44,7 +39,7 @@ class SpecialtyViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
         
         # Filter by account if we have one
         queryset = Specialty.objects.filter(account=account)
-        print(f"DEBUG: Filtered specialties count = {queryset.count()}")
+        tracer.trace('specialties.queryset', count=queryset.count)
         return queryset
     
     def create(self, request, *args, **kwargs):
@@ -90,19 +85,11 @@ class CatalogItemViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
         # Get account context
         account = self.get_account_context()
         
-        # DEBUG: Print account context
-        account_header = self.request.headers.get('X-Account-Context')
-        print(f"DEBUG: X-Account-Context header = {account_header}")
-        print(f"DEBUG: Resolved account = {account}")
-        if account:
-            print(f"DEBUG: Account name = {account.account_name}")
-        
         if not account:
             # No account context - show catalog items from all user's accounts
             if self.request.user.is_superuser:
                 return CatalogItem.objects.all()
             else:
-                print("DEBUG: No account context - showing all catalog items user has access to")
                 user_accounts = AccountUser.objects.filter(
                     user=self.request.user,
                     is_active_in_account=True
@@ -115,7 +102,7 @@ class CatalogItemViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
         
         # Filter catalog items by account
         queryset = CatalogItem.objects.filter(account=account)
-        print(f"DEBUG: Filtered catalog items count = {queryset.count()}")
+        tracer.trace('catalog_items.queryset', count=queryset.count)
         return queryset
     
     def create(self, request, *args, **kwargs):
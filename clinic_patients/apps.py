@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ClinicPatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic_patients'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from .search import create_search_indexes
+        post_migrate.connect(create_search_indexes, sender=self)
+        from . import signals  # noqa: F401
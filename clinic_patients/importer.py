@@ -0,0 +1,261 @@
+# clinic_patients/importer.py
+import csv
+import datetime
+import io
+import time
+
+from django.db import IntegrityError, transaction
+
+from .lookup_index import registry as lookup_registry
+from .models import Patient, PatientPhone, EmergencyContact, PatientAccount
+from .serializers import PatientCreateSerializer
+
+# Rows validated and written per transaction
+DEFAULT_CHUNK_SIZE = 500
+
+# First data row (row 1 is the header), matching spreadsheet row numbers
+FIRST_ROW = 2
+
+PATIENT_COLUMNS = (
+    'id_number', 'is_foreign', 'first_name', 'last_name1', 'last_name2', 'birth_date',
+    'gender', 'marital_status', 'email', 'province', 'canton', 'district', 'address',
+)
+CLINIC_COLUMNS = ('referral_source', 'consultation_reason', 'receive_notifications')
+
+# phone_1, phone_1_type ... phone_3, phone_3_type
+PHONE_SLOTS = 3
+
+# emergency_contact_first_name, emergency_contact_phone, ...
+CONTACT_PREFIX = 'emergency_contact_'
+CONTACT_COLUMNS = ('first_name', 'last_name1', 'last_name2', 'phone', 'relationship')
+
+
+class PatientImportSerializer(PatientCreateSerializer):
+    """
+    PatientCreateSerializer rules without database lookups: the account
+    is fixed by the import and id_number duplicates are resolved in bulk.
+    """
+    account = None
+
+    class Meta(PatientCreateSerializer.Meta):
+        extra_kwargs = {'id_number': {'validators': []}}
+
+
+def normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def normalize_cell(value):
+    """Spreadsheet cells to the strings the serializer expects."""
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # Id numbers typed as numbers come back as floats
+        return str(int(value))
+    return str(value).strip()
+
+
+def read_csv(file):
+    """Yield (row number, {column: value}) from a binary or text CSV file."""
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.reader(file)
+    header = [normalize_header(column) for column in next(reader, [])]
+    for row_number, values in enumerate(reader, start=FIRST_ROW):
+        if any(value.strip() for value in values):
+            yield row_number, dict(zip(header, (value.strip() for value in values)))
+
+
+def read_xlsx(file):
+    """Yield (row number, {column: value}) from the first sheet of an XLSX file."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import requires openpyxl')
+
+    # read_only streams rows instead of loading the whole sheet
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [normalize_header(column) for column in next(rows, ())]
+        for row_number, values in enumerate(rows, start=FIRST_ROW):
+            values = [normalize_cell(value) for value in values]
+            if any(values):
+                yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(file, file_format):
+    if file_format == 'csv':
+        return read_csv(file)
+    if file_format == 'xlsx':
+        return read_xlsx(file)
+    raise ValueError(f'Unsupported import format: {file_format}')
+
+
+def build_payload(row):
+    """Map a flat import row to PatientCreateSerializer input. Empty cells are omitted."""
+    payload = {column: row[column] for column in PATIENT_COLUMNS + CLINIC_COLUMNS if row.get(column)}
+
+    phones = []
+    for slot in range(1, PHONE_SLOTS + 1):
+        if row.get(f'phone_{slot}'):
+            phone = {'phone_number': row[f'phone_{slot}']}
+            if row.get(f'phone_{slot}_type'):
+                phone['phone_type'] = row[f'phone_{slot}_type']
+            phones.append(phone)
+    if phones:
+        payload['phones'] = phones
+
+    contact = {
+        column: row[CONTACT_PREFIX + column]
+        for column in CONTACT_COLUMNS if row.get(CONTACT_PREFIX + column)
+    }
+    if contact:
+        payload['emergency_contacts'] = [contact]
+
+    return payload
+
+
+class PatientImporter:
+    """
+    Streams import rows into an account in chunks.
+
+    Each chunk is validated with the serializer rules, deduplicated on
+    id_number (patients that already exist are linked to the clinic
+    instead of duplicated) and written with bulk_create in one
+    transaction. run() yields a report per committed chunk, so a caller
+    can checkpoint the last row and resume from the next one: rows
+    already imported are skipped by the dedupe anyway.
+    """
+
+    def __init__(self, account, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.account = account
+        self.chunk_size = chunk_size
+
+    def run(self, rows, start_row=FIRST_ROW):
+        chunk = []
+        for row_number, row in rows:
+            if row_number < start_row:
+                continue
+            chunk.append((row_number, row))
+            if len(chunk) >= self.chunk_size:
+                yield self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield self.import_chunk(chunk)
+
+    def import_chunk(self, chunk):
+        started = time.perf_counter()
+        report = {
+            'first_row': chunk[0][0],
+            'last_row': chunk[-1][0],
+            'rows': len(chunk),
+            'created': 0,
+            'linked': 0,
+            'skipped': 0,
+            'errors': [],
+        }
+
+        valid = {}
+        for row_number, row in chunk:
+            serializer = PatientImportSerializer(data=build_payload(row))
+            if not serializer.is_valid():
+                report['errors'].append({'row': row_number, 'errors': serializer.errors})
+                continue
+            id_number = serializer.validated_data['id_number']
+            if id_number in valid:
+                report['errors'].append({
+                    'row': row_number,
+                    'errors': {'id_number': [f'Duplicate of row {valid[id_number][0]} in this file.']}
+                })
+                continue
+            valid[id_number] = (row_number, serializer.validated_data)
+
+        try:
+            self.write_chunk(valid, report)
+        except IntegrityError:
+            # Another writer created one of these id numbers meanwhile: dedupe again
+            report.update(created=0, linked=0, skipped=0)
+            self.write_chunk(valid, report)
+
+        report['failed'] = len(report['errors'])
+        report['seconds'] = time.perf_counter() - started
+        return report
+
+    def write_chunk(self, valid, report):
+        with transaction.atomic():
+            existing = dict(Patient.objects.filter(id_number__in=list(valid)).values_list('id_number', 'id'))
+            members = set(PatientAccount.objects.filter(
+                account=self.account,
+                patient_id__in=list(existing.values())
+            ).values_list('patient_id', flat=True))
+
+            new_patients = []
+            nested = []
+            memberships = []
+            for id_number, (row_number, data) in valid.items():
+                data = dict(data)
+                phones = data.pop('phones', [])
+                contacts = data.pop('emergency_contacts', [])
+                clinic_fields = {
+                    'referral_source': data.pop('referral_source', ''),
+                    'consultation_reason': data.pop('consultation_reason', ''),
+                    'receive_notifications': data.pop('receive_notifications', False),
+                }
+
+                patient_id = existing.get(id_number)
+                if patient_id is None:
+                    patient = Patient(**data)
+                    # bulk_create skips Patient.save
+                    patient.search_key = patient.build_search_key()
+                    new_patients.append(patient)
+                    nested.append((patient, phones, contacts, clinic_fields))
+                elif patient_id in members:
+                    report['skipped'] += 1
+                else:
+                    # Shared patient record: link it, keep its personal data
+                    memberships.append(PatientAccount(patient_id=patient_id, account=self.account, **clinic_fields))
+                    report['linked'] += 1
+
+            Patient.objects.bulk_create(new_patients)
+            PatientPhone.objects.bulk_create([
+                PatientPhone(patient=patient, **phone)
+                for patient, phones, _, _ in nested
+                for phone in phones
+            ])
+            EmergencyContact.objects.bulk_create([
+                EmergencyContact(patient=patient, **contact)
+                for patient, _, contacts, _ in nested
+                for contact in contacts
+            ])
+            PatientAccount.objects.bulk_create(memberships + [
+                PatientAccount(patient=patient, account=self.account, **clinic_fields)
+                for patient, _, _, clinic_fields in nested
+            ])
+            report['created'] = len(new_patients)
+
+            if new_patients or memberships:
+                # bulk_create skips the signals keeping lookup indexes current
+                account_id = self.account.pk
+                transaction.on_commit(lambda: lookup_registry.discard(account_id))
+
+
+def summarize_reports(reports, error_limit=None):
+    """Totals and throughput over chunk reports (errors capped at error_limit)."""
+    summary = {'rows': 0, 'created': 0, 'linked': 0, 'skipped': 0, 'failed': 0, 'last_row': None, 'errors': []}
+    started = time.perf_counter()
+    for report in reports:
+        for key in ('rows', 'created', 'linked', 'skipped', 'failed'):
+            summary[key] += report[key]
+        summary['last_row'] = report['last_row']
+        remaining = None if error_limit is None else max(error_limit - len(summary['errors']), 0)
+        summary['errors'].extend(report['errors'][:remaining])
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    summary['rows_per_second'] = round(summary['rows'] / summary['seconds'], 1) if summary['seconds'] else None
+    return summary
@@ -0,0 +1,219 @@
+# clinic_patients/lookup_index.py
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .search import normalize_search_text, parse_id_number_term, MIN_TERM_LENGTH
+
+# Markers keeping id numbers and name words in separate key ranges
+ID_PREFIX = '#'
+NAME_PREFIX = '@'
+
+
+class AccountPrefixIndex:
+    """
+    In-process prefix index over one account's patients.
+    Keys ('#<id_number>', '@<name word>') live in a sorted list searched
+    with bisect; each patient keeps its compact record and its keys so it
+    can be updated or removed incrementally.
+    """
+
+    def __init__(self, account_id):
+        self.account_id = account_id
+        self.built_at = time.monotonic()
+        self._keys = []          # sorted [(key, patient_id)]
+        self._records = {}       # patient_id -> compact record
+        self._patient_keys = {}  # patient_id -> [(key, patient_id)]
+        self._lock = threading.RLock()
+
+    @property
+    def size(self):
+        return len(self._keys)
+
+    @staticmethod
+    def make_record(patient_id, first_name, last_name1, last_name2, id_number, birth_date):
+        full_name = f"{first_name} {last_name1} {last_name2}".strip()
+        return {
+            'id': patient_id,
+            'full_name': full_name,
+            'id_number': id_number,
+            'birth_date': birth_date,
+            '_words': normalize_search_text(full_name).split(),
+        }
+
+    def _keys_for(self, record):
+        keys = {ID_PREFIX + record['id_number'].lower()}
+        keys.update(NAME_PREFIX + word for word in record['_words'])
+        return sorted((key, record['id']) for key in keys)
+
+    def load(self, records):
+        """Bulk load records (used when the index is built)."""
+        with self._lock:
+            entries = []
+            for record in records:
+                keys = self._keys_for(record)
+                self._records[record['id']] = record
+                self._patient_keys[record['id']] = keys
+                entries.extend(keys)
+            entries.sort()
+            self._keys = entries
+
+    def add(self, record):
+        with self._lock:
+            self.remove(record['id'])
+            keys = self._keys_for(record)
+            for entry in keys:
+                bisect.insort(self._keys, entry)
+            self._records[record['id']] = record
+            self._patient_keys[record['id']] = keys
+
+    def remove(self, patient_id):
+        with self._lock:
+            for entry in self._patient_keys.pop(patient_id, ()):
+                position = bisect.bisect_left(self._keys, entry)
+                if position < len(self._keys) and self._keys[position] == entry:
+                    del self._keys[position]
+            self._records.pop(patient_id, None)
+
+    def contains(self, patient_id):
+        return patient_id in self._records
+
+    def _prefix_ids(self, prefix):
+        """Patient ids having a key that starts with prefix."""
+        position = bisect.bisect_left(self._keys, (prefix,))
+        ids = set()
+        while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+            ids.add(self._keys[position][1])
+            position += 1
+        return ids
+
+    def lookup(self, term, limit=10):
+        """
+        Patients whose id number starts with the term, or whose name words
+        start with every token of the term. Ranked like the search backend:
+        exact id, id prefix, whole-name prefix, then any word match.
+        """
+        with self._lock:
+            id_term = parse_id_number_term(term)
+            if id_term:
+                # Id numbers are stored as entered, with or without separators
+                raw = term.strip().lower()
+                patient_ids = self._prefix_ids(ID_PREFIX + id_term) | self._prefix_ids(ID_PREFIX + raw)
+                matches = [self._records[patient_id] for patient_id in patient_ids]
+                ranked = [
+                    (0 if record['id_number'].lower() in (id_term, raw) else 1, record) for record in matches
+                ]
+            else:
+                normalized = normalize_search_text(term)
+                if len(normalized) < MIN_TERM_LENGTH:
+                    return []
+
+                tokens = normalized.split()
+                # Start from the most selective (longest) token
+                candidates = self._prefix_ids(NAME_PREFIX + max(tokens, key=len))
+                ranked = []
+                for patient_id in candidates:
+                    record = self._records[patient_id]
+                    words = record['_words']
+                    if not all(any(word.startswith(token) for word in words) for token in tokens):
+                        continue
+                    name = ' '.join(words)
+                    if name == normalized:
+                        rank = 2
+                    elif name.startswith(normalized):
+                        rank = 3
+                    elif f' {normalized}' in f' {name}':
+                        rank = 4
+                    else:
+                        rank = 5
+                    ranked.append((rank, record))
+
+                # Foreign ids may contain letters
+                raw = term.strip().lower()
+                for patient_id in self._prefix_ids(ID_PREFIX + raw):
+                    if patient_id not in candidates:
+                        ranked.append((1, self._records[patient_id]))
+
+            ranked.sort(key=lambda item: (item[0], item[1]['full_name'], item[1]['id']))
+            return [
+                {key: value for key, value in record.items() if not key.startswith('_')}
+                for _, record in ranked[:limit]
+            ]
+
+
+class PrefixIndexRegistry:
+    """
+    Per-process registry of account indexes.
+    Indexes are built lazily, dropped after PATIENT_LOOKUP_INDEX_TTL seconds
+    (other workers' writes are only seen after a rebuild), and evicted
+    least-recently-used first once PATIENT_LOOKUP_INDEX_MAX_KEYS is exceeded.
+    """
+
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, account_id):
+        ttl = getattr(settings, 'PATIENT_LOOKUP_INDEX_TTL', 300)
+        with self._lock:
+            index = self._indexes.get(account_id)
+            if index is not None and time.monotonic() - index.built_at < ttl:
+                self._indexes.move_to_end(account_id)
+                return index
+
+        index = self.build(account_id)
+        with self._lock:
+            self._indexes[account_id] = index
+            self._indexes.move_to_end(account_id)
+            self._evict()
+        return index
+
+    def loaded(self):
+        with self._lock:
+            return list(self._indexes.values())
+
+    def get_loaded(self, account_id):
+        with self._lock:
+            return self._indexes.get(account_id)
+
+    def discard(self, account_id):
+        """Drop an account's index so the next lookup rebuilds it (after bulk writes)."""
+        with self._lock:
+            self._indexes.pop(account_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def _evict(self):
+        max_keys = getattr(settings, 'PATIENT_LOOKUP_INDEX_MAX_KEYS', 500000)
+        total = sum(index.size for index in self._indexes.values())
+        # Always keep the most recently used index
+        while total > max_keys and len(self._indexes) > 1:
+            _, index = self._indexes.popitem(last=False)
+            total -= index.size
+
+    def build(self, account_id):
+        from .models import PatientAccount
+
+        rows = PatientAccount.objects.filter(account_id=account_id).values_list(
+            'patient_id', 'patient__first_name', 'patient__last_name1',
+            'patient__last_name2', 'patient__id_number', 'patient__birth_date'
+        ).iterator(chunk_size=5000)
+
+        index = AccountPrefixIndex(account_id)
+        index.load(AccountPrefixIndex.make_record(*row) for row in rows)
+        return index
+
+
+registry = PrefixIndexRegistry()
+
+
+def record_for_patient(patient):
+    return AccountPrefixIndex.make_record(
+        patient.id, patient.first_name, patient.last_name1,
+        patient.last_name2, patient.id_number, patient.birth_date
+    )
@@ -0,0 +1,44 @@
+# clinic_patients/management/commands/backfill_current_medical_histories.py
+
+from functools import reduce
+from operator import add
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Value, When
+from clinic_patients.models import MedicalHistory, PatientAccount
+
+class Command(BaseCommand):
+    help = 'Recompute medical history condition flags and point memberships at their latest history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        # condition_flags computed in SQL from the boolean columns
+        flags = reduce(add, [
+            Case(When(**{field: True}, then=Value(1 << bit)), default=Value(0), output_field=BigIntegerField())
+            for bit, field in enumerate(MedicalHistory.CONDITION_FIELDS)
+        ])
+        histories = self.backfill(MedicalHistory, lambda queryset: queryset.update(condition_flags=flags), options['batch_size'])
+        memberships = self.backfill(PatientAccount, PatientAccount.refresh_current_medical_history, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {histories} medical histories and {memberships} patient memberships updated"
+        ))
+
+    def backfill(self, model, update, batch_size):
+        updated = 0
+        last_id = 0
+        while True:
+            # Walk the primary key in batches to keep each transaction short
+            ids = list(model.objects.filter(
+                pk__gt=last_id
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += update(model.objects.filter(pk__in=ids))
+            last_id = ids[-1]
+        return updated
@@ -0,0 +1,103 @@
+# clinic_patients/management/commands/import_patients.py
+
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from platform_accounts.models import Account
+from clinic_patients.importer import DEFAULT_CHUNK_SIZE, FIRST_ROW, PatientImporter, read_rows
+
+class Command(BaseCommand):
+    help = 'Bulk import patients into an account from a CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file')
+        parser.add_argument('--account', required=True, help='Target account (account_id)')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--resume', action='store_true', help='Continue after the last committed chunk')
+        parser.add_argument('--state-file', help='Progress checkpoint (defaults to <path>.import-state)')
+        parser.add_argument('--errors', help='Write row errors to this CSV file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} not found')
+
+        account = Account.objects.filter(account_id=options['account']).first()
+        if account is None:
+            raise CommandError(f"Account {options['account']} not found")
+
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        state_file = options['state_file'] or f'{path}.import-state'
+        state = self.load_state(state_file, path, account) if options['resume'] else None
+        if state:
+            self.stdout.write(f"Resuming at row {state['next_row']}")
+        else:
+            state = {
+                'account': str(account.pk),
+                'source_size': os.path.getsize(path),
+                'next_row': FIRST_ROW,
+                'totals': {'rows': 0, 'created': 0, 'linked': 0, 'skipped': 0, 'failed': 0},
+            }
+
+        errors_file = open(options['errors'], 'a' if options['resume'] else 'w', newline='') if options['errors'] else None
+        errors_writer = csv.writer(errors_file) if errors_file else None
+
+        importer = PatientImporter(account, chunk_size=options['chunk_size'])
+        totals = state['totals']
+        started = time.perf_counter()
+        rows_this_run = 0
+        try:
+            with open(path, 'rb') as source:
+                for report in importer.run(read_rows(source, file_format), start_row=state['next_row']):
+                    for key in totals:
+                        totals[key] += report[key]
+                    rows_this_run += report['rows']
+
+                    for error in report['errors']:
+                        if errors_writer:
+                            for field, messages in error['errors'].items():
+                                errors_writer.writerow([error['row'], field, ' '.join(str(m) for m in messages)])
+                        else:
+                            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+
+                    # Checkpoint only after the chunk is committed
+                    state['next_row'] = report['last_row'] + 1
+                    self.save_state(state_file, state)
+
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"Rows {report['first_row']}-{report['last_row']}: {report['created']} created, "
+                        f"{report['linked']} linked, {report['skipped']} skipped, {report['failed']} failed "
+                        f"({rows_this_run / elapsed:.0f} rows/s)"
+                    )
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals['rows']} rows, {totals['created']} created, {totals['linked']} linked, "
+            f"{totals['skipped']} skipped, {totals['failed']} failed"
+        ))
+
+    def load_state(self, state_file, path, account):
+        if not os.path.exists(state_file):
+            return None
+        with open(state_file) as f:
+            state = json.load(f)
+        if state['account'] != str(account.pk) or state['source_size'] != os.path.getsize(path):
+            raise CommandError(f'{state_file} belongs to another import; remove it to start over')
+        return state
+
+    def save_state(self, state_file, state):
+        # Write then rename so an interruption never leaves a partial checkpoint
+        with open(f'{state_file}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{state_file}.tmp', state_file)
@@ -0,0 +1,37 @@
+# clinic_patients/management/commands/rebuild_patient_search_keys.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from clinic_patients.models import Patient
+
+class Command(BaseCommand):
+    help = 'Recompute the search key of every patient'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ('id', 'first_name', 'last_name1', 'last_name2', 'email', 'search_key')
+
+        updated = 0
+        batch = []
+        for patient in Patient.objects.only(*fields).order_by('pk').iterator(chunk_size=batch_size):
+            search_key = patient.build_search_key()
+            if patient.search_key != search_key:
+                patient.search_key = search_key
+                batch.append(patient)
+
+            if len(batch) >= batch_size:
+                updated += self.flush(batch)
+
+        updated += self.flush(batch)
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated} patients updated"))
+
+    def flush(self, batch):
+        count = len(batch)
+        if count:
+            with transaction.atomic():
+                Patient.objects.bulk_update(batch, ['search_key'])
+            batch.clear()
+        return count
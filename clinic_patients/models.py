@@ -1,7 +1,9 @@
 # clinic_patients/models.py
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from platform_accounts.models import Account  # Assuming this is your clinic/account model
+from .search import build_search_key
 
 class Patient(models.Model):
     """
@@ -41,12 +43,33 @@ class Patient(models.Model):
     district = models.CharField(max_length=100)
     address = models.TextField()
     
+    # Accent-folded, lowercased names and email for search (see search.py)
+    search_key = models.TextField(blank=True, default='', editable=False)
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.first_name} {self.last_name1} {self.last_name2}".strip()
+    
+    def build_search_key(self):
+        return build_search_key(self.first_name, self.last_name1, self.last_name2, self.email)
+    
+    def save(self, *args, **kwargs):
+        self.search_key = self.build_search_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'search_key' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['search_key']
+        super().save(*args, **kwargs)
+    
+    class Meta:
+        indexes = [
+            # Prefix (LIKE 'term%') lookups on id_number; opclasses only apply to PostgreSQL
+            models.Index(fields=['id_number'], name='patient_id_number_prefix_idx', opclasses=['varchar_pattern_ops']),
+            # Default patient list order
+            models.Index(fields=['last_name1', 'last_name2', 'first_name', 'id'], name='patient_name_order_idx'),
+        ]
 
 
 class PatientPhone(models.Model):
@@ -101,12 +124,42 @@ class PatientAccount(models.Model):
     consultation_reason = models.TextField(blank=True)
     receive_notifications = models.BooleanField(default=False)
     
+    # Latest medical history, kept current by MedicalHistory.save and deletes
+    current_medical_history = models.ForeignKey(
+        'MedicalHistory',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    # Condition bitmask of the current medical history (see MedicalHistory.CONDITION_FIELDS)
+    current_condition_flags = models.BigIntegerField(default=0, editable=False)
+    
     # Additional metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def refresh_current_medical_history(cls, queryset=None):
+        """Point memberships (all, or those in queryset) at their latest medical history in one UPDATE."""
+        latest = MedicalHistory.objects.filter(
+            patient_account=models.OuterRef('pk')
+        ).order_by('-created_at', '-pk')
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            current_medical_history=models.Subquery(latest.values('pk')[:1]),
+            current_condition_flags=Coalesce(
+                models.Subquery(latest.values('condition_flags')[:1]), 0
+            )
+        )
+    
     class Meta:
         unique_together = ['patient', 'account']  # A patient can only be linked once to each account
+        indexes = [
+            # Account-first for EXISTS scoping of patient lists
+            models.Index(fields=['account', 'patient'], name='patientaccount_account_idx'),
+        ]
     
     def __str__(self):
         return f"{self.patient} at {self.account}"
@@ -159,10 +212,69 @@ class MedicalHistory(models.Model):
     # Confirmation
     information_confirmed = models.BooleanField(default=False)
     
+    # Bit positions of condition_flags: append new conditions, never reorder
+    CONDITION_FIELDS = (
+        'under_treatment', 'current_medication', 'serious_illnesses', 'surgeries', 'allergies',
+        'anesthesia_issues', 'bleeding_issues', 'pregnant_or_lactating', 'contraceptives',
+        'high_blood_pressure', 'rheumatic_fever', 'drug_addiction', 'diabetes', 'anemia',
+        'thyroid', 'asthma', 'arthritis', 'cancer', 'heart_problems', 'smoker', 'ulcers',
+        'gastritis', 'hepatitis', 'kidney_diseases', 'hormonal_problems', 'epilepsy', 'aids',
+        'psychiatric_treatment',
+    )
+    
+    # The boolean columns above as one bitmask, set on save
+    condition_flags = models.BigIntegerField(default=0, editable=False)
+    
+    @classmethod
+    def condition_mask(cls, conditions):
+        """Bitmask for condition names (ValueError on unknown names)."""
+        mask = 0
+        for condition in conditions or ():
+            if condition not in cls.CONDITION_FIELDS:
+                raise ValueError(f'Unknown medical condition: {condition}')
+            mask |= 1 << cls.CONDITION_FIELDS.index(condition)
+        return mask
+    
+    def build_condition_flags(self):
+        return self.condition_mask([field for field in self.CONDITION_FIELDS if getattr(self, field)])
+    
     class Meta:
         ordering = ['-created_at']
         # This ensures we can have multiple medical histories per patient-account, but only one per date
         unique_together = ['patient_account', 'created_at']
     
+    def save(self, *args, **kwargs):
+        self.condition_flags = self.build_condition_flags()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'condition_flags' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['condition_flags']
+        super().save(*args, **kwargs)
+        # A new (or re-dated) history may now be the latest one
+        PatientAccount.refresh_current_medical_history(
+            PatientAccount.objects.filter(pk=self.patient_account_id)
+        )
+    
     def __str__(self):
-        return f"Medical history for {self.patient_account.patient} at {self.patient_account.account} - {self.created_at.date()}"
\ No newline at end of file
+        return f"Medical history for {self.patient_account.patient} at {self.patient_account.account} - {self.created_at.date()}"
+
+def patients_with_conditions(account, any_of=None, all_of=None):
+    """
+    Patients of the account whose current medical history has any of the
+    any_of conditions and all of the all_of conditions. Evaluated with
+    bitwise tests on PatientAccount.current_condition_flags while scanning
+    the account's memberships, so older history versions are never read.
+    """
+    any_mask = MedicalHistory.condition_mask(any_of)
+    all_mask = MedicalHistory.condition_mask(all_of)
+    
+    memberships = PatientAccount.objects.filter(account=account, patient=models.OuterRef('pk'))
+    if any_mask:
+        memberships = memberships.alias(
+            any_flags=models.F('current_condition_flags').bitand(any_mask)
+        ).filter(any_flags__gt=0)
+    if all_mask:
+        memberships = memberships.alias(
+            all_flags=models.F('current_condition_flags').bitand(all_mask)
+        ).filter(all_flags=all_mask)
+    
+    return Patient.objects.filter(models.Exists(memberships))
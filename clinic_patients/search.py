@@ -0,0 +1,162 @@
+# clinic_patients/search.py
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework import filters
+
+# Shortest term the search backends will look up
+MIN_TERM_LENGTH = 2
+
+# Separators people type inside cédula/DIMEX numbers
+ID_SEPARATORS = re.compile(r'[\s\-.]')
+
+
+def normalize_search_text(value):
+    """Lowercase, strip accents and collapse whitespace ('José  Núñez' -> 'jose nunez')."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+def build_search_key(*parts):
+    """
+    Build the stored search key for a patient.
+    Words are wrapped in spaces so that ' <token>' matches a word prefix.
+    """
+    return f" {normalize_search_text(' '.join(part for part in parts if part))} "
+
+
+def parse_id_number_term(term):
+    """Return the digits of an id number search ('1-0234-0567' -> '102340567') or None."""
+    digits = ID_SEPARATORS.sub('', term or '')
+    return digits if digits.isdigit() else None
+
+
+class DatabaseSearchBackend:
+    """
+    Portable search backend (SQLite and any other database).
+    Digits do a prefix match on id_number, as typed or without separators;
+    text must match every token as a word prefix of the search key. Results
+    are ranked exact id, id prefix, whole-name prefix, phrase, then any
+    token match.
+    """
+    ordering = ('search_rank', 'last_name1', 'last_name2', 'first_name', 'id')
+
+    def search(self, queryset, term):
+        id_term = parse_id_number_term(term)
+        if id_term:
+            # Id numbers are stored as entered, with or without separators
+            raw = term.strip()
+            return queryset.filter(
+                Q(id_number__startswith=id_term) | Q(id_number__startswith=raw)
+            ).annotate(
+                search_rank=Case(
+                    When(Q(id_number=id_term) | Q(id_number=raw), then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField()
+                )
+            ).order_by(*self.ordering)
+
+        normalized = normalize_search_text(term)
+        if len(normalized) < MIN_TERM_LENGTH:
+            return queryset.none()
+
+        return queryset.filter(
+            self.get_match_filter(normalized) | Q(id_number__istartswith=term.strip())
+        ).annotate(
+            search_rank=self.get_rank(normalized)
+        ).order_by(*self.ordering)
+
+    def get_match_filter(self, normalized):
+        match = Q()
+        for token in normalized.split():
+            match &= Q(search_key__contains=f' {token}')
+        return match
+
+    def get_rank(self, normalized):
+        return Case(
+            When(search_key__startswith=f' {normalized} ', then=Value(2)),
+            When(search_key__startswith=f' {normalized}', then=Value(3)),
+            When(search_key__contains=f' {normalized}', then=Value(4)),
+            default=Value(5),
+            output_field=IntegerField()
+        )
+
+
+class TrigramSearchBackend(DatabaseSearchBackend):
+    """
+    PostgreSQL backend using pg_trgm.
+    Also matches misspelled names by trigram word similarity and ranks
+    by similarity within each rank bucket.
+    """
+    ordering = ('search_rank', '-similarity', 'last_name1', 'last_name2', 'first_name', 'id')
+    similarity_threshold = 0.4
+
+    def search(self, queryset, term):
+        if parse_id_number_term(term):
+            return super().search(queryset, term)
+
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        normalized = normalize_search_text(term)
+        if len(normalized) < MIN_TERM_LENGTH:
+            return queryset.none()
+
+        return queryset.annotate(
+            similarity=TrigramWordSimilarity(normalized, 'search_key')
+        ).filter(
+            self.get_match_filter(normalized) |
+            Q(similarity__gte=self.similarity_threshold) |
+            Q(id_number__istartswith=term.strip())
+        ).annotate(
+            search_rank=self.get_rank(normalized)
+        ).order_by(*self.ordering)
+
+
+def get_search_backend():
+    """
+    Get the configured backend (PATIENT_SEARCH_BACKEND: 'auto', 'database'
+    or 'trigram'). 'auto' uses trigram matching on PostgreSQL.
+    """
+    backend = getattr(settings, 'PATIENT_SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'trigram' if connection.vendor == 'postgresql' else 'database'
+    if backend == 'trigram':
+        return TrigramSearchBackend()
+    return DatabaseSearchBackend()
+
+
+class PatientSearchFilter(filters.BaseFilterBackend):
+    """Replaces SearchFilter for patients: ranked results for ?search=."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+        return get_search_backend().search(queryset, term)
+
+
+def create_search_indexes(sender, using='default', apps=None, **kwargs):
+    """
+    post_migrate handler creating the trigram index on PostgreSQL.
+    The project keeps no migrations, so the index is managed here.
+    """
+    database = connections[using]
+    if database.vendor != 'postgresql' or apps is None:
+        return
+
+    try:
+        table = apps.get_model('clinic_patients', 'Patient')._meta.db_table
+    except LookupError:
+        return
+
+    with database.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_search_key_trgm '
+            f'ON {table} USING gin (search_key gin_trgm_ops)'
+        )
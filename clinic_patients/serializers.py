@@ -1,6 +1,7 @@
 # clinic_patients/serializers.py
 from rest_framework import serializers
 from django.apps import apps
+from django.db import transaction
 from .models import Patient, PatientPhone, EmergencyContact, PatientAccount, MedicalHistory
 
 # Import the Account model from platform_accounts app
@@ -16,17 +17,104 @@ class EmergencyContactSerializer(serializers.ModelSerializer):
         model = EmergencyContact
         fields = ('id', 'first_name', 'last_name1', 'last_name2', 'phone', 'relationship')
 
+class PatientPhoneWriteSerializer(PatientPhoneSerializer):
+    # Nested patient writes only: the id addresses an existing row (see sync_patient_rows)
+    id = serializers.IntegerField(required=False)
+
+class EmergencyContactWriteSerializer(EmergencyContactSerializer):
+    id = serializers.IntegerField(required=False)
+
+def sync_patient_rows(model, patient, items, fields, natural_key):
+    """
+    Make the patient's phones/contacts match items with the fewest writes.
+    Ids of other patients' rows are rejected with a ValidationError.
+    Items are matched to existing rows by id, then by natural key, then
+    reuse leftover rows; changed rows go through one bulk_update, new ones
+    through one bulk_create and removed ones through one delete.
+    """
+    existing = {row.pk: row for row in model.objects.filter(patient=patient)}
+    defaults = {field: model._meta.get_field(field).get_default() for field in fields}
+    
+    foreign = sorted(item['id'] for item in items if item.get('id') is not None and item['id'] not in existing)
+    if foreign:
+        raise serializers.ValidationError({
+            'id': [f"{model._meta.verbose_name} {pk} does not belong to this patient." for pk in foreign]
+        })
+    
+    matched = []
+    pending = []
+    for item in items:
+        item = dict(item)
+        pk = item.pop('id', None)
+        if pk in existing:
+            matched.append((existing.pop(pk), item))
+        else:
+            pending.append(item)
+    
+    by_key = {}
+    for row in existing.values():
+        by_key.setdefault(natural_key(row.__dict__), []).append(row)
+    unmatched = []
+    for item in pending:
+        candidates = by_key.get(natural_key({**defaults, **item}))
+        if candidates:
+            row = candidates.pop(0)
+            matched.append((existing.pop(row.pk), item))
+        else:
+            unmatched.append(item)
+    
+    # Rewrite leftover rows before creating or deleting any
+    leftovers = list(existing.values())
+    matched.extend(zip(leftovers, unmatched))
+    
+    changed = []
+    changed_fields = set()
+    for row, item in matched:
+        row_changed = False
+        for field in fields:
+            value = item.get(field, defaults[field])
+            if getattr(row, field) != value:
+                setattr(row, field, value)
+                changed_fields.add(field)
+                row_changed = True
+        if row_changed:
+            changed.append(row)
+    
+    if changed:
+        model.objects.bulk_update(changed, sorted(changed_fields))
+    if len(unmatched) > len(leftovers):
+        model.objects.bulk_create([
+            model(patient=patient, **item) for item in unmatched[len(leftovers):]
+        ])
+    if len(leftovers) > len(unmatched):
+        model.objects.filter(pk__in=[row.pk for row in leftovers[len(unmatched):]]).delete()
+
+PHONE_FIELDS = ('phone_number', 'phone_type')
+CONTACT_FIELDS = ('first_name', 'last_name1', 'last_name2', 'phone', 'relationship')
+
 class MedicalHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalHistory
-        fields = '__all__'
+        # condition_flags mirrors the boolean columns for internal screening queries
+        exclude = ('condition_flags',)
 
 class PatientAccountSerializer(serializers.ModelSerializer):
+    """
+    Nests only the current medical history; every version is included
+    when the context asks for medical_histories='all'.
+    """
+    current_medical_history = MedicalHistorySerializer(read_only=True)
     medical_histories = MedicalHistorySerializer(many=True, read_only=True)
     
     class Meta:
         model = PatientAccount
-        fields = '__all__'
+        exclude = ('current_condition_flags',)
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('medical_histories') != 'all':
+            fields.pop('medical_histories')
+        return fields
 
 class PatientSerializer(serializers.ModelSerializer):
     phones = PatientPhoneSerializer(many=True, read_only=True)
@@ -35,7 +123,8 @@ class PatientSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Patient
-        fields = '__all__'
+        # search_key is an internal index column
+        exclude = ('search_key',)
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -43,8 +132,8 @@ class PatientSerializer(serializers.ModelSerializer):
         return representation
 
 class PatientCreateSerializer(serializers.ModelSerializer):
-    phones = PatientPhoneSerializer(many=True, required=False)
-    emergency_contacts = EmergencyContactSerializer(many=True, required=False)
+    phones = PatientPhoneWriteSerializer(many=True, required=False)
+    emergency_contacts = EmergencyContactWriteSerializer(many=True, required=False)
     account = serializers.PrimaryKeyRelatedField(write_only=True, required=True, 
                                                queryset=Account.objects.all())
     referral_source = serializers.CharField(required=False, write_only=True)
@@ -53,8 +142,9 @@ class PatientCreateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Patient
-        exclude = ('created_at', 'updated_at')
+        exclude = ('created_at', 'updated_at', 'search_key')
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Custom update method to handle nested fields"""
         # Extract nested fields
@@ -74,21 +164,14 @@ class PatientCreateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Handle phones - if provided, replace existing ones
+        # Nested rows are diffed against the existing ones (see sync_patient_rows)
         if phones_data is not None:
-            # Delete existing phones
-            instance.phones.all().delete()
-            # Create new ones
-            for phone_data in phones_data:
-                PatientPhone.objects.create(patient=instance, **phone_data)
+            sync_patient_rows(PatientPhone, instance, phones_data, PHONE_FIELDS,
+                              lambda row: row['phone_number'])
         
-        # Handle emergency contacts - if provided, replace existing ones
         if emergency_contacts_data is not None:
-            # Delete existing emergency contacts
-            instance.emergency_contacts.all().delete()
-            # Create new ones
-            for contact_data in emergency_contacts_data:
-                EmergencyContact.objects.create(patient=instance, **contact_data)
+            sync_patient_rows(EmergencyContact, instance, emergency_contacts_data, CONTACT_FIELDS,
+                              lambda row: (row['first_name'], row['last_name1'], row['last_name2'], row['phone']))
         
         # Handle clinic membership (account) if provided
         if account_data:
@@ -118,6 +201,7 @@ class PatientCreateSerializer(serializers.ModelSerializer):
         
         return instance
     
+    @transaction.atomic
     def create(self, validated_data):
         phones_data = validated_data.pop('phones', [])
         emergency_contacts_data = validated_data.pop('emergency_contacts', [])
@@ -133,13 +217,15 @@ class PatientCreateSerializer(serializers.ModelSerializer):
         # Create the patient
         patient = Patient.objects.create(**validated_data)
         
-        # Add phones
-        for phone_data in phones_data:
-            PatientPhone.objects.create(patient=patient, **phone_data)
-        
-        # Add emergency contacts
-        for contact_data in emergency_contacts_data:
-            EmergencyContact.objects.create(patient=patient, **contact_data)
+        # Add phones and emergency contacts
+        PatientPhone.objects.bulk_create([
+            PatientPhone(patient=patient, **{k: v for k, v in phone_data.items() if k != 'id'})
+            for phone_data in phones_data
+        ])
+        EmergencyContact.objects.bulk_create([
+            EmergencyContact(patient=patient, **{k: v for k, v in contact_data.items() if k != 'id'})
+            for contact_data in emergency_contacts_data
+        ])
         
         # Create the clinic association
         PatientAccount.objects.create(
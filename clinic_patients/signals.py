@@ -0,0 +1,51 @@
+# clinic_patients/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Patient, PatientAccount, MedicalHistory
+from .lookup_index import registry, record_for_patient
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_in_lookup_indexes(sender, instance, **kwargs):
+    def update():
+        record = record_for_patient(instance)
+        for index in registry.loaded():
+            if index.contains(instance.pk):
+                index.add(record)
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_from_lookup_indexes(sender, instance, **kwargs):
+    def remove():
+        for index in registry.loaded():
+            index.remove(instance.pk)
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=PatientAccount)
+def add_membership_to_lookup_index(sender, instance, **kwargs):
+    def add():
+        index = registry.get_loaded(instance.account_id)
+        if index is not None:
+            index.add(record_for_patient(instance.patient))
+    transaction.on_commit(add)
+
+
+@receiver(post_delete, sender=PatientAccount)
+def remove_membership_from_lookup_index(sender, instance, **kwargs):
+    def remove():
+        index = registry.get_loaded(instance.account_id)
+        if index is not None:
+            index.remove(instance.patient_id)
+    transaction.on_commit(remove)
+
+
+@receiver(post_delete, sender=MedicalHistory)
+def refresh_current_medical_history(sender, instance, **kwargs):
+    # The pointer was nulled by SET_NULL; fall back to the previous history
+    PatientAccount.refresh_current_medical_history(
+        PatientAccount.objects.filter(pk=instance.patient_account_id)
+    )
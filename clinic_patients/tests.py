@@ -1,3 +1,684 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from platform_users.models import User
+from platform_accounts.models import Account, AccountOwner, AccountUser
+from platform_accounts.roles import AccountRoles
+from .importer import PatientImporter, read_csv
+from .lookup_index import registry as lookup_registry
+from .models import Patient, PatientPhone, EmergencyContact, PatientAccount, MedicalHistory, patients_with_conditions
+from .search import DatabaseSearchBackend, TrigramSearchBackend, normalize_search_text, parse_id_number_term
+from .serializers import PHONE_FIELDS, PatientCreateSerializer, sync_patient_rows
+
+
+def create_patient(id_number='200000001', **fields):
+    values = {
+        'first_name': 'Ana', 'last_name1': 'Mora', 'birth_date': datetime.date(1990, 1, 1), 'gender': 'F',
+        'marital_status': 'S', 'province': 'San José', 'canton': 'Central', 'district': 'Carmen',
+        'address': 'Address',
+    }
+    values.update(fields)
+    return Patient.objects.create(id_number=id_number, **values)
+
+
+def create_account(number=1):
+    """An account and its owner."""
+    owner = User.objects.create_user(
+        email=f'owner{number}@example.com', id_number=f'10000000{number}', id_type='01', password='x'
+    )
+    account = Account.objects.create(
+        account_name=f'Clinic {number}', account_email=f'clinic{number}@example.com',
+        account_phone='22220000', account_address='Address'
+    )
+    AccountOwner.objects.create(user=owner, account=account)
+    AccountUser.objects.create(user=owner, account=account, role=AccountRoles.ADMINISTRATOR)
+    return account, owner
+
+
+class SyncPatientRowsTests(TestCase):
+    """Nested phone writes are diffed against the patient's rows."""
+
+    def setUp(self):
+        self.patient = create_patient()
+        self.home = PatientPhone.objects.create(patient=self.patient, phone_number='22220000', phone_type='H')
+        self.mobile = PatientPhone.objects.create(patient=self.patient, phone_number='88880000', phone_type='P')
+
+    def sync(self, items, patient=None):
+        sync_patient_rows(PatientPhone, patient or self.patient, items, PHONE_FIELDS,
+                          lambda row: row['phone_number'])
+
+    def phones(self):
+        return list(PatientPhone.objects.filter(patient=self.patient).order_by('pk').values_list(
+            'pk', 'phone_number', 'phone_type'
+        ))
+
+    def test_updates_rows_by_id(self):
+        self.sync([
+            {'id': self.home.pk, 'phone_number': '22221111', 'phone_type': 'H'},
+            {'id': self.mobile.pk, 'phone_number': '88880000', 'phone_type': 'W'},
+        ])
+        self.assertEqual(self.phones(), [
+            (self.home.pk, '22221111', 'H'),
+            (self.mobile.pk, '88880000', 'W'),
+        ])
+
+    def test_matches_rows_without_id_by_number(self):
+        self.sync([{'phone_number': '88880000', 'phone_type': 'P'}])
+        self.assertEqual(self.phones(), [(self.mobile.pk, '88880000', 'P')])
+
+    def test_creates_and_deletes_rows(self):
+        self.sync([
+            {'id': self.home.pk, 'phone_number': '22220000', 'phone_type': 'H'},
+            {'phone_number': '77770000', 'phone_type': 'P'},
+            {'phone_number': '66660000', 'phone_type': 'W'},
+        ])
+        phones = self.phones()
+        self.assertEqual(len(phones), 3)
+        self.assertEqual(phones[0], (self.home.pk, '22220000', 'H'))
+        # The unmatched mobile row is reused before anything is created
+        self.assertEqual(phones[1][0], self.mobile.pk)
+        self.assertEqual({phone[1] for phone in phones[1:]}, {'77770000', '66660000'})
+
+        self.sync([])
+        self.assertEqual(self.phones(), [])
+
+    def test_rejects_ids_of_another_patient(self):
+        other = create_patient('200000002')
+        other_phone = PatientPhone.objects.create(patient=other, phone_number='55550000', phone_type='H')
+
+        with self.assertRaises(serializers.ValidationError):
+            self.sync([{'id': other_phone.pk, 'phone_number': '55551111', 'phone_type': 'H'}])
+
+        other_phone.refresh_from_db()
+        self.assertEqual((other_phone.patient_id, other_phone.phone_number), (other.pk, '55550000'))
+        self.assertEqual(len(self.phones()), 2)
+
+    def test_patient_update_rejects_foreign_ids(self):
+        other = create_patient('200000002')
+        other_contact = EmergencyContact.objects.create(
+            patient=other, first_name='Luis', last_name1='Mora', phone='88880001'
+        )
+        serializer = PatientCreateSerializer(self.patient, data={
+            'emergency_contacts': [{
+                'id': other_contact.pk, 'first_name': 'Eva', 'last_name1': 'Mora', 'phone': '88880002'
+            }],
+        }, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(serializers.ValidationError):
+            serializer.save()
+        self.assertFalse(EmergencyContact.objects.filter(patient=self.patient).exists())
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class AddPatientRowTests(TestCase):
+    """add_phone/add_emergency_contact always create a new row; a client id is ignored."""
+
+    def setUp(self):
+        self.account, self.owner = create_account()
+        self.patient = create_patient()
+        PatientAccount.objects.create(patient=self.patient, account=self.account)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def post(self, action, data):
+        return self.client.post(
+            f'/api/clinic/patients/patients/{self.patient.pk}/{action}/', data, format='json',
+            HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+        )
+
+    def test_add_phone_ignores_id(self):
+        existing = PatientPhone.objects.create(patient=self.patient, phone_number='22220000', phone_type='H')
+        for phone_id in (existing.pk, 999999):
+            with self.subTest(id=phone_id):
+                response = self.post('add_phone', {'id': phone_id, 'phone_number': '88880000', 'phone_type': 'P'})
+                self.assertEqual(response.status_code, 201)
+                self.assertNotIn(response.data['id'], (existing.pk, 999999))
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.phone_number, '22220000')
+
+    def test_add_emergency_contact_ignores_id(self):
+        response = self.post('add_emergency_contact', {
+            'id': 999999, 'first_name': 'Luis', 'last_name1': 'Mora', 'phone': '88880001'
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data['id'], 999999)
+
+
+IMPORT_HEADER = (
+    'id_number,first_name,last_name1,birth_date,gender,marital_status,'
+    'province,canton,district,address,phone_1,emergency_contact_first_name,emergency_contact_last_name1,'
+    'emergency_contact_phone'
+)
+
+
+def import_csv(*id_numbers):
+    """CSV import file text with one valid row per id number."""
+    rows = [
+        f'{id_number},Ana,Mora,1990-01-01,F,S,San José,Central,Carmen,Address,8888{index:04},Luis,Mora,88880001'
+        for index, id_number in enumerate(id_numbers)
+    ]
+    return '\n'.join([IMPORT_HEADER] + rows) + '\n'
+
+
+def import_rows(*id_numbers):
+    return read_csv(io.StringIO(import_csv(*id_numbers)))
+
+
+class PatientImporterTests(TestCase):
+
+    def setUp(self):
+        self.account, _ = create_account()
+
+    def run_import(self, rows, **kwargs):
+        return list(PatientImporter(self.account, chunk_size=2).run(rows, **kwargs))
+
+    def test_rows_are_written_in_chunks(self):
+        reports = self.run_import(import_rows('400000001', '400000002', '400000003', '400000004', '400000005'))
+
+        self.assertEqual(
+            [(report['first_row'], report['last_row'], report['created']) for report in reports],
+            [(2, 3, 2), (4, 5, 2), (6, 6, 1)]
+        )
+        self.assertEqual(PatientAccount.objects.filter(account=self.account).count(), 5)
+        self.assertEqual(PatientPhone.objects.count(), 5)
+        self.assertEqual(EmergencyContact.objects.count(), 5)
+        patient = Patient.objects.get(id_number='400000001')
+        self.assertEqual(patient.search_key, patient.build_search_key())
+
+    def test_start_row_skips_committed_rows(self):
+        reports = self.run_import(import_rows('400000001', '400000002', '400000003'), start_row=4)
+        self.assertEqual([(report['first_row'], report['rows']) for report in reports], [(4, 1)])
+        self.assertEqual(list(Patient.objects.values_list('id_number', flat=True)), ['400000003'])
+
+    def test_id_numbers_are_deduplicated(self):
+        other_account, _ = create_account(2)
+        shared = create_patient('400000001', first_name='Eva')
+        PatientAccount.objects.create(patient=shared, account=other_account)
+        member = create_patient('400000002')
+        PatientAccount.objects.create(patient=member, account=self.account)
+
+        reports = self.run_import(import_rows('400000001', '400000002', '400000003', '400000003'))
+        totals = {key: sum(report[key] for report in reports) for key in ('created', 'linked', 'skipped', 'failed')}
+        self.assertEqual(totals, {'created': 1, 'linked': 1, 'skipped': 1, 'failed': 1})
+        self.assertIn('Duplicate of row 4', str(reports[1]['errors'][0]['errors']))
+
+        # The shared record is linked with its personal data untouched
+        shared.refresh_from_db()
+        self.assertEqual(shared.first_name, 'Eva')
+        self.assertTrue(PatientAccount.objects.filter(patient=shared, account=self.account).exists())
+        self.assertEqual(Patient.objects.count(), 3)
+
+    def test_integrity_error_retries_with_fresh_dedupe(self):
+        write_chunk = PatientImporter.write_chunk
+        calls = []
+
+        def racing_write_chunk(importer, valid, report):
+            calls.append(len(valid))
+            if len(calls) == 1:
+                # Another writer creates one of the chunk's patients first
+                create_patient('400000002')
+                raise IntegrityError('UNIQUE constraint failed: clinic_patients_patient.id_number')
+            return write_chunk(importer, valid, report)
+
+        with mock.patch.object(PatientImporter, 'write_chunk', racing_write_chunk):
+            reports = self.run_import(import_rows('400000001', '400000002'))
+
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual((reports[0]['created'], reports[0]['linked']), (1, 1))
+        self.assertEqual(Patient.objects.filter(id_number='400000002').count(), 1)
+
+
+class ImportPatientsCommandTests(TestCase):
+
+    def setUp(self):
+        self.account, _ = create_account()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'patients.csv')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(import_csv('400000001', '400000002', '400000003'))
+        self.state_file = f'{self.path}.import-state'
+
+    def call(self, *args):
+        call_command(
+            'import_patients', self.path, '--account', str(self.account.account_id), '--chunk-size', '2',
+            *args, stdout=io.StringIO(), stderr=io.StringIO()
+        )
+
+    def test_completed_import_removes_state_file(self):
+        self.call()
+        self.assertEqual(Patient.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_resume_continues_after_checkpoint(self):
+        saved = []
+
+        def interrupt(command, state_file, state):
+            # Checkpoint the first chunk, then stop as if the process died
+            with open(state_file, 'w') as f:
+                json.dump(state, f)
+            saved.append(dict(state))
+            raise KeyboardInterrupt
+
+        from clinic_patients.management.commands.import_patients import Command
+        with mock.patch.object(Command, 'save_state', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.call()
+        self.assertEqual(saved[0]['next_row'], 4)
+        self.assertEqual(Patient.objects.count(), 2)
+
+        self.call('--resume')
+        self.assertEqual(
+            sorted(Patient.objects.values_list('id_number', flat=True)),
+            ['400000001', '400000002', '400000003']
+        )
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_state_of_another_import_is_rejected(self):
+        with open(self.state_file, 'w') as f:
+            json.dump({'account': str(self.account.pk), 'source_size': 1, 'next_row': 4, 'totals': {}}, f)
+        with self.assertRaises(CommandError):
+            self.call('--resume')
+        self.assertFalse(Patient.objects.exists())
+
+
+class SearchKeyTests(TestCase):
+
+    def test_normalize_search_text(self):
+        self.assertEqual(normalize_search_text('  José   NÚÑEZ\tÁvila '), 'jose nunez avila')
+        self.assertEqual(normalize_search_text(None), '')
+
+    def test_search_key_keeps_every_surname_and_email(self):
+        patient = create_patient(
+            first_name='María José', last_name1='Rodríguez', last_name2='Núñez de Arco', email='MJ@Example.com'
+        )
+        self.assertEqual(patient.search_key, ' maria jose rodriguez nunez de arco mj@example.com ')
+
+        patient.last_name1 = 'Quesada'
+        patient.save(update_fields=['last_name1'])
+        patient.refresh_from_db()
+        self.assertEqual(patient.search_key, ' maria jose quesada nunez de arco mj@example.com ')
+
+    def test_search_key_is_not_serialized(self):
+        account, owner = create_account()
+        patient = create_patient()
+        PatientAccount.objects.create(patient=patient, account=account)
+        client = APIClient()
+        client.force_authenticate(user=owner)
+        with override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0):
+            headers = {'HTTP_X_ACCOUNT_CONTEXT': str(account.account_id)}
+            listed = client.get('/api/clinic/patients/patients/', **headers).data['results']
+            retrieved = client.get(f'/api/clinic/patients/patients/{patient.pk}/', **headers).data
+        self.assertEqual(len(listed), 1)
+        self.assertNotIn('search_key', listed[0])
+        self.assertNotIn('search_key', retrieved)
+        self.assertNotIn('search_key', PatientCreateSerializer(patient).data)
+
+    def test_parse_id_number_term(self):
+        self.assertEqual(parse_id_number_term('1-0234-0567'), '102340567')
+        self.assertEqual(parse_id_number_term('1 0234.0567'), '102340567')
+        self.assertIsNone(parse_id_number_term('ana'))
+
+
+class SearchBackendTests(TestCase):
+    """Both backends rank exact name, name prefix, phrase, then any token match."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = [
+            create_patient('200000001', first_name='Ana', last_name1='Mora', last_name2=''),
+            create_patient('200000002', first_name='Ana', last_name1='Morales', last_name2=''),
+            create_patient('200000003', first_name='Luisa', last_name1='Ana', last_name2='Mora'),
+            create_patient('200000004', first_name='Mora', last_name1='Anaya', last_name2=''),
+            create_patient('200000005', first_name='Ana', last_name1='Vargas', last_name2=''),
+            create_patient('200000006', first_name='Marta', last_name1='Rodríguez', last_name2=''),
+        ]
+
+    def search(self, backend, term):
+        return list(backend.search(Patient.objects.all(), term).values_list('id_number', flat=True))
+
+    def assertRanked(self, backend):
+        expected = ['200000001', '200000002', '200000003', '200000004']
+        self.assertEqual(self.search(backend, 'ana mora'), expected)
+        # Accents and case are ignored
+        self.assertEqual(self.search(backend, 'ÁNA  Morá'), expected)
+        self.assertEqual(self.search(backend, 'a'), [])
+
+    def test_database_backend_ranking(self):
+        backend = DatabaseSearchBackend()
+        self.assertRanked(backend)
+        self.assertEqual(self.search(backend, 'rodriguez'), ['200000006'])
+        # Id prefix matches share a rank and follow the name order
+        self.assertEqual(
+            self.search(backend, '2-0000-000'),
+            ['200000003', '200000004', '200000001', '200000002', '200000006', '200000005']
+        )
+        # An exact id number comes before id prefixes
+        self.assertEqual(self.search(backend, '200000003')[0], '200000003')
+
+    def test_dashed_id_numbers(self):
+        dashed = create_patient('1-0234-0567', first_name='Eva', last_name1='Solano')
+        plain = create_patient('102340568', first_name='Eva', last_name1='Solano')
+        backend = DatabaseSearchBackend()
+        # Stored with separators: found as typed; stored without: found by the digits
+        self.assertEqual(self.search(backend, '1-0234'), ['1-0234-0567', '102340568'])
+        self.assertEqual(self.search(backend, '1-0234-0567'), ['1-0234-0567'])
+        self.assertEqual(self.search(backend, '1-0234-0568'), ['102340568'])
+
+        account, _ = create_account()
+        for patient in (dashed, plain):
+            PatientAccount.objects.create(patient=patient, account=account)
+        lookup_registry.clear()
+        self.addCleanup(lookup_registry.clear)
+        index = lookup_registry.get(account.pk)
+        self.assertEqual([record['id_number'] for record in index.lookup('1-0234')], ['1-0234-0567', '102340568'])
+        self.assertEqual([record['id_number'] for record in index.lookup('1-0234-0567')], ['1-0234-0567'])
+
+    def test_trigram_backend_ranking(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Trigram matching needs PostgreSQL with pg_trgm')
+        backend = TrigramSearchBackend()
+        self.assertRanked(backend)
+        # Misspellings match by word similarity, after every exact match
+        self.assertEqual(self.search(backend, 'rodrigues'), ['200000006'])
+
+
+class LookupIndexTests(TestCase):
+    """Patient and membership writes keep a loaded lookup index equal to a rebuilt one."""
+
+    def setUp(self):
+        lookup_registry.clear()
+        self.addCleanup(lookup_registry.clear)
+        self.account, _ = create_account()
+        self.patients = [
+            create_patient('200000001', first_name='Ana', last_name1='Mora', last_name2='Solís'),
+            create_patient('200000002', first_name='José', last_name1='Núñez', last_name2=''),
+        ]
+        for patient in self.patients:
+            PatientAccount.objects.create(patient=patient, account=self.account)
+        self.index = lookup_registry.get(self.account.pk)
+
+    def commit(self, write):
+        # The signals update loaded indexes once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+
+    def lookup(self, term):
+        return [record['id_number'] for record in self.index.lookup(term)]
+
+    def assertMatchesRebuild(self):
+        rebuilt = lookup_registry.build(self.account.pk)
+        self.assertEqual(self.index._keys, rebuilt._keys)
+        self.assertEqual(self.index._records, rebuilt._records)
+        self.assertIs(lookup_registry.get(self.account.pk), self.index)
+
+    def test_lookup_ranking(self):
+        self.assertEqual(self.lookup('nunez'), ['200000002'])
+        self.assertEqual(self.lookup('ana mo'), ['200000001'])
+        self.assertEqual(self.lookup('2-0000-0002'), ['200000002'])
+        self.assertEqual(self.lookup('20000000'), ['200000001', '200000002'])
+
+    def test_saved_patient_is_reindexed(self):
+        patient = self.patients[0]
+        patient.last_name1 = 'Quesada'
+        self.commit(patient.save)
+
+        self.assertEqual(self.lookup('quesada'), ['200000001'])
+        self.assertEqual(self.lookup('mora'), [])
+        self.assertMatchesRebuild()
+
+    def test_deleted_patient_is_removed(self):
+        self.commit(self.patients[0].delete)
+        self.assertEqual(self.lookup('ana'), [])
+        self.assertMatchesRebuild()
+
+    def test_memberships_add_and_remove_patients(self):
+        outsider = create_patient('200000003', first_name='Eva', last_name1='Mora')
+        self.commit(outsider.save)
+        # Patients of other clinics are not added by their own saves
+        self.assertEqual(self.lookup('eva'), [])
+
+        membership = PatientAccount(patient=outsider, account=self.account)
+        self.commit(membership.save)
+        self.assertEqual(self.lookup('eva'), ['200000003'])
+        self.assertMatchesRebuild()
+
+        self.commit(membership.delete)
+        self.assertEqual(self.lookup('eva'), [])
+        self.assertMatchesRebuild()
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class PatientSummaryTests(TestCase):
+    """The summary ETag answers 304 only while nothing it shows has changed."""
+
+    def setUp(self):
+        self.account, self.owner = create_account()
+        self.patient = create_patient()
+        self.membership = PatientAccount.objects.create(patient=self.patient, account=self.account)
+        self.history = MedicalHistory.objects.create(patient_account=self.membership, allergies=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def request(self, method, path, data=None, **headers):
+        return getattr(self.client, method)(
+            path, data, format='json', HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id), **headers
+        )
+
+    def summary(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.request('get', f'/api/clinic/patients/patients/{self.patient.pk}/summary/', **headers)
+
+    def assertEditRefreshes(self, edit):
+        response = self.summary()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.summary(etag).status_code, 304)
+
+        edit()
+        response = self.summary(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response.data
+
+    def test_summary_sections(self):
+        data = self.summary().data
+        self.assertEqual(data['full_name'], 'Ana Mora')
+        self.assertNotIn('search_key', data['patient'])
+        self.assertNotIn('condition_flags', data['medical_history'])
+        self.assertTrue(data['medical_history']['allergies'])
+        self.assertEqual(data['treatments'], {'upcoming': [], 'recent': []})
+        self.assertEqual(data['billing']['unpaid_charges'], [])
+
+    def test_added_phone_refreshes(self):
+        data = self.assertEditRefreshes(lambda: self.request(
+            'post', f'/api/clinic/patients/patients/{self.patient.pk}/add_phone/', {'phone_number': '88880000'}
+        ))
+        self.assertEqual([phone['phone_number'] for phone in data['patient']['phones']], ['88880000'])
+
+    def test_added_emergency_contact_refreshes(self):
+        data = self.assertEditRefreshes(lambda: self.request(
+            'post', f'/api/clinic/patients/patients/{self.patient.pk}/add_emergency_contact/',
+            {'first_name': 'Luis', 'last_name1': 'Mora', 'phone': '88880001'}
+        ))
+        self.assertEqual(len(data['patient']['emergency_contacts']), 1)
+
+    def test_edited_history_refreshes(self):
+        data = self.assertEditRefreshes(lambda: self.request(
+            'patch', f'/api/clinic/patients/medical-histories/{self.history.pk}/',
+            {'allergies_text': 'Penicillin'}
+        ))
+        self.assertEqual(data['medical_history']['allergies_text'], 'Penicillin')
+
+
+class MedicalConditionTests(TestCase):
+    """current_condition_flags follows the latest history and screens like the boolean columns."""
+
+    CONDITIONS = ('allergies', 'diabetes', 'asthma', 'smoker')
+
+    def setUp(self):
+        self.account, _ = create_account()
+
+    def add_history(self, membership, days_ago=0, **conditions):
+        return MedicalHistory.objects.create(
+            patient_account=membership,
+            created_at=timezone.now() - datetime.timedelta(days=days_ago),
+            **conditions
+        )
+
+    def test_save_computes_condition_flags(self):
+        membership = PatientAccount.objects.create(patient=create_patient(), account=self.account)
+        history = self.add_history(membership, allergies=True, diabetes=True)
+        self.assertEqual(history.condition_flags, MedicalHistory.condition_mask(['allergies', 'diabetes']))
+
+        history.diabetes = False
+        history.save(update_fields=['diabetes'])
+        history.refresh_from_db()
+        self.assertEqual(history.condition_flags, MedicalHistory.condition_mask(['allergies']))
+
+        with self.assertRaises(ValueError):
+            MedicalHistory.condition_mask(['flu'])
+
+    def test_current_history_follows_the_latest_version(self):
+        membership = PatientAccount.objects.create(patient=create_patient(), account=self.account)
+        older = self.add_history(membership, days_ago=30, asthma=True)
+        latest = self.add_history(membership, days_ago=1, smoker=True)
+
+        membership.refresh_from_db()
+        self.assertEqual(membership.current_medical_history_id, latest.pk)
+        self.assertEqual(membership.current_condition_flags, MedicalHistory.condition_mask(['smoker']))
+
+        # Re-dating the older version makes it the latest one
+        older.created_at = timezone.now()
+        older.save()
+        membership.refresh_from_db()
+        self.assertEqual(membership.current_medical_history_id, older.pk)
+
+        older.delete()
+        membership.refresh_from_db()
+        self.assertEqual(membership.current_medical_history_id, latest.pk)
+        self.assertEqual(membership.current_condition_flags, MedicalHistory.condition_mask(['smoker']))
+
+        PatientAccount.objects.filter(pk=membership.pk).update(current_medical_history=None, current_condition_flags=0)
+        PatientAccount.refresh_current_medical_history()
+        membership.refresh_from_db()
+        self.assertEqual(membership.current_medical_history_id, latest.pk)
+
+    def test_bitmask_screening_matches_boolean_filters(self):
+        rng = random.Random(7)
+        other_account, _ = create_account(2)
+        for n in range(40):
+            patient = create_patient(f'3000000{n:02d}')
+            for account in (self.account, other_account):
+                membership = PatientAccount.objects.create(patient=patient, account=account)
+                # Older versions must not count, only the latest one
+                for days_ago in range(rng.randint(0, 3), 0, -1):
+                    self.add_history(membership, days_ago=days_ago * 30, **{
+                        condition: rng.random() < 0.4 for condition in self.CONDITIONS
+                    })
+
+        current = 'clinic_memberships__current_medical_history__'
+        cases = [
+            (['allergies'], None),
+            (['allergies', 'diabetes'], None),
+            (None, ['asthma', 'smoker']),
+            (['diabetes', 'smoker'], ['allergies']),
+        ]
+        for any_of, all_of in cases:
+            with self.subTest(any_of=any_of, all_of=all_of):
+                # One filter() call so every condition applies to the same membership
+                match = Q(clinic_memberships__account=self.account)
+                if any_of:
+                    either = Q()
+                    for condition in any_of:
+                        either |= Q(**{current + condition: True})
+                    match &= either
+                for condition in all_of or ():
+                    match &= Q(**{current + condition: True})
+                expected = Patient.objects.filter(match)
+                self.assertEqual(
+                    set(patients_with_conditions(self.account, any_of, all_of).values_list('pk', flat=True)),
+                    set(expected.values_list('pk', flat=True))
+                )
+
+
+class CurrentMedicalHistoryTests(TestCase):
+    """Patient payloads nest the current history only, unless every version is asked for."""
+
+    def setUp(self):
+        self.account, self.owner = create_account()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def add_patient(self, id_number, versions):
+        patient = create_patient(id_number)
+        membership = PatientAccount.objects.create(patient=patient, account=self.account)
+        histories = [
+            MedicalHistory.objects.create(
+                patient_account=membership, created_at=timezone.now() - datetime.timedelta(days=days),
+                asthma=days == 0
+            )
+            for days in range(versions - 1, -1, -1)
+        ]
+        return patient, histories
+
+    def get(self, path, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params, HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id))
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_payloads_nest_the_current_history(self):
+        patient, histories = self.add_patient('200000001', 3)
+        data, _ = self.get(f'/api/clinic/patients/patients/{patient.pk}/')
+        membership, = data['clinic_memberships']
+        self.assertEqual(membership['current_medical_history']['id'], histories[-1].pk)
+        self.assertNotIn('medical_histories', membership)
+
+        data, _ = self.get(f'/api/clinic/patients/patients/{patient.pk}/', {'medical_histories': 'all'})
+        membership, = data['clinic_memberships']
+        self.assertEqual(len(membership['medical_histories']), 3)
+
+    def test_list_queries_do_not_grow_with_history(self):
+        self.add_patient('200000001', 1)
+        # The first request also loads the user's permissions
+        self.get('/api/clinic/patients/patients/')
+        _, few = self.get('/api/clinic/patients/patients/')
+        self.add_patient('200000002', 6)
+        self.add_patient('200000003', 4)
+        data, many = self.get('/api/clinic/patients/patients/')
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(few, many)
+
+    def test_history_endpoint_is_newest_first(self):
+        patient, histories = self.add_patient('200000001', 3)
+        data, _ = self.get(f'/api/clinic/patients/patients/{patient.pk}/medical_history/', {'page_size': 2})
+        self.assertEqual([row['id'] for row in data['results']], [histories[2].pk, histories[1].pk])
+        self.assertIsNotNone(data['next'])
+
+    def test_backfill_command(self):
+        patient, histories = self.add_patient('200000001', 2)
+        MedicalHistory.objects.update(condition_flags=0)
+        PatientAccount.objects.update(current_medical_history=None, current_condition_flags=0)
+
+        call_command('backfill_current_medical_histories', '--batch-size', '1', stdout=io.StringIO())
+        membership = PatientAccount.objects.get(patient=patient)
+        self.assertEqual(membership.current_medical_history_id, histories[-1].pk)
+        self.assertEqual(membership.current_condition_flags, MedicalHistory.condition_mask(['asthma']))
+        self.assertEqual(
+            MedicalHistory.objects.get(pk=histories[-1].pk).condition_flags, MedicalHistory.condition_mask(['asthma'])
+        )
@@ -9,5 +9,7 @@ router.register(r'patient-accounts', PatientAccountViewSet, basename='patient-ac
 router.register(r'medical-histories', MedicalHistoryViewSet, basename='medical-history')
 
 urlpatterns = [
+    # Type-ahead from the in-process prefix index
+    path('lookup/', PatientViewSet.as_view({'get': 'lookup'}), name='patient-lookup'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
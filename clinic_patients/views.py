@@ -1,11 +1,22 @@
 # clinic_patients/views.py - FIXED permission names to match permissions.py
+import hashlib
+import json
+from decimal import Decimal
+
 from rest_framework import viewsets, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef, Prefetch, Sum
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from platform_accounts.models import Account, AccountUser
 from core.permissions import AccountPermissionMixin, PatientAccessMixin
 from .models import Patient, PatientPhone, EmergencyContact, PatientAccount, MedicalHistory
+from .search import PatientSearchFilter, get_search_backend
+from .lookup_index import registry as lookup_registry
+from .importer import FIRST_ROW, PatientImporter, read_rows, summarize_reports
 from .serializers import (
     PatientSerializer, PatientCreateSerializer, PatientPhoneSerializer,
     EmergencyContactSerializer, PatientAccountSerializer, MedicalHistorySerializer
@@ -14,10 +25,24 @@ from .serializers import (
 class PatientViewSet(AccountPermissionMixin, PatientAccessMixin, viewsets.ModelViewSet):
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PatientSearchFilter, filters.OrderingFilter]
     filterset_fields = ['gender', 'marital_status', 'is_foreign', 'province', 'canton']
-    search_fields = ['first_name', 'last_name1', 'last_name2', 'id_number', 'email']
     ordering_fields = ['first_name', 'last_name1', 'birth_date']
+    
+    # Stable list order (search and ?ordering= replace it)
+    DEFAULT_ORDERING = ('last_name1', 'last_name2', 'first_name', 'id')
+    
+    # Results returned by the type-ahead endpoint
+    TYPEAHEAD_LIMIT = 10
+    
+    # Row errors returned by the import endpoint
+    IMPORT_ERROR_LIMIT = 100
+    
+    # Upcoming and recent treatments shown in the patient summary
+    SUMMARY_TREATMENT_LIMIT = 5
+    
+    # Fixed regardless of how much history the patient has
+    query_budget = {'summary': 10}
 
     def get_queryset(self):
         # Get account context
@@ -26,27 +51,52 @@ class PatientViewSet(AccountPermissionMixin, PatientAccessMixin, viewsets.ModelV
         if not account:
             # No account context - show patients from all user's accounts
             if self.request.user.is_superuser:
-                return Patient.objects.all()
+                return Patient.objects.order_by(*self.DEFAULT_ORDERING)
             else:
                 user_accounts = AccountUser.objects.filter(
                     user=self.request.user,
                     is_active_in_account=True
-                ).values_list('account', flat=True)
-                return Patient.objects.filter(
-                    clinic_memberships__account__in=user_accounts
-                ).distinct()
+                ).values('account')
+                return Patient.objects.filter(Exists(PatientAccount.objects.filter(
+                    patient=OuterRef('pk'),
+                    account__in=user_accounts
+                ))).order_by(*self.DEFAULT_ORDERING)
         
         # FIXED: Use consistent permission name from permissions.py
         if not self.check_permission('view_patients_list', account):
             return Patient.objects.none()
         
-        # Get base queryset for this account
-        base_queryset = Patient.objects.filter(
-            clinic_memberships__account=account
-        ).distinct()
+        # EXISTS semi-join on (account, patient) instead of JOIN + DISTINCT
+        base_queryset = Patient.objects.filter(Exists(PatientAccount.objects.filter(
+            account=account,
+            patient=OuterRef('pk')
+        ))).order_by(*self.DEFAULT_ORDERING)
         
         # Apply role-based filtering (doctors see only their patients)
-        return self.get_accessible_patients_queryset(base_queryset, account)
+        queryset = self.get_accessible_patients_queryset(base_queryset, account)
+        if self.action in ('list', 'retrieve', 'summary'):
+            queryset = queryset.prefetch_related(*self.get_prefetch_plan(account))
+        return queryset
+    
+    def get_prefetch_plan(self, account):
+        """
+        Prefetches for PatientSerializer: one query per relation per page.
+        Memberships are limited to the active account and carry the current
+        medical history unless every version was requested.
+        """
+        memberships = PatientAccount.objects.filter(account=account).select_related('current_medical_history')
+        if self.get_medical_histories_mode() == 'all':
+            memberships = memberships.prefetch_related('medical_histories')
+        return ['phones', 'emergency_contacts', Prefetch('clinic_memberships', queryset=memberships)]
+    
+    def get_medical_histories_mode(self):
+        # ?medical_histories=all nests every version instead of the current one
+        return self.request.query_params.get('medical_histories')
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['medical_histories'] = self.get_medical_histories_mode()
+        return context
     
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'update':
@@ -86,9 +136,83 @@ class PatientViewSet(AccountPermissionMixin, PatientAccessMixin, viewsets.ModelV
             
         return super().destroy(request, *args, **kwargs)
     
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_patients(self, request):
+        """
+        Bulk import patients from an uploaded CSV or XLSX file ('file').
+        Rows are validated and written in chunks (see importer.py); pass
+        'start_row' to resume after the last_row of an interrupted import.
+        """
+        account = self.get_account_context()
+        if not account:
+            return Response({'error': 'Account context required'}, status=400)
+        
+        permission_error = self.require_permission('manage_patients_basic', account)
+        if permission_error:
+            return permission_error
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=400)
+        
+        file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        try:
+            start_row = int(request.data.get('start_row') or FIRST_ROW)
+            rows = read_rows(upload, file_format)
+            importer = PatientImporter(account)
+            summary = summarize_reports(importer.run(rows, start_row=start_row), error_limit=self.IMPORT_ERROR_LIMIT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        return Response(summary)
+    
+    @action(detail=False, methods=['get'])
+    def typeahead(self, request):
+        """Top matches for ?q= (id number prefix or names) in a compact form."""
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response([])
+        
+        matches = get_search_backend().search(self.get_queryset(), term).values(
+            'id', 'first_name', 'last_name1', 'last_name2', 'id_number', 'birth_date'
+        )[:self.TYPEAHEAD_LIMIT]
+        
+        return Response([{
+            'id': match['id'],
+            'full_name': f"{match['first_name']} {match['last_name1']} {match['last_name2']}".strip(),
+            'id_number': match['id_number'],
+            'birth_date': match['birth_date'],
+        } for match in matches])
+    
+    def lookup(self, request):
+        """
+        Type-ahead answered from the in-process prefix index of the account
+        (routed at /api/clinic/patients/lookup/). Doctors limited to their
+        own patients are answered from the database instead.
+        """
+        account = self.get_account_context()
+        if not account:
+            return Response({'error': 'Account context required'}, status=400)
+        
+        if not self.check_permission('view_patients_list', account):
+            return Response(
+                {'error': 'Permission denied. Required permission: view_patients_list'}, 
+                status=403
+            )
+        
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response([])
+        
+        if self.is_doctor_scoped(account):
+            return self.typeahead(request)
+        
+        index = lookup_registry.get(account.pk)
+        return Response(index.lookup(term, limit=self.TYPEAHEAD_LIMIT))
+    
     @action(detail=True, methods=['get'])
     def medical_history(self, request, pk=None):
-        """Get patient medical history - requires view_patients_history permission."""
+        """Paginated medical history versions - requires view_patients_history permission."""
         account = self.get_account_context()
         
         # FIXED: Use consistent permission name from permissions.py
@@ -101,20 +225,126 @@ class PatientViewSet(AccountPermissionMixin, PatientAccessMixin, viewsets.ModelV
         patient = self.get_object()
         
         if account:
-            try:
-                patient_account = PatientAccount.objects.get(patient=patient, account=account)
-                histories = patient_account.medical_histories.all()
-                serializer = MedicalHistorySerializer(histories, many=True)
-                return Response(serializer.data)
-            except PatientAccount.DoesNotExist:
+            if not PatientAccount.objects.filter(patient=patient, account=account).exists():
                 return Response({"detail": "Patient not found in this clinic"}, status=404)
+            histories = MedicalHistory.objects.filter(patient_account__patient=patient, patient_account__account=account)
         else:
             # Admin view - all histories
             histories = MedicalHistory.objects.filter(
                 patient_account__patient=patient
             )
-            serializer = MedicalHistorySerializer(histories, many=True)
-            return Response(serializer.data)
+        
+        # Newest first, paginated (histories accumulate over the years)
+        page = self.paginate_queryset(histories.order_by('-created_at', '-pk'))
+        serializer = MedicalHistorySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """
+        Patient 360: demographics, current medical history, upcoming and
+        recent treatments, open balance and unpaid charges in one response.
+        Each section is included only when the caller's permissions allow it.
+        The ETag hashes the response itself, so any change to what it shows
+        (phones, contacts, an edited history) invalidates it.
+        """
+        account = self.get_account_context()
+        if not account:
+            return Response({'error': 'Account context required'}, status=400)
+        
+        patient = self.get_object()
+        membership = next(iter(patient.clinic_memberships.all()), None)
+        
+        data = {'id': patient.id, 'full_name': str(patient), 'id_number': patient.id_number}
+        
+        if self.can_view_patient_detail(account):
+            demographics = PatientSerializer(patient, context=self.get_serializer_context()).data
+            demographics.pop('clinic_memberships')
+            data['patient'] = demographics
+            if membership:
+                data['membership'] = {
+                    'admission_date': membership.admission_date,
+                    'referral_source': membership.referral_source,
+                    'consultation_reason': membership.consultation_reason,
+                    'receive_notifications': membership.receive_notifications,
+                }
+        
+        if self.can_access_patient_history(account):
+            history = membership and membership.current_medical_history
+            data['medical_history'] = history and MedicalHistorySerializer(history).data
+        
+        treatments = self.get_summary_treatments(patient, account)
+        if treatments is not None:
+            data['treatments'] = treatments
+        
+        billing = self.get_summary_billing(patient, account)
+        if billing is not None:
+            data['billing'] = billing
+        
+        # Nested rows (phones, contacts, charges) have no updated_at to compare
+        fingerprint = json.dumps([account.pk, request.user.pk, data], cls=DjangoJSONEncoder, sort_keys=True)
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers={'ETag': etag})
+        
+        return Response(data, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+    
+    def get_summary_treatments(self, patient, account):
+        """Upcoming and recent treatments (one query each), or None without permission."""
+        from clinic_treatments.models import Treatment
+        
+        if self.check_permission('view_treatments_list', account):
+            treatments = Treatment.objects.filter(account=account, patient=patient)
+        elif self.check_permission('view_treatments_assigned', account):
+            treatments = Treatment.objects.filter(account=account, patient=patient, doctor=self.request.user)
+        else:
+            return None
+        
+        now = timezone.now()
+        fields = ('id', 'scheduled_date', 'completed_date', 'status', 'catalog_item__name',
+                  'specialty__name', 'doctor_id', 'doctor__first_name', 'doctor__last_name',
+                  'location__name', 'updated_at')
+        upcoming = treatments.filter(
+            scheduled_date__gte=now, status__in=['SCHEDULED', 'RESCHEDULED']
+        ).order_by('scheduled_date').values(*fields)[:self.SUMMARY_TREATMENT_LIMIT]
+        recent = treatments.filter(
+            scheduled_date__lt=now
+        ).order_by('-scheduled_date').values(*fields)[:self.SUMMARY_TREATMENT_LIMIT]
+        return {'upcoming': list(upcoming), 'recent': list(recent)}
+    
+    def get_summary_billing(self, patient, account):
+        """Open balance and unpaid charges in the account (two queries), or None without permission."""
+        from clinic_billing.models import TreatmentCharge, Transaction
+        
+        if not self.check_permission('view_billing_list', account):
+            return None
+        
+        # The account's own ledger; other clinics' billing of a shared patient is not shown
+        balance = Transaction.objects.filter(account=account, patient=patient).aggregate(
+            total=Sum('amount')
+        )['total']
+        
+        charges = TreatmentCharge.objects.filter(
+            account=account, treatment__patient=patient,
+            status__in=TreatmentCharge.RECEIVABLE_STATUSES
+        ).order_by('date_created').values(
+            'id', 'treatment_id', 'treatment__catalog_item__name', 'date_created', 'amount', 'paid_amount',
+            'outstanding_amount'
+        )
+        
+        return {
+            'balance': balance if balance is not None else Decimal('0.00'),
+            'unpaid_charges': [{
+                'id': charge['id'],
+                'treatment': charge['treatment_id'],
+                'treatment_name': charge['treatment__catalog_item__name'],
+                'date': charge['date_created'],
+                'amount': charge['amount'],
+                'paid_amount': charge['paid_amount'],
+                'balance': charge['outstanding_amount'],
+            } for charge in charges],
+        }
     
     @action(detail=True, methods=['post'])
     def add_phone(self, request, pk=None):
@@ -180,6 +410,12 @@ class PatientAccountViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
     serializer_class = PatientAccountSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # ?medical_histories=all nests every version instead of the current one
+        context['medical_histories'] = self.request.query_params.get('medical_histories')
+        return context
+    
     def get_queryset(self):
         account = self.get_account_context()
         
@@ -188,7 +424,7 @@ class PatientAccountViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
             return PatientAccount.objects.none()
         
         if account:
-            return PatientAccount.objects.filter(account=account)
+            return PatientAccount.objects.filter(account=account).select_related('current_medical_history')
         else:
             # Fallback for admin users
             if self.request.user.is_superuser:
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ClinicTreatmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic_treatments'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,45 @@
+# clinic_treatments/management/commands/backfill_treatment_accounts.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from clinic_catalog.models import Specialty
+from clinic_treatments.models import Treatment, TreatmentNote, TreatmentDetail
+
+class Command(BaseCommand):
+    help = 'Fill the denormalized account of treatments, notes and details'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        # Treatments take the specialty's account; notes and details the treatment's
+        self.backfill(Treatment, Subquery(
+            Specialty.objects.filter(pk=OuterRef('specialty_id')).values('account_id')[:1]
+        ), options['batch_size'])
+
+        treatment_account = Subquery(
+            Treatment.objects.filter(pk=OuterRef('treatment_id')).values('account_id')[:1]
+        )
+        self.backfill(TreatmentNote, treatment_account, options['batch_size'])
+        self.backfill(TreatmentDetail, treatment_account, options['batch_size'])
+
+    def backfill(self, model, account_expression, batch_size):
+        name = model._meta.verbose_name_plural
+        updated = 0
+        last_id = 0
+        while True:
+            # Walk the primary key in batches to keep each transaction short
+            ids = list(model.objects.filter(
+                pk__gt=last_id,
+                account__isnull=True
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += model.objects.filter(pk__in=ids).update(account_id=account_expression)
+            last_id = ids[-1]
+            self.stdout.write(f"Backfilled {updated} {name}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated} {name} updated"))
@@ -0,0 +1,26 @@
+# clinic_treatments/management/commands/rebuild_doctor_patients.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from platform_accounts.models import Account
+from clinic_treatments.models import DoctorPatient
+
+class Command(BaseCommand):
+    help = 'Rebuild the doctor/patient links used to scope doctor patient lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', help='Only rebuild this account (account_id)')
+
+    def handle(self, *args, **options):
+        accounts = Account.objects.all()
+        if options['account']:
+            accounts = accounts.filter(account_id=options['account'])
+            if not accounts.exists():
+                raise CommandError(f"Account {options['account']} not found")
+
+        for account in accounts.order_by('pk'):
+            with transaction.atomic():
+                added, removed = DoctorPatient.rebuild(account=account)
+            self.stdout.write(f"{account.account_name}: {added} links added, {removed} removed")
+
+        self.stdout.write(self.style.SUCCESS('Done'))
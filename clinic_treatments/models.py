@@ -1,5 +1,6 @@
 # clinic_treatments/models.py
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
@@ -18,6 +19,15 @@ class Treatment(models.Model):
         ('CANCELED', _('Canceled')),
     ]
     
+    # Denormalized from specialty.account for tenant-scoped range scans
+    account = models.ForeignKey(
+        'platform_accounts.Account',
+        on_delete=models.CASCADE,
+        editable=False,
+        related_name='treatments',
+        verbose_name=_('account')
+    )
+    
     # Relationship to catalog and specialty
     catalog_item = models.ForeignKey('clinic_catalog.CatalogItem', on_delete=models.PROTECT, verbose_name=_('catalog item'))
     specialty = models.ForeignKey('clinic_catalog.Specialty', on_delete=models.PROTECT, verbose_name=_('specialty'))
@@ -72,6 +82,15 @@ class Treatment(models.Model):
     def __str__(self):
         return f"{self.catalog_item} for {self.patient} on {self.scheduled_date.date()}"
     
+    def save(self, *args, **kwargs):
+        # The denormalized account always matches the specialty's account
+        specialty_account_id = self.specialty.account_id
+        if self.account_id is None:
+            self.account_id = specialty_account_id
+        elif self.account_id != specialty_account_id:
+            raise ValidationError(_('The specialty belongs to a different account than the treatment.'))
+        super().save(*args, **kwargs)
+    
     def complete(self):
         """Mark the treatment as completed"""
         self.status = 'COMPLETED'
@@ -87,6 +106,10 @@ class Treatment(models.Model):
         verbose_name = _('treatment')
         verbose_name_plural = _('treatments')
         ordering = ['-scheduled_date']
+        indexes = [
+            models.Index(fields=['account', 'scheduled_date'], name='treatment_account_date_idx'),
+            models.Index(fields=['doctor', 'scheduled_date'], name='treatment_doctor_date_idx'),
+        ]
 
 class TreatmentNote(models.Model):
     """
@@ -100,6 +123,13 @@ class TreatmentNote(models.Model):
     ]
     
     treatment = models.ForeignKey(Treatment, on_delete=models.CASCADE, related_name='additional_notes', verbose_name=_('treatment'))
+    account = models.ForeignKey(
+        'platform_accounts.Account',
+        on_delete=models.CASCADE,
+        editable=False,
+        related_name='treatment_notes',
+        verbose_name=_('account')
+    )
     date = models.DateTimeField(_('date'), default=timezone.now)
     note = models.TextField(_('note'))
     type = models.CharField(_('type'), max_length=20, choices=NOTE_TYPE_CHOICES, default='MEDICAL')
@@ -119,10 +149,18 @@ class TreatmentNote(models.Model):
     def __str__(self):
         return f"{self.get_type_display()} for {self.treatment} on {self.date}"
     
+    def save(self, *args, **kwargs):
+        # Denormalized from the treatment for tenant filtering
+        self.account_id = self.treatment.account_id
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = _('treatment note')
         verbose_name_plural = _('treatment notes')
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['account', 'date'], name='treatmentnote_account_date_idx'),
+        ]
 
 class TreatmentScheduleHistory(models.Model):
     treatment = models.ForeignKey(Treatment, on_delete=models.CASCADE, related_name='schedule_history', verbose_name=_('treatment'))
@@ -149,13 +187,90 @@ class TreatmentDetail(models.Model):
         related_name='details',
         verbose_name=_('treatment')
     )
+    account = models.ForeignKey(
+        'platform_accounts.Account',
+        on_delete=models.CASCADE,
+        editable=False,
+        related_name='treatment_details',
+        verbose_name=_('account')
+    )
     field_name = models.CharField(_('field name'), max_length=100)
     field_value = models.TextField(_('field value'), blank=True)
     
     def __str__(self):
         return f"{self.field_name}: {self.field_value}"
     
+    def save(self, *args, **kwargs):
+        # Denormalized from the treatment for tenant filtering
+        self.account_id = self.treatment.account_id
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = _('treatment detail')
         verbose_name_plural = _('treatment details')
-        unique_together = ['treatment', 'field_name']  # Each field can appear only once per treatment
\ No newline at end of file
+        unique_together = ['treatment', 'field_name']  # Each field can appear only once per treatment
+
+
+class DoctorPatient(models.Model):
+    """
+    Patients a doctor has treatments with in an account.
+    Maintained from Treatment saves and deletes (see signals.py) so that
+    doctor-scoped patient lists are a single indexed EXISTS.
+    """
+    
+    # Treatment statuses that give a doctor access to the patient
+    TREATMENT_STATUSES = ['SCHEDULED', 'RESCHEDULED', 'IN_PROGRESS', 'COMPLETED']
+    
+    account = models.ForeignKey('platform_accounts.Account', on_delete=models.CASCADE, related_name='doctor_patients')
+    doctor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='doctor_patients')
+    patient = models.ForeignKey('clinic_patients.Patient', on_delete=models.CASCADE, related_name='doctor_links')
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.doctor} - {self.patient}"
+    
+    @classmethod
+    def sync(cls, account_id, doctor_id, patient_id):
+        """Add or remove one doctor/patient link from the current treatments."""
+        has_treatments = Treatment.objects.filter(
+            account_id=account_id,
+            doctor_id=doctor_id,
+            patient_id=patient_id,
+            status__in=cls.TREATMENT_STATUSES
+        ).exists()
+        
+        if has_treatments:
+            cls.objects.get_or_create(account_id=account_id, doctor_id=doctor_id, patient_id=patient_id)
+        else:
+            cls.objects.filter(account_id=account_id, doctor_id=doctor_id, patient_id=patient_id).delete()
+    
+    @classmethod
+    def rebuild(cls, account=None, batch_size=5000):
+        """Recompute every link (of one account) after bulk treatment changes."""
+        treatments = Treatment.objects.filter(status__in=cls.TREATMENT_STATUSES)
+        links = cls.objects.all()
+        if account is not None:
+            treatments = treatments.filter(account=account)
+            links = links.filter(account=account)
+        
+        expected = set(treatments.order_by().values_list('account_id', 'doctor_id', 'patient_id').distinct())
+        existing = dict(
+            ((account_id, doctor_id, patient_id), pk)
+            for pk, account_id, doctor_id, patient_id in links.values_list('pk', 'account_id', 'doctor_id', 'patient_id')
+        )
+        
+        stale = [pk for key, pk in existing.items() if key not in expected]
+        for start in range(0, len(stale), batch_size):
+            cls.objects.filter(pk__in=stale[start:start + batch_size]).delete()
+        
+        cls.objects.bulk_create([
+            cls(account_id=account_id, doctor_id=doctor_id, patient_id=patient_id)
+            for account_id, doctor_id, patient_id in expected - existing.keys()
+        ], batch_size=batch_size, ignore_conflicts=True)
+        
+        return len(expected - existing.keys()), len(stale)
+    
+    class Meta:
+        verbose_name = _('doctor patient')
+        verbose_name_plural = _('doctor patients')
+        unique_together = ['account', 'doctor', 'patient']
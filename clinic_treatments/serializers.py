@@ -49,6 +49,38 @@ class TreatmentSerializer(serializers.ModelSerializer):
                   'location_details', 'details', 'additional_notes', 'schedule_history')  # Add schedule_history here
         read_only_fields = ('created_at', 'updated_at', 'created_by')
 
+class TreatmentCompactSerializer(serializers.ModelSerializer):
+    """Lightweight list representation: ids plus display names"""
+    patient_name = serializers.SerializerMethodField()
+    patient_id_number = serializers.CharField(source='patient.id_number', read_only=True)
+    catalog_item_name = serializers.CharField(source='catalog_item.name', read_only=True)
+    specialty_name = serializers.CharField(source='specialty.name', read_only=True)
+    doctor_name = serializers.SerializerMethodField()
+    doctor_color = serializers.CharField(read_only=True)
+    location_name = serializers.CharField(source='location.name', read_only=True)
+    
+    class Meta:
+        model = Treatment
+        fields = ('id', 'patient', 'patient_name', 'patient_id_number', 'catalog_item', 'catalog_item_name',
+                  'specialty', 'specialty_name', 'doctor', 'doctor_name', 'doctor_color',
+                  'location', 'location_name', 'status', 'scheduled_date', 'completed_date',
+                  'parent_treatment', 'phase_number')
+        read_only_fields = fields
+    
+    def get_patient_name(self, obj):
+        return str(obj.patient)
+    
+    def get_doctor_name(self, obj):
+        return obj.doctor.get_full_name()
+
+class TreatmentCalendarSerializer(TreatmentCompactSerializer):
+    """Minimal representation for calendar views"""
+    
+    class Meta(TreatmentCompactSerializer.Meta):
+        fields = ('id', 'patient', 'patient_name', 'catalog_item_name', 'doctor', 'doctor_name',
+                  'doctor_color', 'location', 'location_name', 'status', 'scheduled_date')
+        read_only_fields = fields
+
 class TreatmentCreateSerializer(serializers.ModelSerializer):
     details = TreatmentDetailSerializer(many=True, required=False)
     
@@ -89,6 +121,12 @@ class TreatmentUpdateSerializer(serializers.ModelSerializer):
         # Make most fields optional for updates
         read_only_fields = ('created_at', 'updated_at', 'created_by')
     
+    def validate_specialty(self, value):
+        # Treatments cannot move to another account's specialty
+        if self.instance and value.account_id != self.instance.account_id:
+            raise serializers.ValidationError('Specialty belongs to a different account.')
+        return value
+    
     def update(self, instance, validated_data):
         details_data = validated_data.pop('details', None)
         
@@ -0,0 +1,36 @@
+# clinic_treatments/signals.py
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Treatment, DoctorPatient
+
+
+def _doctor_patient_key(instance):
+    # Read from __dict__ so deferred fields are never loaded here
+    values = instance.__dict__
+    return (values.get('account_id'), values.get('doctor_id'), values.get('patient_id'))
+
+
+@receiver(post_init, sender=Treatment)
+def remember_doctor_patient(sender, instance, **kwargs):
+    instance._doctor_patient_key = _doctor_patient_key(instance)
+
+
+@receiver(post_save, sender=Treatment)
+def sync_doctor_patient_on_save(sender, instance, **kwargs):
+    keys = {_doctor_patient_key(instance), instance._doctor_patient_key}
+    instance._doctor_patient_key = _doctor_patient_key(instance)
+
+    # Status changes can also add or remove the link
+    for account_id, doctor_id, patient_id in keys:
+        if account_id and doctor_id and patient_id:
+            DoctorPatient.sync(account_id, doctor_id, patient_id)
+
+
+@receiver(post_delete, sender=Treatment)
+def sync_doctor_patient_on_delete(sender, instance, **kwargs):
+    account_id, doctor_id, patient_id = _doctor_patient_key(instance)
+    if account_id and doctor_id and patient_id:
+        # After commit: a patient delete cascades into treatments
+        transaction.on_commit(lambda: DoctorPatient.sync(account_id, doctor_id, patient_id))
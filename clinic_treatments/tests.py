@@ -1,3 +1,374 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from platform_users.models import User
+from platform_accounts.models import Account, AccountOwner, AccountUser
+from platform_accounts.roles import AccountRoles
+from clinic_catalog.models import Specialty, CatalogItem
+from clinic_locations.models import Branch
+from clinic_patients.models import Patient, PatientPhone, EmergencyContact, PatientAccount, MedicalHistory
+from .models import Treatment, TreatmentNote, TreatmentDetail, TreatmentScheduleHistory, DoctorPatient
+from .serializers import TreatmentCalendarSerializer, TreatmentCompactSerializer
+from .views import TreatmentViewSet
+
+
+class TreatmentTestData(TestCase):
+    """An account with an owner, a doctor, a catalog item and a branch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            email='owner@example.com', id_number='100000001', id_type='01', password='x'
+        )
+        cls.doctor = User.objects.create_user(
+            email='doctor@example.com', id_number='100000002', id_type='01', password='x'
+        )
+        cls.account = Account.objects.create(
+            account_name='Clinic', account_email='clinic@example.com',
+            account_phone='22220000', account_address='Address'
+        )
+        other_account = Account.objects.create(
+            account_name='Other Clinic', account_email='other@example.com',
+            account_phone='22220001', account_address='Address'
+        )
+        AccountOwner.objects.create(user=cls.owner, account=cls.account)
+        AccountUser.objects.create(user=cls.owner, account=cls.account, role=AccountRoles.ADMINISTRATOR)
+        AccountUser.objects.create(user=cls.doctor, account=cls.account, role=AccountRoles.DOCTOR)
+
+        cls.specialty = Specialty.objects.create(account=cls.account, name='General', code='GEN')
+        cls.catalog_item = CatalogItem.objects.create(
+            account=cls.account, specialty=cls.specialty, code='GEN-01', name='Cleaning', price=1000
+        )
+        cls.branch = Branch.objects.create(
+            account=cls.account, name='Main', email='main@example.com', phone='22220002',
+            province='San José', canton='Central', district='Carmen', address='Address'
+        )
+        cls.other_account = other_account
+
+    def create_treatments(self, count):
+        for n in range(count):
+            patient = Patient.objects.create(
+                id_number=f'2000000{Treatment.objects.count():02d}', first_name='Ana', last_name1='Mora',
+                birth_date='1990-01-01', gender='F', marital_status='S',
+                province='San José', canton='Central', district='Carmen', address='Address'
+            )
+            PatientPhone.objects.create(patient=patient, phone_number='88880000')
+            EmergencyContact.objects.create(patient=patient, first_name='Luis', last_name1='Mora', phone='88880001')
+            for account in (self.account, self.other_account):
+                membership = PatientAccount.objects.create(patient=patient, account=account)
+                MedicalHistory.objects.create(patient_account=membership)
+
+            treatment = Treatment.objects.create(
+                catalog_item=self.catalog_item, specialty=self.specialty, patient=patient,
+                doctor=self.doctor, location=self.branch, created_by=self.owner
+            )
+            TreatmentDetail.objects.create(treatment=treatment, field_name='tooth', field_value='11')
+            TreatmentNote.objects.create(
+                treatment=treatment, note='Note', created_by=self.owner, assigned_doctor=self.doctor
+            )
+            TreatmentScheduleHistory.objects.create(treatment=treatment, scheduled_date=treatment.scheduled_date)
+
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class TreatmentListQueryCountTests(TreatmentTestData):
+    """Full-mode treatment lists must not run queries per treatment."""
+
+    def get_full_list(self):
+        client = APIClient()
+        client.force_authenticate(user=self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                '/api/clinic/treatments/treatments/', {'view': 'full'},
+                HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_full_list_query_count_is_constant(self):
+        self.create_treatments(2)
+        data, small_count = self.get_full_list()
+        self.assertEqual(len(data['results']), 2)
+
+        self.create_treatments(5)
+        data, large_count = self.get_full_list()
+        self.assertEqual(len(data['results']), 7)
+
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, TreatmentViewSet.query_budget['list'])
+
+    def test_full_list_only_includes_active_account_memberships(self):
+        self.create_treatments(1)
+        data, _ = self.get_full_list()
+        memberships = data['results'][0]['patient_details']['clinic_memberships']
+        self.assertEqual([membership['account'] for membership in memberships], [str(self.account.account_id)])
+        self.assertIsNotNone(memberships[0]['current_medical_history'])
+
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class TreatmentListViewTests(TreatmentTestData):
+    """?view= selects the list representation; lists default to compact."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+        AccountUser.objects.filter(user=self.doctor, account=self.account).update(color='#112233')
+
+    def get_list(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/clinic/treatments/treatments/', params or {},
+                HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], len(queries)
+
+    def test_compact_is_the_default(self):
+        self.create_treatments(2)
+        for params in ({}, {'view': 'compact'}, {'view': 'unknown'}):
+            with self.subTest(params=params):
+                results, _ = self.get_list(params)
+                self.assertEqual(len(results), 2)
+                self.assertEqual(set(results[0]), set(TreatmentCompactSerializer.Meta.fields))
+                self.assertEqual(results[0]['doctor_color'], '#112233')
+                self.assertEqual(results[0]['patient_name'], 'Ana Mora')
+
+    def test_light_views_query_count_is_constant(self):
+        self.create_treatments(2)
+        small_counts = {view: self.get_list({'view': view})[1] for view in ('compact', 'calendar')}
+        self.create_treatments(5)
+        for view, small_count in small_counts.items():
+            with self.subTest(view=view):
+                results, large_count = self.get_list({'view': view})
+                self.assertEqual(len(results), 7)
+                self.assertEqual(small_count, large_count)
+
+    def test_calendar_view_and_range(self):
+        self.create_treatments(3)
+        now = timezone.now()
+        treatments = list(Treatment.objects.order_by('pk'))
+        for days, treatment in zip((-10, 1, 30), treatments):
+            Treatment.objects.filter(pk=treatment.pk).update(scheduled_date=now + datetime.timedelta(days=days))
+
+        results, _ = self.get_list({
+            'view': 'calendar', 'start_date': now.isoformat(),
+            'end_date': (now + datetime.timedelta(days=7)).isoformat()
+        })
+        self.assertEqual([result['id'] for result in results], [treatments[1].pk])
+        self.assertEqual(set(results[0]), set(TreatmentCalendarSerializer.Meta.fields))
+
+    def test_retrieve_is_always_full(self):
+        self.create_treatments(1)
+        treatment = Treatment.objects.get()
+        response = self.client.get(
+            f'/api/clinic/treatments/treatments/{treatment.pk}/', {'view': 'compact'},
+            HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('patient_details', response.json())
+
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class TreatmentAccountTests(TreatmentTestData):
+    """Treatments, notes and details carry their clinic's account."""
+
+    def setUp(self):
+        self.create_treatments(1)
+        self.treatment = Treatment.objects.get()
+        self.other_specialty = Specialty.objects.create(account=self.other_account, name='General', code='GEN')
+
+    def test_account_follows_the_specialty(self):
+        self.assertEqual(self.treatment.account, self.account)
+        self.assertEqual(TreatmentNote.objects.get().account, self.account)
+        self.assertEqual(TreatmentDetail.objects.get().account, self.account)
+
+        self.treatment.specialty = self.other_specialty
+        with self.assertRaises(ValidationError):
+            self.treatment.save()
+
+    def test_specialty_cannot_move_to_another_account(self):
+        client = APIClient()
+        client.force_authenticate(user=self.owner)
+        response = client.patch(
+            f'/api/clinic/treatments/treatments/{self.treatment.pk}/', {'specialty': self.other_specialty.pk},
+            format='json', HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('specialty', response.json())
+
+    def test_lists_are_scoped_by_the_account_column(self):
+        client = APIClient()
+        client.force_authenticate(user=self.owner)
+        AccountOwner.objects.create(user=self.owner, account=self.other_account)
+        AccountUser.objects.create(user=self.owner, account=self.other_account, role=AccountRoles.ADMINISTRATOR)
+
+        for account, expected in ((self.account, 1), (self.other_account, 0)):
+            for path in ('treatments', 'treatment-notes', 'treatment-details'):
+                with self.subTest(account=account.account_name, path=path):
+                    response = client.get(
+                        f'/api/clinic/treatments/{path}/', HTTP_X_ACCOUNT_CONTEXT=str(account.account_id)
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()['results']), expected)
+
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class UserRoleInfoTests(TreatmentTestData):
+    """user_role_info lists every active role the user holds in the account."""
+
+    def get_role_info(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get(
+            '/api/clinic/treatments/treatments/user_role_info/',
+            HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_roles(self):
+        data = self.get_role_info(self.doctor)
+        self.assertEqual((data['roles'], data['is_doctor'], data['is_owner']), (['doc'], True, False))
+
+        data = self.get_role_info(self.owner)
+        self.assertEqual((data['roles'], data['is_doctor'], data['is_owner']), (['adm', 'owner'], True, True))
+
+    def test_every_role_is_listed(self):
+        # (user, account) memberships are not unique
+        AccountUser.objects.create(user=self.doctor, account=self.account, role=AccountRoles.ASSISTANT)
+        AccountUser.objects.create(
+            user=self.doctor, account=self.account, role=AccountRoles.READ_ONLY, is_active_in_account=False
+        )
+        data = self.get_role_info(self.doctor)
+        self.assertEqual(sorted(data['roles']), ['ast', 'doc'])
+        self.assertTrue(data['is_doctor'])
+
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class AgendaETagTests(TreatmentTestData):
+    """The agenda ETag changes with every value the events display."""
+
+    def setUp(self):
+        self.create_treatments(2)
+        self.treatment = Treatment.objects.order_by('pk').first()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.owner)
+
+    def get_agenda(self, etag=None):
+        start = self.treatment.scheduled_date - datetime.timedelta(days=1)
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/clinic/treatments/treatments/agenda/', {
+            'start': start.isoformat(), 'end': (start + datetime.timedelta(days=7)).isoformat()
+        }, HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id), **headers)
+
+    def assertRefreshed(self, etag):
+        response = self.get_agenda(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_unchanged_window_is_not_modified(self):
+        response = self.get_agenda()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['events']), 2)
+        self.assertEqual(self.get_agenda(response['ETag']).status_code, 304)
+
+    def test_displayed_relations_change_the_etag(self):
+        etag = self.get_agenda()['ETag']
+        updates = {
+            'patient': lambda: Patient.objects.get(pk=self.treatment.patient_id).save(),
+            'catalog item': lambda: CatalogItem.objects.get(pk=self.catalog_item.pk).save(),
+            'branch': lambda: Branch.objects.get(pk=self.branch.pk).save(),
+            'doctor name': lambda: User.objects.filter(pk=self.doctor.pk).update(first_name='Laura'),
+            'doctor color': lambda: AccountUser.objects.filter(
+                user=self.doctor, account=self.account
+            ).update(color='#123456'),
+        }
+        for name, update in updates.items():
+            with self.subTest(name):
+                update()
+                etag = self.assertRefreshed(etag)['ETag']
+
+        event = self.get_agenda().data['events'][0]
+        self.assertEqual((event['doctor_name'], event['doctor_color']), ('Laura', '#123456'))
+
+
+class DoctorPatientSignalTests(TreatmentTestData):
+    """Treatment saves and deletes keep the doctor/patient links current."""
+
+    def setUp(self):
+        self.other_doctor = User.objects.create_user(
+            email='doctor2@example.com', id_number='100000003', id_type='01', password='x'
+        )
+        AccountUser.objects.create(user=self.other_doctor, account=self.account, role=AccountRoles.DOCTOR)
+        self.patients = [
+            Patient.objects.create(
+                id_number=f'30000000{n}', first_name='Ana', last_name1='Mora',
+                birth_date='1990-01-01', gender='F', marital_status='S',
+                province='San José', canton='Central', district='Carmen', address='Address'
+            )
+            for n in range(2)
+        ]
+
+    def create_treatment(self, doctor=None, patient=None):
+        return Treatment.objects.create(
+            catalog_item=self.catalog_item, specialty=self.specialty, patient=patient or self.patients[0],
+            doctor=doctor or self.doctor, location=self.branch, created_by=self.owner
+        )
+
+    def links(self):
+        return set(DoctorPatient.objects.values_list('account_id', 'doctor_id', 'patient_id'))
+
+    def link(self, doctor, patient):
+        return (self.account.pk, doctor.pk, patient.pk)
+
+    def test_reassigning_doctor_moves_the_link(self):
+        treatment = self.create_treatment()
+        self.assertEqual(self.links(), {self.link(self.doctor, self.patients[0])})
+
+        treatment = Treatment.objects.get(pk=treatment.pk)
+        treatment.doctor = self.other_doctor
+        treatment.save()
+        self.assertEqual(self.links(), {self.link(self.other_doctor, self.patients[0])})
+
+    def test_reassigning_patient_moves_the_link(self):
+        treatment = self.create_treatment()
+        treatment.patient = self.patients[1]
+        treatment.save()
+        self.assertEqual(self.links(), {self.link(self.doctor, self.patients[1])})
+
+    def test_link_stays_while_another_treatment_remains(self):
+        first = self.create_treatment()
+        self.create_treatment()
+        first.doctor = self.other_doctor
+        first.save()
+        self.assertEqual(self.links(), {
+            self.link(self.doctor, self.patients[0]), self.link(self.other_doctor, self.patients[0])
+        })
+
+    def test_deleting_treatments_removes_the_link(self):
+        first = self.create_treatment()
+        second = self.create_treatment()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.links(), {self.link(self.doctor, self.patients[0])})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.links(), set())
+
+    def test_canceling_removes_the_link(self):
+        treatment = self.create_treatment()
+        treatment.status = 'CANCELED'
+        treatment.save()
+        self.assertEqual(self.links(), set())
@@ -1,15 +1,24 @@
 # clinic_treatments/views.py - UPDATED with consistent permission checks
+import datetime
+import hashlib
+
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Count, Max, OuterRef, Prefetch, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags, quote_etag
 from platform_accounts.models import Account, AccountOwner, AccountUser
 from platform_users.models import User
 from core.permissions import AccountPermissionMixin
+from clinic_patients.models import PatientAccount
 from .models import Treatment, TreatmentNote, TreatmentDetail, TreatmentScheduleHistory
 from .serializers import (
-    TreatmentSerializer, TreatmentCreateSerializer, TreatmentUpdateSerializer,
-    TreatmentNoteSerializer, TreatmentDetailSerializer, TreatmentScheduleHistorySerializer
+    TreatmentSerializer, TreatmentCompactSerializer, TreatmentCalendarSerializer,
+    TreatmentCreateSerializer, TreatmentUpdateSerializer, TreatmentNoteSerializer,
+    TreatmentDetailSerializer, TreatmentScheduleHistorySerializer
 )
 
 class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
@@ -21,6 +30,27 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
     search_fields = ['patient__first_name', 'patient__last_name1', 'patient__id_number', 'catalog_item__name', 'notes']
     ordering_fields = ['scheduled_date', 'completed_date', 'status']
     
+    # Constant regardless of page size (see get_full_prefetch_plan)
+    query_budget = {'list': 12, 'retrieve': 12, 'agenda': 7}
+    
+    # Longest time window served by the agenda endpoint
+    AGENDA_MAX_DAYS = 62
+    
+    # List representations selectable with ?view= (retrieve always uses full)
+    LIST_VIEWS = {
+        'compact': TreatmentCompactSerializer,
+        'calendar': TreatmentCalendarSerializer,
+        'full': TreatmentSerializer,
+    }
+    DEFAULT_LIST_VIEW = 'compact'
+    
+    def get_list_view(self):
+        """Get the requested list representation (full for non-list actions)."""
+        if self.action != 'list':
+            return 'full'
+        view = self.request.query_params.get('view', self.DEFAULT_LIST_VIEW)
+        return view if view in self.LIST_VIEWS else self.DEFAULT_LIST_VIEW
+    
     def get_queryset(self):
         # Get account context
         account = self.get_account_context()
@@ -32,11 +62,8 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
             return Treatment.objects.none()
 
         # Start with base queryset filtered by account
-        queryset = Treatment.objects.filter(
-            specialty__account=account
-        ).select_related(
-            'patient', 'catalog_item', 'specialty', 'doctor', 'created_by', 'location'
-        )
+        queryset = Treatment.objects.filter(account=account)
+        queryset = self.apply_list_view_loading(queryset, account)
 
         # Apply permission-based filtering
         queryset = self.apply_treatment_permissions_filter(queryset, account)
@@ -50,6 +77,52 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
         
         return queryset
     
+    def apply_list_view_loading(self, queryset, account):
+        """Load only the relations needed by the selected representation."""
+        view = self.get_list_view()
+        
+        if view == 'full':
+            return queryset.select_related(
+                'patient', 'catalog_item__account', 'catalog_item__specialty__account',
+                'specialty__account', 'doctor', 'created_by', 'location__account'
+            ).prefetch_related(*self.get_full_prefetch_plan(account))
+        
+        queryset = self.annotate_doctor_color(queryset, account)
+        
+        if view == 'calendar':
+            return queryset.select_related('patient', 'catalog_item', 'doctor', 'location')
+        return queryset.select_related('patient', 'catalog_item', 'specialty', 'doctor', 'location')
+    
+    def annotate_doctor_color(self, queryset, account):
+        """Doctor color comes from the doctor's membership in this account."""
+        return queryset.annotate(
+            doctor_color=Subquery(AccountUser.objects.filter(
+                user=OuterRef('doctor'),
+                account=account
+            ).values('color')[:1])
+        )
+    
+    def get_full_prefetch_plan(self, account):
+        """
+        Prefetches for the nested relations of TreatmentSerializer.
+        One query per relation regardless of how many treatments are loaded;
+        patient clinic memberships are limited to the active account
+        and carry only their current medical history.
+        """
+        return [
+            Prefetch('details', queryset=TreatmentDetail.objects.all()),
+            Prefetch('additional_notes', queryset=TreatmentNote.objects.select_related(
+                'created_by', 'assigned_doctor'
+            )),
+            Prefetch('schedule_history', queryset=TreatmentScheduleHistory.objects.all()),
+            Prefetch('location__rooms'),
+            Prefetch('patient__phones'),
+            Prefetch('patient__emergency_contacts'),
+            Prefetch('patient__clinic_memberships', queryset=PatientAccount.objects.filter(
+                account=account
+            ).select_related('current_medical_history')),
+        ]
+    
     def has_treatment_view_permission(self, account):
         """Check if user has any treatment view permission."""
         return self.check_permission('view_treatments_list', account) or \
@@ -100,6 +173,8 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
             return TreatmentCreateSerializer
         elif self.action in ['update', 'partial_update']:
             return TreatmentUpdateSerializer
+        elif self.action == 'list':
+            return self.LIST_VIEWS[self.get_list_view()]
         return TreatmentSerializer
     
     def create(self, request, *args, **kwargs):
@@ -161,27 +236,16 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
             if not account:
                 return Response({'error': 'No account context'}, status=400)
             
-            # Check if user is a doctor in this account
-            user_is_doctor = AccountUser.objects.filter(
-                user=request.user,
-                account=account,
-                role='doc',
-                is_active_in_account=True
-            ).exists()
-            
-            # Check if user is an owner (owners can act as doctors)
-            user_is_owner = AccountOwner.objects.filter(
-                user=request.user,
-                account=account,
-                is_active=True
-            ).exists()
-            
-            # Get user's roles in this account
+            # Get user's roles in this account (a user may hold several)
             user_roles = list(AccountUser.objects.filter(
                 user=request.user,
                 account=account,
                 is_active_in_account=True
             ).values_list('role', flat=True))
+            user_is_doctor = 'doc' in user_roles
+            
+            # Ownership comes from the resolved permission set (owners can act as doctors)
+            user_is_owner = self.is_account_owner(account)
             
             if user_is_owner:
                 user_roles.append('owner')
@@ -319,6 +383,119 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=500)
     
+    def parse_agenda_bound(self, value):
+        """Parse an ISO date or datetime into an aware datetime."""
+        if not value:
+            return None
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                day = parse_date(value)
+                if day is None:
+                    return None
+                parsed = datetime.datetime.combine(day, datetime.time.min)
+        except ValueError:
+            return None
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+    
+    @action(detail=False, methods=['get'])
+    def agenda(self, request):
+        """
+        Lightweight calendar events between `start` and `end`, optionally for
+        one `doctor` and/or `location` (branch).
+        Supports conditional GET: a matching If-None-Match returns 304.
+        """
+        account = self.get_account_context()
+        if not account:
+            return Response({'error': 'Account context required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not self.has_treatment_view_permission(account):
+            return Response(
+                {'error': 'Permission denied. You do not have permission to view treatments.'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        start = self.parse_agenda_bound(request.query_params.get('start'))
+        end = self.parse_agenda_bound(request.query_params.get('end'))
+        if not start or not end or end <= start:
+            return Response(
+                {'error': 'start and end are required (ISO dates or datetimes) and end must be after start'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end - start > datetime.timedelta(days=self.AGENDA_MAX_DAYS):
+            return Response(
+                {'error': f'The agenda window cannot exceed {self.AGENDA_MAX_DAYS} days'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Served by the (account, scheduled_date) index
+        queryset = Treatment.objects.filter(
+            account=account,
+            scheduled_date__gte=start,
+            scheduled_date__lt=end
+        )
+        queryset = self.apply_treatment_permissions_filter(queryset, account)
+        
+        filters_applied = {}
+        for param, field in (('doctor', 'doctor_id'), ('location', 'location_id')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    filters_applied[field] = int(value)
+                except ValueError:
+                    return Response({'error': f'Invalid {param}'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(**filters_applied)
+        
+        # The window changes whenever a treatment in it is added, removed or updated,
+        # or a patient, catalog item or branch it shows is edited
+        state = queryset.order_by().aggregate(
+            count=Count('id'),
+            last_updated=Max('updated_at'),
+            patient_updated=Max('patient__updated_at'),
+            catalog_item_updated=Max('catalog_item__updated_at'),
+            location_updated=Max('location__updated_at'),
+        )
+        # Users and memberships keep no updated_at: use the doctors' displayed values
+        doctors = list(self.annotate_doctor_color(queryset, account).order_by('doctor_id').values_list(
+            'doctor_id', 'doctor__first_name', 'doctor__last_name', 'doctor_color'
+        ).distinct())
+        fingerprint = ':'.join(str(part) for part in (
+            account.pk, request.user.pk, start.isoformat(), end.isoformat(),
+            sorted(filters_applied.items()), sorted(state.items()), doctors
+        ))
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        rows = self.annotate_doctor_color(queryset, account).order_by('scheduled_date').values(
+            'id', 'scheduled_date', 'completed_date', 'status', 'patient_id', 'patient__first_name',
+            'patient__last_name1', 'patient__last_name2', 'catalog_item__name', 'doctor_id',
+            'doctor__first_name', 'doctor__last_name', 'doctor_color', 'location_id', 'location__name'
+        )
+        
+        events = [{
+            'id': row['id'],
+            'start': timezone.localtime(row['scheduled_date']),
+            'completed': row['completed_date'] and timezone.localtime(row['completed_date']),
+            'status': row['status'],
+            'title': row['catalog_item__name'],
+            'patient': row['patient_id'],
+            'patient_name': f"{row['patient__first_name']} {row['patient__last_name1']} {row['patient__last_name2']}".strip(),
+            'doctor': row['doctor_id'],
+            'doctor_name': f"{row['doctor__first_name']} {row['doctor__last_name']}".strip(),
+            'doctor_color': row['doctor_color'],
+            'location': row['location_id'],
+            'location_name': row['location__name'],
+        } for row in rows]
+        
+        return Response(
+            {'start': timezone.localtime(start), 'end': timezone.localtime(end), 'count': len(events), 'events': events},
+            headers={'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        )
+    
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         """Mark treatment as completed."""
@@ -414,19 +591,10 @@ class TreatmentViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
             
             if account:
                 # Check if user is a doctor in this account
-                user_is_doctor = AccountUser.objects.filter(
-                    user=request.user,
-                    account=account,
-                    role='doc',
-                    is_active_in_account=True
-                ).exists()
+                user_is_doctor = self.get_user_role_in_account(account) == 'doc'
                 
                 # Also check if user is an owner (owners can act as doctors)
-                user_is_owner = AccountOwner.objects.filter(
-                    user=request.user,
-                    account=account,
-                    is_active=True
-                ).exists()
+                user_is_owner = self.is_account_owner(account)
                 
                 user_is_doctor = user_is_doctor or user_is_owner
             
@@ -470,7 +638,7 @@ class TreatmentNoteViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
 
         # Start with base queryset filtered by account
         queryset = TreatmentNote.objects.filter(
-            treatment__specialty__account=account
+            account=account
         ).select_related('treatment', 'created_by', 'assigned_doctor')
         
         # Apply permission-based filtering
@@ -549,7 +717,7 @@ class TreatmentDetailViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
 
         # Start with base queryset filtered by account
         queryset = TreatmentDetail.objects.filter(
-            treatment__specialty__account=account
+            account=account
         ).select_related('treatment')
         
         # Apply permission-based filtering
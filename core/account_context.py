@@ -0,0 +1,110 @@
+# core/account_context.py
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from platform_accounts.models import Account
+from platform_accounts import effective_permissions
+from core.tracing import get_tracer
+
+tracer = get_tracer(__name__)
+
+ACCOUNT_HEADER = 'X-Account-Context'
+ACCOUNT_KEY = 'account_context:account:{account_id}:{account_version}'
+
+
+def _get_http_request(request):
+    """Return the underlying Django HttpRequest for DRF Request objects."""
+    return getattr(request, '_request', request)
+
+
+def _parse_account_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_account(account_id):
+    """
+    Get an Account by id through a short-lived cache.
+    Entries are keyed by the account version counter, so account,
+    membership and grant changes make them unreachable immediately.
+    """
+    timeout = getattr(settings, 'ACCOUNT_CONTEXT_CACHE_TIMEOUT', 60)
+    if not timeout:
+        return Account.objects.filter(account_id=account_id).first()
+
+    _, account_version = effective_permissions.get_versions(account_id)
+    key = ACCOUNT_KEY.format(account_id=account_id, account_version=account_version)
+
+    account = cache.get(key)
+    if account is None:
+        account = Account.objects.filter(account_id=account_id).first()
+        if account is not None:
+            cache.set(key, account, timeout=timeout)
+    return account
+
+
+def get_request_permissions(request, account):
+    """
+    Get the user's effective permissions in an account.
+    Loaded once per (user, account) and memoized on the request.
+    """
+    http_request = _get_http_request(request)
+    memo = http_request.__dict__.setdefault('_effective_permissions', {})
+
+    key = (request.user.pk, account.pk)
+    if key not in memo:
+        memo[key] = effective_permissions.get_effective_permissions(request.user, account)
+    return memo[key]
+
+
+def resolve_account_context(request):
+    """
+    Validate the X-Account-Context header once per request.
+    Returns the Account when the user is staff/superuser or an active member,
+    otherwise None. The result is attached to the request as `account` and
+    the membership as `account_permissions`.
+    """
+    http_request = _get_http_request(request)
+    user = request.user
+    header = request.headers.get(ACCOUNT_HEADER)
+
+    memo = http_request.__dict__.setdefault('_account_context', {})
+    key = (user.pk, header)
+    if key in memo:
+        return memo[key]
+
+    account = None
+    permissions = None
+
+    account_id = _parse_account_id(header) if header else None
+    if account_id and user.is_authenticated:
+        try:
+            account = _load_account(account_id)
+        except ValidationError:
+            account = None
+
+        if account is not None:
+            permissions = get_request_permissions(request, account)
+
+            # Staff/superuser can use any account; others must be active members
+            if not (user.is_staff or user.is_superuser or permissions.is_member):
+                account = None
+                permissions = None
+
+    tracer.trace(
+        'account_context.resolved',
+        header=header,
+        user=user.pk,
+        account=lambda: account.account_name if account else None,
+        is_owner=lambda: permissions.is_owner if permissions else None,
+        role=lambda: permissions.role if permissions else None
+    )
+
+    memo[key] = account
+    http_request.account = account
+    http_request.account_permissions = permissions
+    return account
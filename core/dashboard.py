@@ -11,15 +11,19 @@ from clinic_treatments.models import Treatment
 from platform_accounts.models import Account, AccountUser
 from platform_contracts.models import Contract
 from platform_users.models import User
+from core.account_context import resolve_account_context
+from core.tracing import get_tracer
+import logging
+
+logger = logging.getLogger(__name__)
+tracer = get_tracer(__name__)
 
 def get_account_context(request):
     """
-    Extract account context from request headers - handles UUID strings
+    Get the validated account from the X-Account-Context header.
+    Uses the shared per-request resolver (None if missing or not accessible).
     """
-    account_id = request.headers.get('X-Account-Context')
-    if account_id:
-        return account_id  # Return as string since it's UUID
-    return None
+    return resolve_account_context(request)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -89,7 +93,7 @@ def dashboard_stats(request):
                     'days_remaining': (contract.end_date.date() - datetime.datetime.now().date()).days
                 } for contract in expiring_contracts]
             except Exception as e:
-                print(f"DEBUG Dashboard: Error getting expiring contracts: {e}")
+                logger.warning(f"Error getting expiring contracts: {e}")
                 expiring_contracts_data = []
             
             # Response with admin statistics
@@ -111,11 +115,9 @@ def dashboard_stats(request):
         else:
             # Regular user - show account-specific stats
             # GET THE SPECIFIC ACCOUNT FROM HEADER (UUID STRING)
-            account_id = get_account_context(request)
-            
-            print(f"DEBUG Dashboard: account_id from header = {account_id}")
+            account_header = request.headers.get('X-Account-Context')
             
-            if not account_id:
+            if not account_header:
                 # No account selected - return zeros
                 return Response({
                     'isStaff': False,
@@ -126,16 +128,10 @@ def dashboard_stats(request):
                     'error': 'No account selected'
                 })
             
-            # Verify user has access to this account (UUID comparison)
-            try:
-                account_user = AccountUser.objects.get(
-                    user=request.user,
-                    account__account_id=account_id,  # UUID field comparison
-                    is_active_in_account=True
-                )
-                print(f"DEBUG Dashboard: User has access to account {account_user.account.account_name}")
-            except AccountUser.DoesNotExist:
-                print(f"DEBUG Dashboard: User does not have access to account {account_id}")
+            # Verify user has access to this account (validated once per request)
+            account = get_account_context(request)
+            if account is None:
+                tracer.trace('dashboard.access_denied', header=account_header, user=request.user.pk)
                 return Response({
                     'isStaff': False,
                     'patients': 0,
@@ -144,40 +140,38 @@ def dashboard_stats(request):
                     'pendingPayments': 0,
                     'error': 'Access denied to this account'
                 })
+            account_id = account.account_id
             
             try:
                 # Patients count - ONLY for the selected account (UUID)
                 try:
                     patients_count = PatientAccount.objects.filter(
-                        account__account_id=account_id  # UUID field comparison
+                        account=account
                     ).count()
-                    print(f"DEBUG Dashboard: patients_count = {patients_count}")
                 except Exception as e:
-                    print(f"DEBUG Dashboard: Error counting patients: {e}")
+                    logger.warning(f"Error counting patients: {e}")
                     patients_count = 0
                 
                 # Active treatments count - ONLY for the selected account (UUID)
                 try:
                     active_treatments = Treatment.objects.filter(
-                        specialty__account__account_id=account_id,  # UUID field comparison
+                        account=account,
                         status__in=['SCHEDULED', 'IN_PROGRESS']
                     ).count()
-                    print(f"DEBUG Dashboard: active_treatments = {active_treatments}")
                 except Exception as e:
-                    print(f"DEBUG Dashboard: Error counting treatments: {e}")
+                    logger.warning(f"Error counting treatments: {e}")
                     active_treatments = 0
                 
                 # Upcoming appointments - ONLY for the selected account (UUID)
                 try:
                     today = datetime.datetime.now()
                     upcoming_appointments = Treatment.objects.filter(
-                        specialty__account__account_id=account_id,  # UUID field comparison
+                        account=account,
                         status='SCHEDULED',
                         scheduled_date__gte=today
                     ).count()
-                    print(f"DEBUG Dashboard: upcoming_appointments = {upcoming_appointments}")
                 except Exception as e:
-                    print(f"DEBUG Dashboard: Error counting appointments: {e}")
+                    logger.warning(f"Error counting appointments: {e}")
                     upcoming_appointments = 0
                 
                 # Pending payments AMOUNT - ONLY for the selected account (UUID)
@@ -190,20 +184,26 @@ def dashboard_stats(request):
                         from clinic_billing.models import TreatmentCharge
                         from django.db.models import Sum
                         
+                        # Outstanding part of unpaid and partially paid charges
                         pending_payments_amount = TreatmentCharge.objects.filter(
-                            treatment__specialty__account__account_id=account_id  # UUID field comparison
-                        ).exclude(
-                            payment_allocations__isnull=False
-                        ).aggregate(total=Sum('amount'))['total'] or 0
-                        
-                        print(f"DEBUG Dashboard: pending_payments_amount = {pending_payments_amount}")
+                            account=account,
+                            status__in=TreatmentCharge.RECEIVABLE_STATUSES
+                        ).aggregate(total=Sum('outstanding_amount'))['total'] or 0
                     else:
                         pending_payments_amount = 0
-                        print("DEBUG Dashboard: clinic_billing app not installed, setting pending_payments_amount = 0")
                 except Exception as e:
-                    print(f"DEBUG Dashboard: Error calculating payment amounts: {e}")
+                    logger.warning(f"Error calculating payment amounts: {e}")
                     pending_payments_amount = 0
                 
+                tracer.trace(
+                    'dashboard.stats',
+                    account=account.account_name,
+                    patients=patients_count,
+                    active_treatments=active_treatments,
+                    upcoming_appointments=upcoming_appointments,
+                    pending_payments_amount=pending_payments_amount
+                )
+                
                 response_data = {
                     'isStaff': False,
                     'patients': patients_count,
@@ -211,11 +211,11 @@ def dashboard_stats(request):
                     'upcomingAppointments': upcoming_appointments,
                     'pendingPaymentsAmount': pending_payments_amount,
                     'selectedAccountId': account_id,  # For debugging
-                    'debug': f"Account: {account_user.account.account_name}"
+                    'debug': f"Account: {account.account_name}"
                 }
                 
             except Exception as e:
-                print(f"Error in dashboard_stats for regular user: {str(e)}")
+                logger.exception(f"Error in dashboard_stats for regular user: {str(e)}")
                 response_data = {
                     'isStaff': False,
                     'patients': 0,
@@ -228,7 +228,7 @@ def dashboard_stats(request):
         return Response(response_data)
         
     except Exception as e:
-        print(f"Unhandled error in dashboard_stats: {str(e)}")
+        logger.exception(f"Unhandled error in dashboard_stats: {str(e)}")
         return Response({'error': 'An error occurred while fetching dashboard data'}, status=500)
 
 @api_view(['GET'])
@@ -0,0 +1,55 @@
+# core/diagnostics.py
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from core.tracing import get_sample_rates, set_sample_rate, reset_sample_rates
+from core import performance
+
+@api_view(['GET', 'POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def tracing_settings(request):
+    """
+    View or change tracing sample rates at runtime - staff only.
+    POST {"sample_rate": 0.1, "module": "clinic_catalog.views"} (module optional)
+    DELETE resets to the TRACING_SAMPLE_RATE setting.
+    """
+    if not request.user.is_staff:
+        return Response({"error": "You don't have permission to access this resource"}, status=403)
+    
+    if request.method == 'POST':
+        try:
+            rate = float(request.data.get('sample_rate'))
+        except (TypeError, ValueError):
+            return Response({'error': 'sample_rate must be a number between 0 and 1'}, status=400)
+        
+        if not 0 <= rate <= 1:
+            return Response({'error': 'sample_rate must be a number between 0 and 1'}, status=400)
+        
+        set_sample_rate(rate, request.data.get('module') or None)
+    elif request.method == 'DELETE':
+        reset_sample_rates()
+    
+    return Response({'sample_rates': get_sample_rates()})
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def performance_metrics(request):
+    """
+    Dump this process's per-endpoint metrics buffer - staff only.
+    Query params: summary=1, url_name=<name>, output=json|csv.
+    DELETE clears the buffer.
+    """
+    if not request.user.is_staff:
+        return Response({"error": "You don't have permission to access this resource"}, status=403)
+    
+    if request.method == 'DELETE':
+        performance.buffer.clear()
+        return Response(status=204)
+    
+    records = performance.buffer.snapshot(request.query_params.get('url_name'))
+    rows = performance.summarize(records) if request.query_params.get('summary') else records
+    
+    if request.query_params.get('output') == 'csv':
+        return HttpResponse(performance.to_csv(rows), content_type='text/csv')
+    return Response(rows)
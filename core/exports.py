@@ -0,0 +1,201 @@
+# core/exports.py
+import csv
+import datetime
+import decimal
+import io
+import json
+import uuid
+import zlib
+
+from django.apps import apps
+from django.db.models import FilteredRelation, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.permissions import AccountPermissionMixin, PatientAccessMixin
+
+# Rows fetched per database round trip and rendered per streamed chunk
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+PATIENT_EXPORT_FIELDS = (
+    'id', 'id_number', 'is_foreign', 'first_name', 'last_name1', 'last_name2', 'birth_date',
+    'gender', 'marital_status', 'email', 'province', 'canton', 'district', 'address',
+    'clinic_membership__admission_date', 'clinic_membership__referral_source',
+    'clinic_membership__consultation_reason', 'clinic_membership__receive_notifications',
+    'created_at', 'updated_at',
+)
+
+TREATMENT_EXPORT_FIELDS = (
+    'id', 'scheduled_date', 'completed_date', 'status', 'phase_number', 'parent_treatment_id',
+    'patient_id', 'patient__id_number', 'patient__first_name', 'patient__last_name1', 'patient__last_name2',
+    'catalog_item_id', 'catalog_item__name', 'specialty__name',
+    'doctor_id', 'doctor__first_name', 'doctor__last_name', 'location__name',
+    'notes', 'created_at', 'updated_at',
+)
+
+TRANSACTION_EXPORT_FIELDS = (
+    'id', 'date', 'transaction_type', 'payment_method', 'amount', 'description', 'notes',
+    'patient_id', 'patient__id_number', 'patient__first_name', 'patient__last_name1',
+    'treatment_charge_id', 'treatment_charge__treatment_id',
+)
+
+
+def get_patient_export_queryset(account):
+    # One join, limited to the account's membership, both scopes the rows and
+    # supplies the clinic_membership__ fields, so other clinics' data never shows
+    Patient = apps.get_model('clinic_patients', 'Patient')
+    return Patient.objects.annotate(
+        clinic_membership=FilteredRelation('clinic_memberships', condition=Q(clinic_memberships__account=account))
+    ).filter(clinic_membership__isnull=False)
+
+
+def get_treatment_export_queryset(account):
+    Treatment = apps.get_model('clinic_treatments', 'Treatment')
+    return Treatment.objects.filter(account=account)
+
+
+def get_transaction_export_queryset(account):
+    Transaction = apps.get_model('clinic_billing', 'Transaction')
+    return Transaction.objects.filter(account=account)
+
+
+# dataset -> (account-wide queryset, fields, permission required besides export_reports)
+EXPORT_DATASETS = {
+    'patients': (get_patient_export_queryset, PATIENT_EXPORT_FIELDS, 'view_patients_list'),
+    'treatments': (get_treatment_export_queryset, TREATMENT_EXPORT_FIELDS, None),
+    'transactions': (get_transaction_export_queryset, TRANSACTION_EXPORT_FIELDS, 'view_billing_list'),
+}
+
+
+def export_value(value):
+    """JSON/CSV friendly value; datetimes in the clinic's local time."""
+    if isinstance(value, datetime.datetime):
+        return (timezone.localtime(value) if timezone.is_aware(value) else value).isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def iter_export_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Value tuples in primary key order, fetched chunk_size at a time
+    (a server-side cursor on PostgreSQL), so memory stays flat.
+    """
+    return queryset.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def render_csv(rows, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else export_value(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_ndjson(rows, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, (export_value(value) for value in row)))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def encode_stream(chunks, compress=True):
+    """UTF-8 encode rendered chunks, gzip-compressing them incrementally."""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+
+    # wbits=31 writes a gzip header so the output is a valid .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, fields, file_format='csv', compress=True, chunk_size=EXPORT_CHUNK_SIZE):
+    """Iterator of bytes for the export of queryset."""
+    render = render_ndjson if file_format == 'ndjson' else render_csv
+    rows = iter_export_rows(queryset, fields, chunk_size=chunk_size)
+    return encode_stream(render(rows, fields, chunk_size=chunk_size), compress=compress)
+
+
+class ExportView(AccountPermissionMixin, PatientAccessMixin, APIView):
+    """
+    Streaming export of patients, treatments or transactions of the active account
+    (/api/clinic/exports/<dataset>/?type=csv|ndjson&gzip=1).
+    Rows are scoped like the list endpoints and written as they are read.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, dataset):
+        account = self.get_account_context()
+        if not account:
+            return Response({'error': 'Account context required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if dataset not in EXPORT_DATASETS:
+            return Response({'error': f'Unknown export: {dataset}'}, status=status.HTTP_404_NOT_FOUND)
+
+        # ?format= is taken by DRF's renderer negotiation
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({'error': 'type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip', '1') not in ('0', 'false')
+
+        get_queryset, fields, permission = EXPORT_DATASETS[dataset]
+        for required in filter(None, ('export_reports', permission)):
+            permission_error = self.require_permission(required, account)
+            if permission_error:
+                return permission_error
+
+        queryset = self.scope_queryset(dataset, get_queryset(account), account)
+        if queryset is None:
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        content_type, extension = EXPORT_FORMATS[file_format]
+        filename = f"{dataset}-{timezone.localdate().isoformat()}.{extension}"
+        if compress:
+            content_type, filename = 'application/gzip', f'{filename}.gz'
+
+        response = StreamingHttpResponse(
+            stream_export(queryset, fields, file_format=file_format, compress=compress),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def scope_queryset(self, dataset, queryset, account):
+        """Apply the user's row-level scope (None when nothing is visible)."""
+        if dataset == 'patients':
+            # Doctors only export patients from their own treatments
+            return self.get_accessible_patients_queryset(queryset, account)
+
+        if dataset == 'treatments':
+            if self.check_permission('view_treatments_list', account):
+                return queryset
+            if self.check_permission('view_treatments_assigned', account):
+                return queryset.filter(doctor=self.request.user)
+            return None
+
+        return queryset
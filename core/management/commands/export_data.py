@@ -0,0 +1,44 @@
+# core/management/commands/export_data.py
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from platform_accounts.models import Account
+from core.exports import EXPORT_CHUNK_SIZE, EXPORT_DATASETS, EXPORT_FORMATS, stream_export
+
+class Command(BaseCommand):
+    help = 'Stream an account export (patients, treatments or transactions) as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORT_DATASETS))
+        parser.add_argument('--account', required=True, help='Account to export (account_id)')
+        parser.add_argument('--type', dest='file_format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--output', help='Output file (defaults to stdout)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        account = Account.objects.filter(account_id=options['account']).first()
+        if account is None:
+            raise CommandError(f"Account {options['account']} not found")
+
+        get_queryset, fields, _ = EXPORT_DATASETS[options['dataset']]
+        chunks = stream_export(
+            get_queryset(account), fields,
+            file_format=options['file_format'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size']
+        )
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,382 @@
+# core/management/commands/generate_benchmark_data.py
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from platform_users.models import User
+from platform_accounts.models import Account, AccountOwner, AccountUser, RolePermission
+from platform_accounts.roles import AccountRoles
+from platform_accounts.permissions import DEFAULT_ROLE_PERMISSIONS
+from platform_accounts.effective_permissions import bump_permissions_version
+from clinic_catalog.models import Specialty, CatalogItem
+from clinic_locations.models import Branch, Room
+from clinic_patients.models import Patient, PatientPhone, EmergencyContact, PatientAccount, MedicalHistory
+from clinic_treatments.models import Treatment, TreatmentNote, TreatmentDetail, TreatmentScheduleHistory, DoctorPatient
+from clinic_billing.models import (
+    PatientAccount as BillingAccount, TreatmentCharge, Transaction, PaymentAllocation
+)
+
+# Every generated account name starts with this prefix (used by run_benchmarks)
+BENCHMARK_ACCOUNT_PREFIX = 'Benchmark Clinic'
+BENCHMARK_EMAIL_DOMAIN = 'bench.vgclinic.local'
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+FIRST_NAMES = [
+    'María', 'José', 'Ana', 'Luis', 'Carmen', 'Juan', 'Sofía', 'Carlos', 'Valeria', 'Andrés',
+    'Daniela', 'Diego', 'Gabriela', 'Jorge', 'Fernanda', 'Pablo', 'Lucía', 'Mario', 'Isabel', 'Sebastián',
+]
+LAST_NAMES = [
+    'Rodríguez', 'Vargas', 'Jiménez', 'Mora', 'Rojas', 'Alvarado', 'Solís', 'Araya', 'Castro', 'Chaves',
+    'Quesada', 'Salazar', 'Herrera', 'Brenes', 'Ramírez', 'Sánchez', 'Villalobos', 'Calderón', 'Núñez', 'Zúñiga',
+]
+PROVINCES = ['San José', 'Alajuela', 'Cartago', 'Heredia', 'Guanacaste', 'Puntarenas', 'Limón']
+SPECIALTIES = [
+    ('GEN', 'General Dentistry'), ('ORT', 'Orthodontics'), ('END', 'Endodontics'),
+    ('PER', 'Periodontics'), ('PED', 'Pediatric Dentistry'),
+]
+CONDITION_FIELDS = [
+    'high_blood_pressure', 'diabetes', 'asthma', 'anemia', 'thyroid', 'arthritis',
+    'heart_problems', 'smoker', 'gastritis', 'hepatitis', 'allergies', 'current_medication',
+]
+TREATMENT_STATUSES = ['SCHEDULED', 'RESCHEDULED', 'IN_PROGRESS', 'COMPLETED', 'CANCELED']
+DETAIL_FIELDS = ['tooth', 'surface', 'material', 'anesthesia', 'shade']
+
+
+class Command(BaseCommand):
+    help = 'Generate a seeded synthetic multi-clinic dataset for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=3)
+        parser.add_argument('--patients', type=int, default=5000, help='Patients per account')
+        parser.add_argument('--treatments', type=int, default=3, help='Average treatments per patient')
+        parser.add_argument('--doctors', type=int, default=6, help='Doctors per account')
+        parser.add_argument('--branches', type=int, default=2, help='Branches per account')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if Account.objects.filter(account_name__startswith=BENCHMARK_ACCOUNT_PREFIX).exists():
+            raise CommandError(
+                f'Benchmark data already exists (accounts named "{BENCHMARK_ACCOUNT_PREFIX} ..."). '
+                'Use a fresh database.'
+            )
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.password = make_password(BENCHMARK_PASSWORD)
+        self.now = timezone.now()
+
+        self.seed_role_permissions()
+        for account_index in range(options['accounts']):
+            with transaction.atomic():
+                self.generate_account(account_index)
+            self.stdout.write(f"Generated {BENCHMARK_ACCOUNT_PREFIX} {account_index + 1}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['accounts']} accounts with {options['patients']} patients each "
+            f"(login: <role><n>.<account>@{BENCHMARK_EMAIL_DOMAIN} / {BENCHMARK_PASSWORD})"
+        ))
+
+    def seed_role_permissions(self):
+        """
+        Default role permissions (shared by every account), so generated
+        doctors, assistants and administrators get their normal access.
+        Roles already configured in the database are kept as they are.
+        """
+        with transaction.atomic():
+            RolePermission.objects.bulk_create([
+                RolePermission(role=role, permission_type=permission, is_active=True)
+                for role, permissions in DEFAULT_ROLE_PERMISSIONS.items()
+                for permission in permissions
+            ], ignore_conflicts=True)
+            # bulk_create skips post_save, so invalidate cached permissions explicitly
+            bump_permissions_version()
+
+    def make_user(self, account_index, index, label, number):
+        sequence = account_index * 1000 + index
+        return User(
+            email=f'{label}{number}.{account_index + 1}@{BENCHMARK_EMAIL_DOMAIN}',
+            # Normalized to 12 digits like User.save (bulk_create skips save)
+            id_number=f'9{self.options["seed"] % 100:02d}{sequence:09d}',
+            id_type='01',
+            first_name=self.rng.choice(FIRST_NAMES),
+            last_name=self.rng.choice(LAST_NAMES),
+            password=self.password,
+        )
+
+    def generate_account(self, account_index):
+        rng = self.rng
+        options = self.options
+
+        account = Account.objects.create(
+            account_name=f'{BENCHMARK_ACCOUNT_PREFIX} {account_index + 1}',
+            account_email=f'clinic{account_index + 1}@{BENCHMARK_EMAIL_DOMAIN}',
+            account_phone='22223333',
+            account_address='Benchmark address',
+            account_status='active',
+        )
+
+        # Catalog and locations
+        specialties = Specialty.objects.bulk_create([
+            Specialty(account=account, code=code, name=name) for code, name in SPECIALTIES
+        ])
+        catalog_items = CatalogItem.objects.bulk_create([
+            CatalogItem(
+                account=account,
+                specialty=specialty,
+                code=f'{specialty.code}-{n:02d}',
+                name=f'{specialty.name} procedure {n}',
+                price=Decimal(rng.randrange(15000, 250000, 500)),
+            )
+            for specialty in specialties
+            for n in range(1, 9)
+        ])
+        branches = Branch.objects.bulk_create([
+            Branch(
+                account=account,
+                name=f'Branch {n}',
+                email=f'branch{n}.{account_index + 1}@{BENCHMARK_EMAIL_DOMAIN}',
+                phone='22224444',
+                province=rng.choice(PROVINCES),
+                canton='Central',
+                district='Carmen',
+                address='Benchmark branch address',
+            )
+            for n in range(1, options['branches'] + 1)
+        ])
+        Room.objects.bulk_create([
+            Room(branch=branch, name=f'Room {n}') for branch in branches for n in range(1, 5)
+        ])
+
+        # Team: one owner, doctors, assistants, a read-only user and an administrator
+        team = [('owner', 1, None)]
+        team += [('doctor', n, AccountRoles.DOCTOR) for n in range(1, options['doctors'] + 1)]
+        team += [('assistant', n, AccountRoles.ASSISTANT) for n in range(1, 3)]
+        team += [('admin', 1, AccountRoles.ADMINISTRATOR), ('readonly', 1, AccountRoles.READ_ONLY)]
+
+        users = User.objects.bulk_create([
+            self.make_user(account_index, index, label, number)
+            for index, (label, number, _) in enumerate(team)
+        ])
+        owner = users[0]
+        AccountOwner.objects.create(user=owner, account=account)
+
+        # Owners also need an active membership to use the account context
+        members = [AccountUser(user=owner, account=account, role=AccountRoles.ADMINISTRATOR)]
+        doctors = []
+        for user, (label, number, role) in zip(users[1:], team[1:]):
+            specialty = rng.choice(specialties) if role == AccountRoles.DOCTOR else None
+            members.append(AccountUser(
+                user=user,
+                account=account,
+                role=role,
+                specialty=specialty,
+                color='#%06x' % rng.randrange(0x1000000),
+            ))
+            if role == AccountRoles.DOCTOR:
+                doctors.append((user, specialty))
+        AccountUser.objects.bulk_create(members)
+
+        # Patients in batches, each batch with all its dependent rows
+        batch_size = options['batch_size']
+        for start in range(0, options['patients'], batch_size):
+            count = min(batch_size, options['patients'] - start)
+            self.generate_patients(account, account_index, start, count, doctors, catalog_items, branches, owner)
+
+    def generate_patients(self, account, account_index, start, count, doctors, catalog_items, branches, owner):
+        rng = self.rng
+        now = self.now
+
+        patients = [
+            Patient(
+                id_number=f'{self.options["seed"] % 100:02d}{account_index:03d}{start + n:07d}',
+                is_foreign=rng.random() < 0.08,
+                first_name=rng.choice(FIRST_NAMES),
+                last_name1=rng.choice(LAST_NAMES),
+                last_name2=rng.choice(LAST_NAMES),
+                birth_date=(now - timedelta(days=rng.randrange(365 * 3, 365 * 90))).date(),
+                gender=rng.choice(['M', 'F', 'O']),
+                marital_status=rng.choice(['S', 'M', 'D', 'W']),
+                email=f'patient{start + n}.{account_index + 1}@{BENCHMARK_EMAIL_DOMAIN}',
+                province=rng.choice(PROVINCES),
+                canton='Central',
+                district='Carmen',
+                address='Benchmark patient address',
+            )
+            for n in range(count)
+        ]
+        # bulk_create skips Patient.save
+        for patient in patients:
+            patient.search_key = patient.build_search_key()
+        patients = Patient.objects.bulk_create(patients)
+
+        PatientPhone.objects.bulk_create([
+            PatientPhone(
+                patient=patient,
+                phone_number=f'8{rng.randrange(10000000):07d}',
+                phone_type=rng.choice(['P', 'H', 'W']),
+            )
+            for patient in patients
+            for _ in range(rng.randint(1, 2))
+        ])
+        EmergencyContact.objects.bulk_create([
+            EmergencyContact(
+                patient=patient,
+                first_name=rng.choice(FIRST_NAMES),
+                last_name1=rng.choice(LAST_NAMES),
+                phone=f'8{rng.randrange(10000000):07d}',
+                relationship=rng.choice(['Madre', 'Padre', 'Pareja', 'Hermano(a)']),
+            )
+            for patient in patients
+            if rng.random() < 0.7
+        ])
+
+        patient_accounts = PatientAccount.objects.bulk_create([
+            PatientAccount(
+                patient=patient,
+                account=account,
+                admission_date=now - timedelta(days=rng.randrange(1, 365 * 5)),
+                referral_source=rng.choice(['INT', 'SOC', 'REC', 'OTH']),
+            )
+            for patient in patients
+        ])
+
+        histories = []
+        for patient_account in patient_accounts:
+            for version in range(rng.randint(1, 3)):
+                history = MedicalHistory(
+                    patient_account=patient_account,
+                    created_at=patient_account.admission_date + timedelta(days=120 * version),
+                    information_confirmed=True,
+                )
+                for field in CONDITION_FIELDS:
+                    setattr(history, field, rng.random() < 0.1)
+                # bulk_create skips MedicalHistory.save
+                history.condition_flags = history.build_condition_flags()
+                histories.append(history)
+        MedicalHistory.objects.bulk_create(histories)
+        PatientAccount.refresh_current_medical_history(PatientAccount.objects.filter(account=account))
+
+        # Treatments spread over the past year and the next two months
+        treatments = []
+        for patient in patients:
+            for _ in range(rng.randint(0, self.options['treatments'] * 2)):
+                doctor, specialty = rng.choice(doctors)
+                catalog_item = rng.choice([item for item in catalog_items if item.specialty_id == specialty.id])
+                scheduled_date = now + timedelta(minutes=30 * rng.randrange(-365 * 16, 60 * 16))
+                if scheduled_date < now:
+                    status = 'COMPLETED' if rng.random() < 0.8 else rng.choice(TREATMENT_STATUSES)
+                else:
+                    status = rng.choice(['SCHEDULED', 'RESCHEDULED', 'CANCELED'])
+                treatments.append(Treatment(
+                    account=account,
+                    catalog_item=catalog_item,
+                    specialty=specialty,
+                    patient=patient,
+                    notes='Benchmark treatment notes',
+                    scheduled_date=scheduled_date,
+                    completed_date=scheduled_date if status == 'COMPLETED' else None,
+                    status=status,
+                    doctor=doctor,
+                    location=rng.choice(branches),
+                    created_by=owner,
+                ))
+        treatments = Treatment.objects.bulk_create(treatments)
+        # bulk_create skips the signals maintaining doctor/patient links
+        DoctorPatient.rebuild(account=account)
+
+        TreatmentScheduleHistory.objects.bulk_create([
+            TreatmentScheduleHistory(treatment=treatment, scheduled_date=treatment.scheduled_date)
+            for treatment in treatments
+        ])
+        TreatmentDetail.objects.bulk_create([
+            TreatmentDetail(
+                treatment=treatment,
+                account=account,
+                field_name=field_name,
+                field_value=str(rng.randint(1, 48)),
+            )
+            for treatment in treatments
+            for field_name in rng.sample(DETAIL_FIELDS, rng.randint(0, 3))
+        ])
+        TreatmentNote.objects.bulk_create([
+            TreatmentNote(
+                treatment=treatment,
+                account=account,
+                note='Benchmark clinical note',
+                type='MEDICAL',
+                created_by=treatment.doctor,
+                assigned_doctor=treatment.doctor,
+                date=treatment.scheduled_date,
+            )
+            for treatment in treatments
+            if rng.random() < 0.5
+        ])
+
+        self.generate_billing(patients, treatments)
+
+    def generate_billing(self, patients, treatments):
+        """Charges for completed treatments plus full or partial payments."""
+        rng = self.rng
+
+        completed = [treatment for treatment in treatments if treatment.status == 'COMPLETED']
+        charges = TreatmentCharge.objects.bulk_create([
+            TreatmentCharge(
+                account_id=treatment.account_id,
+                treatment=treatment,
+                amount=treatment.catalog_item.price,
+                description=f'Charge for {treatment.catalog_item.name}',
+                date_created=treatment.scheduled_date,
+            )
+            for treatment in completed
+        ])
+
+        balances = {patient.id: Decimal('0.00') for patient in patients}
+        transactions = []
+        payments = []
+        for charge in charges:
+            patient_id = charge.treatment.patient_id
+            transactions.append(Transaction(
+                account_id=charge.account_id,
+                patient_id=patient_id,
+                amount=-charge.amount,
+                transaction_type='CHARGE',
+                treatment_charge=charge,
+                date=charge.date_created,
+                description=charge.description,
+            ))
+            balances[patient_id] -= charge.amount
+
+            roll = rng.random()
+            if roll < 0.85:
+                paid = charge.amount if roll < 0.65 else (charge.amount / 2).quantize(Decimal('0.01'))
+                payment = Transaction(
+                    account_id=charge.account_id,
+                    patient_id=patient_id,
+                    amount=paid,
+                    transaction_type='PAYMENT',
+                    payment_method=rng.choice(['CASH', 'CARD', 'TRANSFER']),
+                    date=charge.date_created + timedelta(hours=1),
+                    description=f'Payment of ${paid}',
+                )
+                transactions.append(payment)
+                payments.append((payment, charge, paid))
+                balances[patient_id] += paid
+
+        Transaction.objects.bulk_create(transactions)
+        PaymentAllocation.objects.bulk_create([
+            PaymentAllocation(transaction=payment, treatment_charge=charge, amount=paid)
+            for payment, charge, paid in payments
+        ])
+        # bulk_create skips PaymentAllocation.save, which keeps charges' paid amounts
+        TreatmentCharge.refresh_payments(TreatmentCharge.objects.filter(pk__in=[charge.pk for charge in charges]))
+        BillingAccount.objects.bulk_create([
+            BillingAccount(patient_id=patient_id, current_balance=balance)
+            for patient_id, balance in balances.items()
+        ])
@@ -0,0 +1,45 @@
+# core/management/commands/performance_report.py
+
+from django.core.management.base import BaseCommand
+from core import performance
+
+class Command(BaseCommand):
+    help = 'Dump per-endpoint performance metrics recorded by PerformanceMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['json', 'csv'], default='json')
+        parser.add_argument('--summary', action='store_true',
+                            help='Aggregate per URL name instead of dumping raw requests')
+        parser.add_argument('--url-name', help='Only include this URL name (e.g. treatment-list)')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+        parser.add_argument('--over-budget', action='store_true',
+                            help='Only include requests that exceeded their query budget')
+
+    def handle(self, *args, **options):
+        # Snapshots written by every worker process
+        records = performance.read_snapshots()
+        
+        if options['url_name']:
+            records = [r for r in records if r['url_name'] == options['url_name']]
+        
+        if options['over_budget']:
+            records = [
+                r for r in records
+                if r['query_budget'] is not None and r['queries'] > r['query_budget']
+            ]
+        
+        rows = performance.summarize(records) if options['summary'] else records
+        
+        if options['format'] == 'csv':
+            content = performance.to_csv(rows)
+        else:
+            content = performance.to_json(rows)
+        
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+            self.stdout.write(
+                self.style.SUCCESS(f"Wrote {len(rows)} rows to {options['output']}")
+            )
+        else:
+            self.stdout.write(content)
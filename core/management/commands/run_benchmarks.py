@@ -0,0 +1,181 @@
+# core/management/commands/run_benchmarks.py
+
+import json
+import platform
+import subprocess
+import time
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from platform_accounts.models import Account, AccountOwner, AccountUser, RolePermission
+from platform_accounts.roles import AccountRoles
+from clinic_patients.models import Patient
+from core.performance import QueryCounter, percentile
+from core.management.commands.generate_benchmark_data import BENCHMARK_ACCOUNT_PREFIX
+
+ROLE_CHOICES = {
+    'owner': None,
+    'doctor': AccountRoles.DOCTOR,
+    'assistant': AccountRoles.ASSISTANT,
+    'admin': AccountRoles.ADMINISTRATOR,
+}
+
+
+def get_endpoints(context):
+    """
+    Benchmarked endpoints as (name, path, query params).
+    `context` holds ids picked from the benchmark dataset.
+    """
+    now = timezone.now()
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ('patients.list', '/api/clinic/patients/patients/', {}),
+        ('patients.search', '/api/clinic/patients/patients/', {'search': context['search_term']}),
+        ('patients.typeahead', '/api/clinic/patients/patients/typeahead/', {'q': context['search_term']}),
+        ('patients.lookup', '/api/clinic/patients/lookup/', {'q': context['search_term']}),
+        ('patients.summary', f"/api/clinic/patients/patients/{context['patient_id']}/summary/", {}),
+        ('treatments.list', '/api/clinic/treatments/treatments/', {}),
+        ('treatments.list_full', '/api/clinic/treatments/treatments/', {'view': 'full'}),
+        ('treatments.calendar', '/api/clinic/treatments/treatments/', {
+            'view': 'calendar',
+            'start_date': week_start.isoformat(),
+            'end_date': (week_start + timedelta(days=7)).isoformat(),
+        }),
+        ('treatments.agenda', '/api/clinic/treatments/treatments/agenda/', {
+            'start': week_start.isoformat(),
+            'end': (week_start + timedelta(days=7)).isoformat(),
+        }),
+        ('billing.transactions', '/api/clinic/billing/transactions/', {}),
+        ('billing.receivables', '/api/clinic/billing/charges/', {'status': 'PARTIAL'}),
+        ('billing.patient_statement', '/api/clinic/billing/transactions/patient_statement/', {
+            'patient_id': context['patient_id'],
+        }),
+        ('dashboard.stats', '/api/clinic/dashboard/stats/', {}),
+        ('permissions.users', '/api/accounts/permissions/users/', {}),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run the API benchmark suite against the generated benchmark dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, default=1, help='Benchmark clinic number')
+        parser.add_argument('--as', dest='role', choices=sorted(ROLE_CHOICES), default='owner')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--endpoint', action='append', help='Only run these endpoints (repeatable)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        account = Account.objects.filter(
+            account_name=f"{BENCHMARK_ACCOUNT_PREFIX} {options['account']}"
+        ).first()
+        if account is None:
+            raise CommandError('Benchmark dataset not found. Run generate_benchmark_data first.')
+
+        user = self.get_user(account, options['role'])
+        patient = Patient.objects.filter(clinic_memberships__account=account).order_by('id').first()
+        context = {
+            'patient_id': patient.id,
+            'search_term': patient.last_name1[:4],
+        }
+
+        # Failing endpoints are reported with their status instead of aborting the run
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user=user)
+        headers = {'HTTP_X_ACCOUNT_CONTEXT': str(account.account_id)}
+
+        results = []
+        # Keep the suite independent of the per-request metrics middleware
+        with override_settings(PERFORMANCE_MONITORING=False):
+            for name, path, params in get_endpoints(context):
+                if options['endpoint'] and name not in options['endpoint']:
+                    continue
+                results.append(self.run_endpoint(client, headers, name, path, params, options))
+                self.stdout.write(
+                    f"{name:30} p50 {results[-1]['p50_ms']:>9} ms  p95 {results[-1]['p95_ms']:>9} ms  "
+                    f"queries {results[-1]['queries']:>5}  status {results[-1]['status']}"
+                )
+
+        report = {
+            'environment': {
+                'commit': self.get_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'account': account.account_name,
+                'role': options['role'],
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def get_user(self, account, role):
+        if role == 'owner':
+            owner = AccountOwner.objects.filter(account=account, is_active=True).select_related('user').first()
+            return owner.user
+
+        member = AccountUser.objects.filter(
+            account=account,
+            role=ROLE_CHOICES[role],
+            is_active_in_account=True
+        ).select_related('user').order_by('id').first()
+        if member is None:
+            raise CommandError(f'No {role} found in {account.account_name}')
+        if not RolePermission.objects.filter(role=member.role, is_active=True).exists():
+            # Every request would be a 403 and the timings meaningless
+            raise CommandError(f'The {role} role has no permissions; run setup_role_permissions first')
+        return member.user
+
+    def get_commit(self):
+        try:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL, text=True
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def run_endpoint(self, client, headers, name, path, params, options):
+        for _ in range(options['warmup']):
+            client.get(path, params, **headers)
+
+        timings = []
+        queries = []
+        status = None
+        response_bytes = 0
+        for _ in range(options['iterations']):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = client.get(path, params, **headers)
+                timings.append(round((time.perf_counter() - start) * 1000, 2))
+            queries.append(counter.queries)
+            status = response.status_code
+            response_bytes = len(response.content)
+
+        return {
+            'endpoint': name,
+            'status': status,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'max_ms': max(timings),
+            'queries': max(queries),
+            'min_queries': min(queries),
+            'response_bytes': response_bytes,
+        }
@@ -1,52 +1,96 @@
-# core/middleware.py - ADD debug prints
-from platform_accounts.models import Account, AccountUser
+# core/middleware.py
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+from core.account_context import resolve_account_context
+from core import performance
+
+logger = logging.getLogger(__name__)
+
 
 class AccountContextMiddleware:
+    """
+    Attach the account from X-Account-Context to the request.
+    Resolution is lazy so that DRF/JWT authentication has already set
+    request.user when a view first reads request.account, and it goes
+    through the same per-request resolver used by views and the dashboard.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.account = SimpleLazyObject(lambda: resolve_account_context(request))
+        
+        response = self.get_response(request)
+        return response
+
+
+class PerformanceMiddleware:
+    """
+    Record SQL query count, DB time, view/render time and response
+    size per resolved URL name into the in-process metrics buffer, and
+    check each endpoint's query budget.
+    Enabled with PERFORMANCE_MONITORING.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
+        self.last_snapshot = 0.0
 
     def __call__(self, request):
-        # Get account context from header
-        account_id = request.headers.get('X-Account-Context')
+        if not getattr(settings, 'PERFORMANCE_MONITORING', False):
+            return self.get_response(request)
+        
+        counter = performance.QueryCounter()
+        request._performance_marks = {}
+        start = time.perf_counter()
+        
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        
+        end = time.perf_counter()
+        marks = request._performance_marks
+        view_start = marks.get('view_start', start)
+        # DRF responses are rendered after process_template_response, so
+        # view_ms includes serializers and render_ms the renderer plus the
+        # middleware inside this one
+        view_end = marks.get('view_end', end)
         
-        print(f"MIDDLEWARE DEBUG: account_id = {account_id}")
-        print(f"MIDDLEWARE DEBUG: user authenticated = {request.user.is_authenticated}")
+        match = getattr(request, 'resolver_match', None)
+        metrics = {
+            'timestamp': time.time(),
+            'url_name': match.url_name if match and match.url_name else '<unresolved>',
+            'method': request.method,
+            'status': response.status_code,
+            'queries': counter.queries,
+            'db_ms': round(counter.db_seconds * 1000, 2),
+            'view_ms': round((view_end - view_start) * 1000, 2),
+            'render_ms': round((end - view_end) * 1000, 2),
+            'total_ms': round((end - start) * 1000, 2),
+            'response_bytes': 0 if response.streaming else len(response.content),
+            'query_budget': performance.get_query_budget(request),
+        }
+        performance.buffer.record(metrics)
         
-        if account_id and request.user.is_authenticated:
+        interval = getattr(settings, 'PERFORMANCE_SNAPSHOT_INTERVAL', 10)
+        if end - self.last_snapshot > interval:
+            self.last_snapshot = end
             try:
-                print(f"MIDDLEWARE DEBUG: Looking for account with ID: {account_id}")
-                # Validate that the user has access to this account
-                account = Account.objects.get(account_id=account_id)
-                print(f"MIDDLEWARE DEBUG: Found account: {account.account_name}")
-                
-                # Check if user has access (unless they're staff/superuser)
-                if request.user.is_staff or request.user.is_superuser:
-                    print(f"MIDDLEWARE DEBUG: User is staff/superuser, granting access")
-                    request.account = account
-                else:
-                    # Check if user is a member of this account
-                    membership = AccountUser.objects.filter(
-                        user=request.user,
-                        account=account,
-                        is_active_in_account=True
-                    )
-                    print(f"MIDDLEWARE DEBUG: Membership query result: {membership.exists()}")
-                    if membership.exists():
-                        print(f"MIDDLEWARE DEBUG: User has membership, setting account")
-                        request.account = account
-                    else:
-                        print(f"MIDDLEWARE DEBUG: User has no membership")
-                        request.account = None
-                        
-            except Account.DoesNotExist:
-                print(f"MIDDLEWARE DEBUG: Account not found")
-                request.account = None
-            except Exception as e:
-                print(f"MIDDLEWARE DEBUG: Exception: {e}")
-                request.account = None
-        else:
-            print(f"MIDDLEWARE DEBUG: No account_id or user not authenticated")
-            request.account = None
-            
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+                performance.write_snapshot()
+            except OSError as e:
+                logger.warning(f"Could not write performance snapshot: {e}")
+        
+        performance.check_query_budget(metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_performance_marks'):
+            request._performance_marks['view_start'] = time.perf_counter()
+        return None
+
+    def process_template_response(self, request, response):
+        if hasattr(request, '_performance_marks'):
+            request._performance_marks['view_end'] = time.perf_counter()
+        return response
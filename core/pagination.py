@@ -0,0 +1,218 @@
+# core/pagination.py
+import base64
+import datetime
+import decimal
+import json
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, OrderBy, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorValueEncoder(json.JSONEncoder):
+    """Keeps full datetime precision (DjangoJSONEncoder truncates to milliseconds)."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, (decimal.Decimal, uuid.UUID)):
+            return str(o)
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination on the queryset's own ordering.
+
+    The ordering comes from the view (get_queryset, search ranking or
+    ?ordering=), falling back to the model's Meta.ordering, and always ends
+    with the primary key so it is unique. The cursor holds the ordering
+    values of the last row of the page; the next page filters on them
+    instead of using OFFSET, so deep pages cost the same as the first one.
+
+    ?page_size= is capped at PAGINATION_MAX_PAGE_SIZE. ?count=exact adds the
+    total to the response and ?count=approximate adds a bounded estimate
+    (see get_count); by default no COUNT(*) is run.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    annotation_prefix = 'keyset_'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset, request)
+
+        values, self.reverse = self.decode_cursor(request)
+        self.keys = self.get_keys(queryset)
+
+        queryset = queryset.annotate(**{name: expression for name, expression, _, _ in self.keys})
+        queryset = queryset.order_by(*self.get_order_by(reverse=self.reverse))
+        if values is not None:
+            if len(values) != len(self.keys):
+                raise NotFound('Invalid cursor')
+            queryset = queryset.filter(self.get_seek_filter(values, reverse=self.reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        # Coming from a cursor means there is a page on the other side
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = has_more if self.reverse else values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response['count'], response['count_is_approximate'] = self.count
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_is_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 50
+        max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 500)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return min(page_size, max_page_size)
+        return max(1, min(requested, max_page_size))
+
+    def get_count(self, queryset, request):
+        """
+        (count, is_approximate) for ?count=exact|approximate, else None.
+        Approximate counts use the planner estimate on PostgreSQL and an
+        exact count below PAGINATION_APPROXIMATE_COUNT_THRESHOLD; other
+        databases count at most up to the threshold.
+        """
+        mode = request.query_params.get(self.count_query_param)
+        if mode not in ('exact', 'approximate'):
+            return None
+
+        queryset = queryset.order_by()
+        if mode == 'exact':
+            return queryset.count(), False
+
+        threshold = getattr(settings, 'PAGINATION_APPROXIMATE_COUNT_THRESHOLD', 10000)
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = plan[0]['Plan']['Plan Rows']
+            if estimate >= threshold:
+                return estimate, True
+            return queryset.count(), False
+
+        count = queryset[:threshold].count()
+        return count, count >= threshold
+
+    def get_keys(self, queryset):
+        """[(annotation name, expression, descending, nullable)] for the ordering plus pk."""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        terms = []
+        for term in ordering:
+            if isinstance(term, str):
+                if term == '?':
+                    continue
+                terms.append((F(term.lstrip('-')), term.startswith('-'), term.lstrip('-')))
+            elif isinstance(term, OrderBy):
+                terms.append((term.expression, term.descending, None))
+            else:
+                terms.append((term, False, None))
+
+        if not any(name in ('pk', queryset.model._meta.pk.name) for _, _, name in terms):
+            terms.append((F('pk'), False, 'pk'))
+
+        keys = []
+        for position, (expression, descending, _) in enumerate(terms):
+            resolved = expression.resolve_expression(queryset.query.clone(), allow_joins=True)
+            nullable = getattr(getattr(resolved, 'output_field', None), 'null', True)
+            keys.append((f'{self.annotation_prefix}{position}', expression, descending, nullable))
+        return keys
+
+    def get_order_by(self, reverse=False):
+        # NULLs sort last going forward (first when reversed) on every backend
+        order_by = []
+        for name, _, descending, _ in self.keys:
+            if reverse:
+                descending = not descending
+                order_by.append(F(name).desc(nulls_first=True) if descending else F(name).asc(nulls_first=True))
+            else:
+                order_by.append(F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True))
+        return order_by
+
+    def get_seek_filter(self, values, reverse=False):
+        """Rows strictly after (before when reversed) the cursor row, compared lexicographically."""
+        seek = Q(pk__in=[])
+        equal = Q()
+        for (name, _, descending, nullable), value in zip(self.keys, values):
+            seek |= equal & self.get_after(name, value, descending != reverse, nullable, reverse)
+            equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+        return seek
+
+    @staticmethod
+    def get_after(name, value, descending, nullable, reverse):
+        lookup = 'lt' if descending else 'gt'
+        if not reverse:
+            # NULLs come last: nothing follows a NULL, every NULL follows a value
+            if value is None:
+                return Q(pk__in=[])
+            after = Q(**{f'{name}__{lookup}': value})
+            return after | Q(**{f'{name}__isnull': True}) if nullable else after
+        # Reversed, NULLs come first: every value follows a NULL
+        if value is None:
+            return Q(**{f'{name}__isnull': False})
+        return Q(**{f'{name}__{lookup}': value})
+
+    def encode_cursor(self, row, reverse):
+        payload = {'v': [getattr(row, name) for name, _, _, _ in self.keys]}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, cls=CursorValueEncoder).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return list(payload['v']), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Reversed past the start: go back to the first page
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
@@ -0,0 +1,192 @@
+# core/performance.py
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+import warnings
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Columns recorded for each request
+METRIC_FIELDS = [
+    'timestamp', 'url_name', 'method', 'status', 'queries', 'db_ms',
+    'view_ms', 'render_ms', 'total_ms', 'response_bytes', 'query_budget',
+]
+
+
+class QueryBudgetWarning(UserWarning):
+    """Emitted when an endpoint runs more SQL queries than its budget."""
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised instead of a warning when QUERY_BUDGET_ACTION is 'raise'."""
+
+
+class MetricsBuffer:
+    """
+    Thread-safe in-process ring buffer of per-request metrics.
+    Old entries are dropped once PERFORMANCE_BUFFER_SIZE is reached.
+    """
+
+    def __init__(self, size):
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            self._records.append(metrics)
+
+    def snapshot(self, url_name=None):
+        with self._lock:
+            records = list(self._records)
+        if url_name:
+            records = [record for record in records if record['url_name'] == url_name]
+        return records
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+buffer = MetricsBuffer(getattr(settings, 'PERFORMANCE_BUFFER_SIZE', 1000))
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(records):
+    """Aggregate records per url_name (count, p50/p95 latency, max queries, ...)."""
+    by_endpoint = {}
+    for record in records:
+        by_endpoint.setdefault(record['url_name'], []).append(record)
+
+    summary = []
+    for url_name, endpoint_records in sorted(by_endpoint.items()):
+        total_ms = [record['total_ms'] for record in endpoint_records]
+        queries = [record['queries'] for record in endpoint_records]
+        summary.append({
+            'url_name': url_name,
+            'requests': len(endpoint_records),
+            'p50_ms': percentile(total_ms, 50),
+            'p95_ms': percentile(total_ms, 95),
+            'avg_queries': round(sum(queries) / len(queries), 1),
+            'max_queries': max(queries),
+            'avg_db_ms': round(sum(record['db_ms'] for record in endpoint_records) / len(endpoint_records), 2),
+            'avg_render_ms': round(
+                sum(record['render_ms'] for record in endpoint_records) / len(endpoint_records), 2
+            ),
+            'max_response_bytes': max(record['response_bytes'] for record in endpoint_records),
+            'query_budget': endpoint_records[-1]['query_budget'],
+        })
+    return summary
+
+
+def to_json(rows):
+    return json.dumps(rows, indent=2, default=str)
+
+
+def to_csv(rows):
+    output = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    return output.getvalue()
+
+
+def get_query_budget(request):
+    """
+    Get the query budget for the resolved endpoint.
+    QUERY_BUDGETS (by URL name) wins over a `query_budget` attribute on the
+    view class, which may be an int or a dict keyed by DRF action.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if match.url_name in budgets:
+        return budgets[match.url_name]
+
+    view_class = getattr(match.func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        actions = getattr(match.func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        return budget.get(action)
+    return budget
+
+
+def check_query_budget(metrics):
+    """Warn (or raise, with QUERY_BUDGET_ACTION = 'raise') when over budget."""
+    budget = metrics['query_budget']
+    if budget is None or metrics['queries'] <= budget:
+        return
+
+    message = (
+        f"{metrics['url_name']} ran {metrics['queries']} queries "
+        f"(budget {budget}, {metrics['db_ms']} ms in DB)"
+    )
+    if getattr(settings, 'QUERY_BUDGET_ACTION', 'warn') == 'raise':
+        raise QueryBudgetExceeded(message)
+
+    logger.warning(message)
+    warnings.warn(message, QueryBudgetWarning)
+
+
+def write_snapshot():
+    """
+    Write this process's buffer to PERFORMANCE_SNAPSHOT_DIR/<pid>.json so
+    the performance_report command can merge data from every worker.
+    """
+    directory = getattr(settings, 'PERFORMANCE_SNAPSHOT_DIR', None)
+    if not directory:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as snapshot:
+        snapshot.write(to_json(buffer.snapshot()))
+    os.replace(temporary_path, path)
+
+
+def read_snapshots():
+    """Read every worker snapshot from PERFORMANCE_SNAPSHOT_DIR."""
+    directory = getattr(settings, 'PERFORMANCE_SNAPSHOT_DIR', None)
+    if not directory or not os.path.isdir(directory):
+        return []
+
+    records = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as snapshot:
+                records.extend(json.load(snapshot))
+    return records
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts queries and DB time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db import models
 from platform_accounts.models import Account, AccountUser, AccountOwner
+from core.account_context import resolve_account_context, get_request_permissions
 
 class AccountPermissionMixin:
     """
@@ -12,33 +13,25 @@ class AccountPermissionMixin:
     
     def get_account_context(self):
         """Get and validate account context from request header"""
-        account_id = self.request.headers.get('X-Account-Context')
-        
-        if not account_id:
-            return None
-            
-        try:
-            account = Account.objects.get(account_id=account_id)
+        return resolve_account_context(self.request)
+    
+    def get_effective_permissions(self, account=None):
+        """
+        Get the user's resolved permission set for the account.
+        Loaded once per (user, account) from the shared permission cache
+        and memoized on the request.
+        """
+        if not account:
+            account = self.get_account_context()
             
-            # Check if user has access (unless they're staff/superuser)
-            if self.request.user.is_staff or self.request.user.is_superuser:
-                return account
-            else:
-                # Check if user is a member of this account
-                if AccountUser.objects.filter(
-                    user=self.request.user,
-                    account=account,
-                    is_active_in_account=True
-                ).exists():
-                    return account
-                    
-            return None
-        except Account.DoesNotExist:
+        if not account:
             return None
+            
+        return get_request_permissions(self.request, account)
     
     def check_permission(self, permission_type, account=None):
         """
-        Check if user has permission using the unified method.
+        Check if user has permission using the resolved permission set.
         """
         if not account:
             account = self.get_account_context()
@@ -50,12 +43,7 @@ class AccountPermissionMixin:
         if self.request.user.is_staff or self.request.user.is_superuser:
             return True
             
-        # Use the unified permission check method
-        return AccountUser.user_has_permission(
-            self.request.user, 
-            account, 
-            permission_type
-        )
+        return self.get_effective_permissions(account).has(permission_type)
     
     def require_permission(self, permission_type, account=None):
         """
@@ -71,35 +59,17 @@ class AccountPermissionMixin:
     
     def get_user_role_in_account(self, account=None):
         """Get the user's role in the account."""
-        if not account:
-            account = self.get_account_context()
-            
-        if not account:
-            return None
-            
-        try:
-            account_user = AccountUser.objects.get(
-                user=self.request.user,
-                account=account,
-                is_active_in_account=True
-            )
-            return account_user.role
-        except AccountUser.DoesNotExist:
+        permissions = self.get_effective_permissions(account)
+        if permissions is None:
             return None
+        return permissions.role
     
     def is_account_owner(self, account=None):
         """Check if current user is an owner of the account."""
-        if not account:
-            account = self.get_account_context()
-            
-        if not account:
+        permissions = self.get_effective_permissions(account)
+        if permissions is None:
             return False
-            
-        return AccountOwner.objects.filter(
-            user=self.request.user,
-            account=account,
-            is_active=True
-        ).exists()
+        return permissions.is_owner
     
     def get_user_accounts_queryset(self):
         """Get queryset of accounts the user has access to."""
@@ -117,6 +87,13 @@ class PatientAccessMixin:
     Handles doctor-specific patient filtering.
     """
     
+    def is_doctor_scoped(self, account):
+        """True when the user only sees patients from their own treatments."""
+        if self.is_account_owner(account):
+            return False
+        return (self.get_user_role_in_account(account) == 'doc' and
+                not self.check_permission('manage_patient_basic', account))
+    
     def get_accessible_patients_queryset(self, base_queryset, account):
         """
         Filter patients based on role and permissions.
@@ -126,21 +103,18 @@ class PatientAccessMixin:
         # Owners see all patients in account
         if self.is_account_owner(account):
             return base_queryset
-            
-        user_role = self.get_user_role_in_account(account)
         
         # Doctors only see patients from their active treatments (unless they have manage_patient_basic)
-        if user_role == 'doc' and not self.check_permission('manage_patient_basic', account):
-            from clinic_treatments.models import Treatment
-            
-            # Get patients from active treatments assigned to this doctor
-            doctor_patients = Treatment.objects.filter(
-                doctor__user=self.request.user,
-                doctor__account=account,
-                status__in=['scheduled', 'in_progress', 'completed']  # Adjust statuses as needed
-            ).values_list('patient', flat=True).distinct()
+        if self.is_doctor_scoped(account):
+            from django.db.models import Exists, OuterRef
+            from clinic_treatments.models import DoctorPatient
             
-            return base_queryset.filter(id__in=doctor_patients)
+            # Maintained doctor -> patient links: one indexed semi-join, no DISTINCT
+            return base_queryset.filter(Exists(DoctorPatient.objects.filter(
+                account=account,
+                doctor=self.request.user,
+                patient=OuterRef('pk')
+            )))
         
         # All other roles with view_patients_list permission see all patients
         if self.check_permission('view_patients_list', account):
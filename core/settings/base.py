@@ -15,6 +15,9 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     
+    # Project core (management commands, diagnostics)
+    'core',
+    
     # Third Party apps
     'auditlog',
     'crispy_forms',
@@ -48,12 +51,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    # 'core.middleware.AccountContextMiddleware',
+    'core.middleware.AccountContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -94,8 +98,80 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # Keyset pagination on each endpoint's ordering (see core/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+}
+
+# Largest ?page_size= a client may request
+PAGINATION_MAX_PAGE_SIZE = 500
+# ?count=approximate: estimates at or above this many rows are not counted exactly
+PAGINATION_APPROXIMATE_COUNT_THRESHOLD = 10000
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vgclinic',
+    }
+}
+
+# Seconds a resolved X-Account-Context account stays in the shared cache (0 disables it)
+ACCOUNT_CONTEXT_CACHE_TIMEOUT = 60
+
+# Seconds a user's resolved permission set stays in the shared cache (0 disables it).
+# Entries are also invalidated by version counters on ownership/role/grant changes.
+PERMISSIONS_CACHE_TIMEOUT = 300
+
+# Seconds a patient's billing statement stays in the shared cache (0 disables it).
+# Billing writes drop the entry immediately.
+BILLING_STATEMENT_CACHE_TIMEOUT = 60
+
+# Tracing
+# Fraction of requests that emit debug traces (0 disables them). Can be changed
+# at runtime, globally or per module, through /api/platform/diagnostics/tracing/.
+TRACING_SAMPLE_RATE = 0.0
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'trace': {
+            'handlers': ['console'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+    },
 }
 
+# Performance monitoring (see core/performance.py)
+# Records query count, DB time, serialization time and response size per URL name.
+PERFORMANCE_MONITORING = False
+PERFORMANCE_BUFFER_SIZE = 1000
+# Each worker writes its buffer here every PERFORMANCE_SNAPSHOT_INTERVAL seconds
+# for the performance_report command (None disables snapshots)
+PERFORMANCE_SNAPSHOT_DIR = None
+PERFORMANCE_SNAPSHOT_INTERVAL = 10
+
+# Per-endpoint query budgets by URL name (views can also set `query_budget`).
+# 'warn' emits QueryBudgetWarning (run tests with -W error to fail them), 'raise' raises.
+QUERY_BUDGETS = {}
+QUERY_BUDGET_ACTION = 'warn'
+
+# Patient search: 'auto' (trigram on PostgreSQL, portable matching elsewhere), 'database' or 'trigram'
+PATIENT_SEARCH_BACKEND = 'auto'
+
+# In-process patient lookup index (/api/clinic/patients/lookup/): seconds before an
+# account's index is rebuilt, and total keys kept per process before LRU eviction
+PATIENT_LOOKUP_INDEX_TTL = 300
+PATIENT_LOOKUP_INDEX_MAX_KEYS = 500000
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -28,11 +28,20 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'trace': {
+            'handlers': ['console'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
     },
 }
 
 ALLOWED_HOSTS = ['*']
 
+# Performance monitoring - dump with `python manage.py performance_report`
+PERFORMANCE_MONITORING = True
+PERFORMANCE_SNAPSHOT_DIR = Path.joinpath(BASE_DIR, 'var', 'performance')
+
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 
 
@@ -47,6 +56,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'db.sqlite3',
+        # Wait for concurrent writers instead of failing with "database is locked"
+        'OPTIONS': {'timeout': 20},
+        # A file (not in-memory) test database lets threaded tests share it
+        'TEST': {'NAME': 'test_db.sqlite3'},
     }
 }
 
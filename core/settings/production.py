@@ -46,6 +46,15 @@ DATABASES = {
     }
 }
 
+# Cache shared by all gunicorn workers on the host (permission cache version
+# counters must be visible to every worker)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', '/app/cache'),
+    }
+}
+
 STATIC_ROOT = '/app/staticfiles'
 STATICFILES_DIRS = [
     Path.joinpath(BASE_DIR, 'static'),
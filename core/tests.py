@@ -0,0 +1,434 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from platform_users.models import User
+from platform_accounts.models import Account, AccountOwner, AccountUser, AccountAuthorization, RolePermission
+from platform_accounts.permissions import DEFAULT_ROLE_PERMISSIONS
+from platform_accounts.roles import AccountRoles
+from clinic_patients.models import Patient, PatientAccount
+from clinic_billing.models import Transaction
+from . import performance
+from .account_context import resolve_account_context
+from .exports import PATIENT_EXPORT_FIELDS, get_patient_export_queryset, stream_export
+from .middleware import AccountContextMiddleware
+from .pagination import KeysetPagination
+from .tracing import SAMPLE_RATES_KEY, get_tracer, reset_sample_rates, set_sample_rate
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the cursors visits every row once, in the queryset's order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated surnames tie on the ordering field
+        for n, last_name in enumerate(['Vargas', 'Mora', 'Mora', 'Arias', 'Mora', 'Vargas', 'Solís']):
+            Patient.objects.create(
+                id_number=f'20000000{n}', first_name='Ana', last_name1=last_name, birth_date='1990-01-01',
+                gender='F', marital_status='S', province='San José', canton='Central', district='Carmen',
+                address='Address'
+            )
+
+        # last_login is nullable; two logins differ only in microseconds
+        login = timezone.now().replace(microsecond=500)
+        last_logins = [login, None, login + datetime.timedelta(microseconds=1), None, login, None]
+        for n, last_login in enumerate(last_logins):
+            user = User.objects.create_user(
+                email=f'user{n}@example.com', id_number=f'10000000{n}', id_type='01', password='x'
+            )
+            User.objects.filter(pk=user.pk).update(last_login=last_login)
+
+    def paginate(self, queryset, params=None):
+        request = Request(APIRequestFactory().get('/items/', params or {}))
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response([row.pk for row in rows]).data
+
+    def cursor(self, link):
+        return parse_qs(urlparse(link).query)['cursor'][0]
+
+    def walk(self, queryset, page_size=2):
+        """Row pks going forward through next links, then back through previous links."""
+        forward = []
+        data = self.paginate(queryset, {'page_size': page_size})
+        self.assertIsNone(data['previous'])
+        while True:
+            forward.extend(data['results'])
+            if not data['next']:
+                break
+            data = self.paginate(queryset, {'page_size': page_size, 'cursor': self.cursor(data['next'])})
+
+        backward = list(data['results'])
+        while data['previous']:
+            data = self.paginate(queryset, {'page_size': page_size, 'cursor': self.cursor(data['previous'])})
+            backward[:0] = data['results']
+        return forward, backward
+
+    def assertWalk(self, queryset, expected):
+        for page_size in (1, 2, 4):
+            with self.subTest(page_size=page_size):
+                forward, backward = self.walk(queryset, page_size)
+                self.assertEqual(forward, expected)
+                self.assertEqual(backward, expected)
+
+    def test_ties_are_broken_by_primary_key(self):
+        for ordering in (('last_name1',), ('-last_name1',)):
+            queryset = Patient.objects.order_by(*ordering)
+            expected = list(queryset.order_by(*ordering, 'pk').values_list('pk', flat=True))
+            self.assertWalk(queryset, expected)
+
+    def test_null_ordering_keys_sort_last(self):
+        users = list(User.objects.values_list('pk', 'last_login'))
+        nulls = sorted(pk for pk, last_login in users if last_login is None)
+        values = [(last_login, pk) for pk, last_login in users if last_login is not None]
+
+        ascending = [pk for _, pk in sorted(values)] + nulls
+        self.assertWalk(User.objects.order_by('last_login'), ascending)
+
+        descending = [pk for _, pk in sorted(values, key=lambda value: (-value[0].timestamp(), value[1]))] + nulls
+        self.assertWalk(User.objects.order_by('-last_login'), descending)
+
+    def test_cursor_round_trip(self):
+        queryset = Patient.objects.order_by('last_name1')
+        first = self.paginate(queryset, {'page_size': 3})
+        second = self.paginate(queryset, {'page_size': 3, 'cursor': self.cursor(first['next'])})
+        # Back from the second page is the first page again, links included
+        self.assertEqual(self.paginate(queryset, {'page_size': 3, 'cursor': self.cursor(second['previous'])}), first)
+
+        with self.assertRaises(NotFound):
+            self.paginate(queryset, {'cursor': 'not-a-cursor'})
+
+    def test_count_modes(self):
+        queryset = Patient.objects.order_by('last_name1')
+        self.assertNotIn('count', self.paginate(queryset, {'page_size': 2}))
+
+        data = self.paginate(queryset, {'page_size': 2, 'count': 'exact'})
+        self.assertEqual((data['count'], data['count_is_approximate']), (7, False))
+
+        data = self.paginate(queryset, {'page_size': 2, 'count': 'approximate'})
+        self.assertEqual((data['count'], data['count_is_approximate']), (7, False))
+
+        with override_settings(PAGINATION_APPROXIMATE_COUNT_THRESHOLD=5):
+            data = self.paginate(queryset, {'page_size': 2, 'count': 'approximate'})
+        self.assertEqual((data['count'], data['count_is_approximate']), (5, True))
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class ExportTests(TestCase):
+    """Exports only hold the active account's rows and need export_reports."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            email='owner@example.com', id_number='100000001', id_type='01', password='x'
+        )
+        cls.assistant = User.objects.create_user(
+            email='assistant@example.com', id_number='100000002', id_type='01', password='x'
+        )
+        cls.accounts = [
+            Account.objects.create(
+                account_name=f'Clinic {n}', account_email=f'clinic{n}@example.com',
+                account_phone='22220000', account_address='Address'
+            )
+            for n in range(2)
+        ]
+        for account in cls.accounts:
+            AccountOwner.objects.create(user=cls.owner, account=account)
+            AccountUser.objects.create(user=cls.owner, account=account, role=AccountRoles.ADMINISTRATOR)
+        AccountUser.objects.create(user=cls.assistant, account=cls.accounts[0], role=AccountRoles.ASSISTANT)
+        RolePermission.objects.create(role=AccountRoles.ASSISTANT, permission_type='view_patients_list')
+
+        cls.patients = []
+        for n in range(3):
+            cls.patients.append(Patient.objects.create(
+                id_number=f'20000000{n}', first_name='Ana', last_name1='Mora', birth_date='1990-01-01',
+                gender='F', marital_status='S', province='San José', canton='Central', district='Carmen',
+                address='Address'
+            ))
+        # The first patient belongs to both clinics, the last only to the other one
+        for patient, account, reason in [
+            (cls.patients[0], cls.accounts[0], 'Checkup'),
+            (cls.patients[0], cls.accounts[1], 'Other clinic'),
+            (cls.patients[1], cls.accounts[0], 'Cleaning'),
+            (cls.patients[2], cls.accounts[1], 'Other clinic'),
+        ]:
+            PatientAccount.objects.create(patient=patient, account=account, consultation_reason=reason)
+
+        for account, amount in ((cls.accounts[0], Decimal('10.00')), (cls.accounts[1], Decimal('99.00'))):
+            Transaction.objects.create(
+                account=account, patient=cls.patients[0], amount=amount,
+                transaction_type='PAYMENT', payment_method='CASH', description='Payment'
+            )
+
+    def export(self, user, dataset, params=None):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get(
+            f'/api/clinic/exports/{dataset}/', params or {},
+            HTTP_X_ACCOUNT_CONTEXT=str(self.accounts[0].account_id)
+        )
+
+    def read_csv(self, data):
+        return list(csv.DictReader(io.StringIO(data)))
+
+    def test_patient_export_uses_the_account_membership(self):
+        data = b''.join(stream_export(
+            get_patient_export_queryset(self.accounts[0]), PATIENT_EXPORT_FIELDS, compress=False
+        )).decode()
+        rows = self.read_csv(data)
+        self.assertEqual([int(row['id']) for row in rows], [self.patients[0].pk, self.patients[1].pk])
+        self.assertEqual(
+            [row['clinic_membership__consultation_reason'] for row in rows], ['Checkup', 'Cleaning']
+        )
+
+    def test_view_requires_export_reports(self):
+        self.assertEqual(self.export(self.assistant, 'patients').status_code, 403)
+
+        AccountAuthorization.objects.create(
+            user=self.assistant, account=self.accounts[0], authorization_type='export_reports',
+            granted_by=self.owner
+        )
+        response = self.export(self.assistant, 'patients', {'gzip': '0'})
+        self.assertEqual(response.status_code, 200)
+        rows = self.read_csv(b''.join(response.streaming_content).decode())
+        self.assertEqual(len(rows), 2)
+
+        # export_reports alone does not open datasets the user cannot list
+        self.assertEqual(self.export(self.assistant, 'transactions').status_code, 403)
+
+    def test_view_streams_gzip(self):
+        response = self.export(self.owner, 'transactions', {'type': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.ndjson.gz"'))
+
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['amount'] for line in lines], ['10.00'])
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'patients.csv.gz')
+            call_command(
+                'export_data', 'patients', '--account', str(self.accounts[1].account_id),
+                '--gzip', '--chunk-size', '1', '--output', path, stdout=io.StringIO()
+            )
+            with gzip.open(path, 'rt', newline='') as export:
+                rows = self.read_csv(export.read())
+        self.assertEqual([int(row['id']) for row in rows], [self.patients[0].pk, self.patients[2].pk])
+        self.assertEqual({row['clinic_membership__consultation_reason'] for row in rows}, {'Other clinic'})
+
+
+class PerformanceMetricsTests(TestCase):
+    """PerformanceMiddleware splits view and render time and the report aggregates them."""
+
+    def setUp(self):
+        performance.buffer.clear()
+        self.addCleanup(performance.buffer.clear)
+        self.user = User.objects.create_user(
+            email='owner@example.com', id_number='100000001', id_type='01', password='x'
+        )
+
+    def test_render_time_is_recorded_and_reported(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                PERFORMANCE_MONITORING=True, PERFORMANCE_SNAPSHOT_DIR=directory, PERFORMANCE_SNAPSHOT_INTERVAL=0
+            ):
+                client.get('/api/clinic/patients/patients/')
+                client.get('/api/clinic/patients/patients/')
+
+                records = performance.buffer.snapshot()
+                self.assertEqual(len(records), 2)
+                self.assertEqual(set(records[0]), set(performance.METRIC_FIELDS))
+                for record in records:
+                    # Each value is rounded to 0.01 ms
+                    self.assertLessEqual(record['view_ms'] + record['render_ms'], record['total_ms'] + 0.02)
+
+                output = io.StringIO()
+                call_command('performance_report', '--summary', stdout=output)
+        summary, = json.loads(output.getvalue())
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(
+            summary['avg_render_ms'], round(sum(record['render_ms'] for record in records) / 2, 2)
+        )
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class AccountContextTests(TestCase):
+    """X-Account-Context resolves to an account the user may use, once per request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(
+            email='member@example.com', id_number='100000001', id_type='01', password='x'
+        )
+        cls.outsider = User.objects.create_user(
+            email='outsider@example.com', id_number='100000002', id_type='01', password='x'
+        )
+        cls.staff = User.objects.create_user(
+            email='staff@example.com', id_number='100000003', id_type='01', password='x', is_staff=True
+        )
+        cls.account = Account.objects.create(
+            account_name='Clinic', account_email='clinic@example.com',
+            account_phone='22220000', account_address='Address'
+        )
+        AccountUser.objects.create(user=cls.member, account=cls.account, role=AccountRoles.ASSISTANT)
+
+    def request(self, user, header=None):
+        headers = {'HTTP_X_ACCOUNT_CONTEXT': header} if header is not None else {}
+        request = RequestFactory().get('/', **headers)
+        request.user = user
+        return request
+
+    def test_resolver(self):
+        header = str(self.account.account_id)
+        self.assertEqual(resolve_account_context(self.request(self.member, header)), self.account)
+        self.assertEqual(resolve_account_context(self.request(self.staff, header)), self.account)
+        self.assertIsNone(resolve_account_context(self.request(self.outsider, header)))
+        self.assertIsNone(resolve_account_context(self.request(AnonymousUser(), header)))
+        for header in (None, '', 'not-a-uuid', '00000000-0000-0000-0000-000000000000'):
+            with self.subTest(header=header):
+                self.assertIsNone(resolve_account_context(self.request(self.member, header)))
+
+    def test_resolved_once_per_request(self):
+        request = self.request(self.member, str(self.account.account_id))
+        account = resolve_account_context(request)
+        self.assertEqual(request.account, account)
+        self.assertEqual(request.account_permissions.role, AccountRoles.ASSISTANT)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_account_context(request), account)
+
+    def test_middleware_resolves_after_authentication(self):
+        def view(request):
+            # Authentication (e.g. JWT in DRF) runs after the middleware
+            request.user = self.member
+            return HttpResponse(request.account.account_name)
+
+        request = self.request(AnonymousUser(), str(self.account.account_id))
+        self.assertEqual(AccountContextMiddleware(view)(request).content, b'Clinic')
+
+    def test_dashboard_uses_the_resolved_account(self):
+        client = APIClient()
+        for user, expected in ((self.member, str(self.account.account_id)), (self.outsider, None)):
+            with self.subTest(user=user.email):
+                client.force_authenticate(user=user)
+                data = client.get(
+                    '/api/clinic/dashboard/stats/', HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+                ).json()
+                self.assertEqual(data.get('selectedAccountId'), expected)
+                if expected is None:
+                    self.assertEqual(data['error'], 'Access denied to this account')
+
+
+@override_settings(TRACING_SAMPLE_RATE=0.0)
+class TracingTests(TestCase):
+    """Traces are sampled per module and their fields only evaluated when emitted."""
+
+    def setUp(self):
+        reset_sample_rates()
+        self.addCleanup(reset_sample_rates)
+        self.tracer = get_tracer('core.tests')
+
+    def test_disabled_tracing_evaluates_nothing(self):
+        expensive = mock.Mock(return_value=1)
+        with self.assertNoLogs('trace.core.tests', level='DEBUG'):
+            self.tracer.trace('event', count=expensive)
+        expensive.assert_not_called()
+
+    def test_module_sample_rates(self):
+        set_sample_rate(1, 'core.tests')
+        with self.assertLogs('trace.core.tests', level='DEBUG') as logs:
+            self.tracer.trace('event', count=lambda: 3, failing=lambda: 1 / 0)
+        self.assertEqual(logs.records[0].trace_fields, {'count': 3, 'failing': '<error: division by zero>'})
+
+        with self.assertNoLogs('trace.core.other', level='DEBUG'):
+            get_tracer('core.other').trace('event')
+
+    def test_partial_sampling(self):
+        set_sample_rate(0.25)
+        with self.assertLogs('trace.core.tests', level='DEBUG') as logs:
+            for sample in (0.1, 0.5, 0.2, 0.9):
+                with mock.patch('random.random', return_value=sample):
+                    self.tracer.trace('event', sample=sample)
+        self.assertEqual([record.trace_fields['sample'] for record in logs.records], [0.1, 0.2])
+
+    def test_diagnostics_endpoint(self):
+        user = User.objects.create_user(
+            email='user@example.com', id_number='100000001', id_type='01', password='x'
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = '/api/platform/diagnostics/tracing/'
+        self.assertEqual(client.get(url).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        self.assertEqual(client.get(url).json(), {'sample_rates': {'*': 0.0}})
+        self.assertEqual(client.post(url, {'sample_rate': 2}, format='json').status_code, 400)
+
+        response = client.post(url, {'sample_rate': 0.5, 'module': 'core.tests'}, format='json')
+        self.assertEqual(response.json(), {'sample_rates': {'*': 0.0, 'core.tests': 0.5}})
+        self.assertEqual(cache.get(SAMPLE_RATES_KEY), {'core.tests': 0.5})
+
+        self.assertEqual(client.delete(url).json(), {'sample_rates': {'*': 0.0}})
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=0, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class BenchmarkCommandTests(TestCase):
+    """The generated dataset is usable by run_benchmarks for every role."""
+
+    def setUp(self):
+        call_command(
+            'generate_benchmark_data', '--accounts', '1', '--patients', '5', '--treatments', '1',
+            '--doctors', '1', '--branches', '1', stdout=io.StringIO()
+        )
+
+    def run_benchmarks(self, role):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'run_benchmarks', '--as', role, '--iterations', '1', '--warmup', '0',
+                '--endpoint', 'patients.list', '--output', path, stdout=io.StringIO()
+            )
+            with open(path) as report:
+                return json.load(report)
+
+    def test_dataset(self):
+        self.assertEqual(PatientAccount.objects.filter(account__account_name='Benchmark Clinic 1').count(), 5)
+        for role, permissions in DEFAULT_ROLE_PERMISSIONS.items():
+            with self.subTest(role=role):
+                self.assertEqual(
+                    set(RolePermission.objects.filter(role=role, is_active=True).values_list('permission_type', flat=True)),
+                    set(permissions)
+                )
+
+        with self.assertRaises(CommandError):
+            call_command('generate_benchmark_data', '--accounts', '1', '--patients', '1', stdout=io.StringIO())
+
+    def test_roles_get_their_normal_access(self):
+        for role in ('owner', 'doctor', 'assistant'):
+            with self.subTest(role=role):
+                result, = self.run_benchmarks(role)['results']
+                self.assertEqual((result['endpoint'], result['status']), ('patients.list', 200))
+
+    def test_role_without_permissions_is_refused(self):
+        RolePermission.objects.filter(role=AccountRoles.DOCTOR).delete()
+        with self.assertRaisesMessage(CommandError, 'has no permissions'):
+            self.run_benchmarks('doctor')
@@ -0,0 +1,92 @@
+# core/tracing.py
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Cache key holding runtime sample rates: {'*': default, '<module>': rate}
+SAMPLE_RATES_KEY = 'tracing:sample_rates'
+
+# How often (seconds) each process re-reads the runtime sample rates
+SAMPLE_RATES_REFRESH = 5
+
+_sample_rates = {'value': None, 'loaded_at': 0.0}
+
+
+def get_sample_rates():
+    """
+    Get the active sample rates.
+    Runtime overrides stored in the cache win over TRACING_SAMPLE_RATE,
+    and are re-read at most every SAMPLE_RATES_REFRESH seconds.
+    """
+    now = time.monotonic()
+    if _sample_rates['value'] is None or now - _sample_rates['loaded_at'] > SAMPLE_RATES_REFRESH:
+        rates = {'*': getattr(settings, 'TRACING_SAMPLE_RATE', 0.0)}
+        try:
+            rates.update(cache.get(SAMPLE_RATES_KEY) or {})
+        except Exception:
+            pass
+        _sample_rates['value'] = rates
+        _sample_rates['loaded_at'] = now
+    return _sample_rates['value']
+
+
+def set_sample_rate(rate, module=None):
+    """Change the sample rate at runtime (globally or for one module)."""
+    rates = cache.get(SAMPLE_RATES_KEY) or {}
+    rates[module or '*'] = rate
+    cache.set(SAMPLE_RATES_KEY, rates, timeout=None)
+    _sample_rates['value'] = None
+
+
+def reset_sample_rates():
+    """Drop runtime overrides and go back to TRACING_SAMPLE_RATE."""
+    cache.delete(SAMPLE_RATES_KEY)
+    _sample_rates['value'] = None
+
+
+class Tracer:
+    """
+    Sampled debug tracing for a module.
+    Field values may be callables; they are only evaluated when the event
+    is actually emitted, so expensive diagnostics (e.g. queryset counts)
+    cost nothing while tracing is off.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.logger = logging.getLogger(f'trace.{module}')
+
+    def is_enabled(self):
+        rates = get_sample_rates()
+        rate = rates.get(self.module, rates.get('*', 0.0))
+        if rate <= 0:
+            return False
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        return rate >= 1 or random.random() < rate
+
+    def trace(self, event, **fields):
+        if not self.is_enabled():
+            return
+
+        values = {}
+        for name, value in fields.items():
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    value = f'<error: {e}>'
+            values[name] = value
+
+        self.logger.debug(
+            '%s %s', event, ' '.join(f'{name}={value!r}' for name, value in values.items()),
+            extra={'trace_event': event, 'trace_fields': values}
+        )
+
+
+def get_tracer(module):
+    """Get a tracer for a module (use __name__)."""
+    return Tracer(module)
@@ -6,6 +6,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from .api import schema_view
 from .dashboard import dashboard_stats, account_list
+from .diagnostics import tracing_settings, performance_metrics
+from .exports import ExportView
 from platform_users.serializers import CustomTokenObtainPairView
 
 
@@ -16,6 +18,13 @@ urlpatterns = [
     path('api/clinic/dashboard/stats/', dashboard_stats, name='dashboard-stats'),
     path('api/platform/accounts/list/', account_list, name='account-list'),
     
+    # Streaming data exports
+    path('api/clinic/exports/<str:dataset>/', ExportView.as_view(), name='data-export'),
+    
+    # Diagnostics APIs
+    path('api/platform/diagnostics/tracing/', tracing_settings, name='diagnostics-tracing'),
+    path('api/platform/diagnostics/performance/', performance_metrics, name='diagnostics-performance'),
+    
     # Authentication
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
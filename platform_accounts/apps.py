@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PlatformAccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'platform_accounts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
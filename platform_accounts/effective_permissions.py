@@ -0,0 +1,198 @@
+# platform_accounts/effective_permissions.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Subquery, Value
+from django.utils import timezone
+
+# Cache keys for the shared permission cache
+ROLES_VERSION_KEY = 'permissions:version:roles'
+ACCOUNT_VERSION_KEY = 'permissions:version:account:{account_id}'
+PERMISSIONS_KEY = 'permissions:{account_id}:{user_id}:{roles_version}.{account_version}'
+
+
+class EffectivePermissions:
+    """
+    Resolved permission set of a user within an account.
+    Combines ownership, role defaults and individual grants so that
+    repeated permission checks can be answered without hitting the database.
+    """
+
+    def __init__(self, is_owner=False, role=None, role_permissions=None, grants=None):
+        self.is_owner = is_owner
+        self.role = role
+        self.role_permissions = frozenset(role_permissions or ())
+        # Maps authorization_type -> expires_at (None means permanent)
+        self.grants = dict(grants or {})
+
+    @property
+    def is_member(self):
+        """True if the user has an active operational role in the account."""
+        return self.role is not None
+
+    def has(self, permission_type):
+        """Same semantics as AccountUser.user_has_permission."""
+        if self.is_owner:
+            return True
+
+        if not self.is_member:
+            return False
+
+        if permission_type in self.grants:
+            expires_at = self.grants[permission_type]
+            if expires_at is None or expires_at > timezone.now():
+                return True
+
+        return permission_type in self.role_permissions
+
+    def next_expiry(self):
+        """Earliest expiration among the individual grants, or None."""
+        expirations = [expires_at for expires_at in self.grants.values() if expires_at is not None]
+        return min(expirations) if expirations else None
+
+    def __repr__(self):
+        return f"<EffectivePermissions owner={self.is_owner} role={self.role}>"
+
+
+def resolve_effective_permissions(user, account):
+    """
+    Load the effective permissions of a user in an account.
+    Uses one query for ownership + role and, for non-owner members,
+    one more query for role defaults and individual grants.
+    """
+    from .models import Account, AccountOwner, AccountUser, AccountAuthorization, RolePermission
+
+    account_id = getattr(account, 'pk', account)
+
+    membership = Account.objects.filter(pk=account_id).annotate(
+        is_owner=Exists(AccountOwner.objects.filter(
+            user=user,
+            account=OuterRef('pk'),
+            is_active=True
+        )),
+        member_role=Subquery(AccountUser.objects.filter(
+            user=user,
+            account=OuterRef('pk'),
+            is_active_in_account=True
+        ).values('role')[:1])
+    ).values_list('is_owner', 'member_role').first()
+
+    if membership is None:
+        return EffectivePermissions()
+
+    is_owner, role = membership
+    if is_owner or role is None:
+        return EffectivePermissions(is_owner=is_owner, role=role)
+
+    # Role defaults and non-expired individual grants in a single round trip
+    grants_qs = AccountAuthorization.objects.filter(
+        user=user,
+        account_id=account_id,
+        is_active=True
+    ).filter(
+        models.Q(expires_at__isnull=True) |
+        models.Q(expires_at__gt=timezone.now())
+    ).annotate(
+        source=Value('grant')
+    ).order_by().values_list('authorization_type', 'expires_at', 'source')
+
+    role_qs = RolePermission.objects.filter(
+        role=role,
+        is_active=True
+    ).annotate(
+        expires_at=Value(None, output_field=models.DateTimeField()),
+        source=Value('role')
+    ).order_by().values_list('permission_type', 'expires_at', 'source')
+
+    role_permissions = set()
+    grants = {}
+    for permission_type, expires_at, source in grants_qs.union(role_qs, all=True):
+        if source == 'role':
+            role_permissions.add(permission_type)
+        else:
+            grants[permission_type] = expires_at
+
+    return EffectivePermissions(
+        is_owner=False,
+        role=role,
+        role_permissions=role_permissions,
+        grants=grants
+    )
+
+
+def get_versions(account_id):
+    """
+    Get the current (roles, account) version counters.
+    Missing counters are seeded with a time-based value so that an evicted
+    counter never falls back to a version used by a stale entry.
+    """
+    account_key = ACCOUNT_VERSION_KEY.format(account_id=account_id)
+    versions = cache.get_many([ROLES_VERSION_KEY, account_key])
+
+    for key in (ROLES_VERSION_KEY, account_key):
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+
+    return versions[ROLES_VERSION_KEY], versions[account_key]
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter was never set or got evicted
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_permissions_version(account_id=None):
+    """
+    Invalidate cached permission sets.
+    With an account, only that account's entries are invalidated; without one,
+    every account is (used for role default changes).
+    The bump runs after the surrounding transaction commits so that readers
+    never cache pre-commit data under the new version.
+    """
+    if account_id is None:
+        key = ROLES_VERSION_KEY
+    else:
+        key = ACCOUNT_VERSION_KEY.format(account_id=account_id)
+
+    transaction.on_commit(lambda: _bump_version(key))
+
+
+def get_effective_permissions(user, account):
+    """
+    Get the effective permissions of a user in an account through the
+    shared cache. Entries are keyed by the roles and account version counters
+    and never outlive the earliest individual grant expiration.
+    """
+    account_id = getattr(account, 'pk', account)
+    timeout = getattr(settings, 'PERMISSIONS_CACHE_TIMEOUT', 300)
+
+    if not timeout:
+        return resolve_effective_permissions(user, account)
+
+    roles_version, account_version = get_versions(account_id)
+    key = PERMISSIONS_KEY.format(
+        account_id=account_id,
+        user_id=user.pk,
+        roles_version=roles_version,
+        account_version=account_version
+    )
+
+    permissions = cache.get(key)
+    if permissions is not None:
+        return permissions
+
+    permissions = resolve_effective_permissions(user, account)
+
+    next_expiry = permissions.next_expiry()
+    if next_expiry is not None:
+        seconds_left = int((next_expiry - timezone.now()).total_seconds()) + 1
+        timeout = max(1, min(timeout, seconds_left))
+
+    cache.set(key, permissions, timeout=timeout)
+    return permissions
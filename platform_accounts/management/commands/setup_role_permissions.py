@@ -1,31 +1,39 @@
 # platform_accounts/management/commands/setup_role_permissions.py
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from platform_accounts.models import RolePermission
-from platform_accounts.permissions import get_default_role_permissions
+from platform_accounts.permissions import DEFAULT_ROLE_PERMISSIONS
+from platform_accounts.effective_permissions import bump_permissions_version
 
 class Command(BaseCommand):
     help = 'Set up default role permissions'
 
     def handle(self, *args, **options):
-        # Clear existing role permissions
-        RolePermission.objects.all().delete()
-        
-        # Get role permissions from centralized registry
-        role_permissions = get_default_role_permissions()
-        
-        # Create role permissions
-        created_count = 0
-        for role, permissions in role_permissions.items():
-            for permission in permissions:
-                RolePermission.objects.create(
-                    role=role,
-                    permission_type=permission,
-                    is_active=True
-                )
-                created_count += 1
-                self.stdout.write(f"Created {role} -> {permission}")
+        with transaction.atomic():
+            # Clear existing role permissions
+            RolePermission.objects.all().delete()
+            
+            # Get role permissions from centralized registry
+            role_permissions = DEFAULT_ROLE_PERMISSIONS
+            
+            # Create role permissions
+            to_create = []
+            for role, permissions in role_permissions.items():
+                for permission in permissions:
+                    to_create.append(RolePermission(
+                        role=role,
+                        permission_type=permission,
+                        is_active=True
+                    ))
+                    self.stdout.write(f"Created {role} -> {permission}")
+            
+            RolePermission.objects.bulk_create(to_create)
+            created_count = len(to_create)
+            
+            # bulk_create skips post_save, so invalidate cached permissions explicitly
+            bump_permissions_version()
         
         self.stdout.write(
             self.style.SUCCESS(f'Successfully set up {created_count} role permissions')
-        )
\ No newline at end of file
+        )
@@ -173,45 +173,9 @@ class AccountUser(models.Model):
         2. Role-based default permissions  
         3. Individual permission overrides
         """
-        # Check if user is an owner (owners have all permissions)
-        if AccountOwner.objects.filter(
-            user=user, 
-            account=account, 
-            is_active=True
-        ).exists():
-            return True
+        from .effective_permissions import get_effective_permissions
         
-        # Check if user is even a member of this account
-        try:
-            account_user = cls.objects.get(
-                user=user,
-                account=account,
-                is_active_in_account=True
-            )
-        except cls.DoesNotExist:
-            return False
-        
-        # Check individual permissions first (these override role defaults)
-        from django.utils import timezone
-        from django.db import models as django_models
-        
-        if AccountAuthorization.objects.filter(
-            user=user,
-            account=account,
-            authorization_type=permission_type,
-            is_active=True
-        ).filter(
-            django_models.Q(expires_at__isnull=True) | 
-            django_models.Q(expires_at__gt=timezone.now())
-        ).exists():
-            return True
-        
-        # Check role-based default permissions
-        return RolePermission.objects.filter(
-            role=account_user.role,
-            permission_type=permission_type,
-            is_active=True
-        ).exists()
+        return get_effective_permissions(user, account).has(permission_type)
     
     # Instance method for convenience
     def has_permission(self, permission_type):
@@ -0,0 +1,20 @@
+# platform_accounts/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Account, AccountOwner, AccountUser, AccountAuthorization, RolePermission
+from .effective_permissions import bump_permissions_version
+
+
+@receiver([post_save, post_delete], sender=Account)
+@receiver([post_save, post_delete], sender=AccountOwner)
+@receiver([post_save, post_delete], sender=AccountUser)
+@receiver([post_save, post_delete], sender=AccountAuthorization)
+def invalidate_account_permissions(sender, instance, **kwargs):
+    """Account, ownership, membership and grant changes only affect their account."""
+    bump_permissions_version(instance.account_id)
+
+
+@receiver([post_save, post_delete], sender=RolePermission)
+def invalidate_role_permissions(sender, instance, **kwargs):
+    """Role defaults apply to every account."""
+    bump_permissions_version()
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from auditlog.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from platform_users.models import User
+from clinic_patients.models import Patient, PatientAccount
+from .effective_permissions import get_effective_permissions
+from .models import Account, AccountOwner, AccountUser, AccountAuthorization, RolePermission
+from .roles import AccountRoles
+
+
+@override_settings(PERMISSIONS_CACHE_TIMEOUT=300, ACCOUNT_CONTEXT_CACHE_TIMEOUT=0)
+class EffectivePermissionsCacheTests(TestCase):
+    """Cached permission sets never outlive a revocation or a grant's expiry."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = User.objects.create_user(
+            email='owner@example.com', id_number='100000001', id_type='01', password='x'
+        )
+        self.member = User.objects.create_user(
+            email='assistant@example.com', id_number='100000002', id_type='01', password='x'
+        )
+        self.account = Account.objects.create(
+            account_name='Clinic', account_email='clinic@example.com',
+            account_phone='22220000', account_address='Address'
+        )
+        AccountOwner.objects.create(user=self.owner, account=self.account)
+        self.membership = AccountUser.objects.create(
+            user=self.member, account=self.account, role=AccountRoles.ASSISTANT
+        )
+        self.role_permission = RolePermission.objects.create(
+            role=AccountRoles.ASSISTANT, permission_type='manage_patients_basic'
+        )
+
+    def has(self, permission_type='manage_patients_basic'):
+        return get_effective_permissions(self.member, self.account).has(permission_type)
+
+    def change(self, update):
+        # Cache versions are bumped once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            update()
+
+    def test_membership_revocation(self):
+        self.assertTrue(self.has())
+
+        self.membership.is_active_in_account = False
+        self.change(self.membership.save)
+        self.assertFalse(self.has())
+
+        self.membership.is_active_in_account = True
+        self.change(self.membership.save)
+        self.assertTrue(self.has())
+
+        self.change(self.membership.delete)
+        self.assertFalse(self.has())
+
+    def test_role_permission_revocation(self):
+        self.assertTrue(self.has())
+
+        self.role_permission.is_active = False
+        self.change(self.role_permission.save)
+        self.assertFalse(self.has())
+
+        self.role_permission.is_active = True
+        self.change(self.role_permission.save)
+        self.assertTrue(self.has())
+
+        self.change(self.role_permission.delete)
+        self.assertFalse(self.has())
+
+    def test_grants_stop_at_expiry(self):
+        now = timezone.now()
+        self.change(lambda: AccountAuthorization.objects.create(
+            user=self.member, account=self.account, authorization_type='view_billing',
+            granted_by=self.owner, expires_at=now + datetime.timedelta(hours=1)
+        ))
+        self.assertTrue(self.has('view_billing'))
+
+        # The cached set still holds the grant but checks its expiry
+        with mock.patch('django.utils.timezone.now', return_value=now + datetime.timedelta(hours=2)):
+            self.assertFalse(self.has('view_billing'))
+
+    def test_cache_entries_do_not_outlive_grants(self):
+        expires_at = timezone.now() + datetime.timedelta(seconds=30)
+        self.change(lambda: AccountAuthorization.objects.create(
+            user=self.member, account=self.account, authorization_type='view_billing',
+            granted_by=self.owner, expires_at=expires_at
+        ))
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.has('view_billing')
+        self.assertLessEqual(cache_set.call_args.kwargs['timeout'], 31)
+
+    def test_next_request_sees_revocation(self):
+        patient = Patient.objects.create(
+            id_number='200000001', first_name='Ana', last_name1='Mora', birth_date='1990-01-01',
+            gender='F', marital_status='S', province='San José', canton='Central', district='Carmen',
+            address='Address'
+        )
+        PatientAccount.objects.create(patient=patient, account=self.account)
+        RolePermission.objects.create(role=AccountRoles.ASSISTANT, permission_type='view_patients_list')
+        client = APIClient()
+        client.force_authenticate(user=self.member)
+
+        def add_phone():
+            return client.post(
+                f'/api/clinic/patients/patients/{patient.pk}/add_phone/', {'phone_number': '88880000'},
+                format='json', HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id)
+            ).status_code
+
+        self.assertEqual(add_phone(), 201)
+        self.role_permission.is_active = False
+        self.change(self.role_permission.save)
+        self.assertEqual(add_phone(), 403)
+
+        self.role_permission.is_active = True
+        self.change(self.role_permission.save)
+        self.assertEqual(add_phone(), 201)
+        self.change(self.membership.delete)
+        self.assertEqual(add_phone(), 403)
+
+    def test_permission_updates_are_audited(self):
+        AccountUser.objects.create(user=self.owner, account=self.account, role=AccountRoles.ADMINISTRATOR)
+        client = APIClient()
+        client.force_authenticate(user=self.owner)
+        self.assertFalse(self.has('view_rooms_list'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/accounts/permissions/update/', {
+                'user_id': self.member.pk, 'account_id': str(self.account.account_id),
+                'permissions': ['view_rooms_list', 'view_locations_list']
+            }, format='json', HTTP_X_ACCOUNT_CONTEXT=str(self.account.account_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.has('view_rooms_list'))
+
+        grants = AccountAuthorization.objects.filter(user=self.member, account=self.account)
+        logged = LogEntry.objects.filter(
+            content_type=ContentType.objects.get_for_model(AccountAuthorization),
+            action=LogEntry.Action.CREATE
+        ).values_list('object_pk', flat=True)
+        self.assertEqual(set(logged), {str(pk) for pk in grants.values_list('pk', flat=True)})
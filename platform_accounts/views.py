@@ -9,6 +9,7 @@ from .serializers import (AccountSerializer, AccountOwnerSerializer, AccountUser
                           AccountInvitationSerializer, CreateInvitationSerializer, 
                           AcceptInvitationSerializer, AccountAuthorizationSerializer,
                           UserPermissionsSerializer)
+from .effective_permissions import bump_permissions_version
 import logging
 
 logger = logging.getLogger(__name__)
@@ -278,17 +279,9 @@ class AccountInvitationViewSet(AccountPermissionMixin, viewsets.ModelViewSet):
             raise permissions.PermissionDenied("You don't have permission to invite users to this account.")
         
         # Check if user is owner or has manage_invitations authorization (legacy check)
-        is_owner = AccountOwner.objects.filter(
-            user=self.request.user, 
-            account=account, 
-            is_active=True
-        ).exists()
+        is_owner = self.is_account_owner(account)
         
-        has_permission = AccountUser.user_has_permission(
-            self.request.user, 
-            account, 
-            'manage_invitations'
-        )
+        has_permission = self.get_effective_permissions(account).has('manage_invitations')
         
         if not (is_owner or has_permission):
             raise permissions.PermissionDenied("You don't have permission to invite users to this account.")
@@ -494,11 +487,7 @@ class AccountPermissionViewSet(AccountPermissionMixin, viewsets.GenericViewSet):
             return True
             
         # Check if user is owner
-        if AccountOwner.objects.filter(
-            user=self.request.user,
-            account=account,
-            is_active=True
-        ).exists():
+        if self.is_account_owner(account):
             return True
         
         # Use the permission method to check manage_permissions
@@ -695,7 +684,7 @@ class AccountPermissionViewSet(AccountPermissionMixin, viewsets.GenericViewSet):
                 account=account
             ).delete()
             
-            # Add new permissions
+            # Add new permissions one row at a time so auditlog records each grant
             for permission_type in permissions:
                 AccountAuthorization.objects.create(
                     user=user,
@@ -705,6 +694,9 @@ class AccountPermissionViewSet(AccountPermissionMixin, viewsets.GenericViewSet):
                     is_active=True,
                     notes=notes
                 )
+            
+            # Invalidate cached permissions even when no grant row changed
+            bump_permissions_version(account.account_id)
         
         return Response({
             'message': f'Successfully updated permissions for {user.get_full_name()}',